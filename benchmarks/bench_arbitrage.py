@@ -0,0 +1,45 @@
+"""全市场套利雷达压测：报告不同快照规模 (庄家数 × 场次数) 下的扫描耗时
+
+用法: python benchmarks/bench_arbitrage.py
+"""
+import sys, os, time
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from src.shadow_bookmaker.domain.calculator import ArbitrageScanner
+from src.shadow_bookmaker.domain.models import MarketSnapshot, OddsDTO
+
+def synthetic_snapshot(n_books: int, n_matches: int, seed: int = 7) -> MarketSnapshot:
+    rng = np.random.default_rng(seed)
+    # 每场先生成公平概率，各家庄再叠加 2%~8% 的抽水与随机噪声
+    fair = rng.dirichlet([4.0, 3.0, 2.5], size=n_matches)
+    margin = rng.uniform(1.02, 1.08, size=(n_books, n_matches, 1))
+    noise = rng.normal(1.0, 0.02, size=(n_books, n_matches, 3))
+    odds = np.maximum(1.01, 1.0 / (fair[None] * margin * noise))
+    books = {}
+    for j in range(n_matches):
+        m_id = f"Home {j} vs Away {j}"
+        books[m_id] = {f"Book{b}": OddsDTO.model_construct(bookmaker=f"Book{b}", match_id=m_id, home_team=f"Home {j}", away_team=f"Away {j}",
+                                                           home_odds=float(odds[b, j, 0]), away_odds=float(odds[b, j, 1]), draw_odds=float(odds[b, j, 2]))
+                       for b in range(n_books)}
+    return MarketSnapshot.model_construct(books=books, sharp_bookmaker="Book0", fetched_at=time.time(), failed_sources=[])
+
+def best_of(fn, repeat: int = 5) -> float:
+    times = []
+    for _ in range(repeat):
+        t = time.perf_counter(); fn(); times.append(time.perf_counter() - t)
+    return min(times)
+
+def main():
+    print(f"{'books':>6} {'matches':>8} {'build_ms':>10} {'scan_ms':>9} {'arbs':>6}")
+    for n_books in (10, 40):
+        for n_matches in (1000, 5000):
+            snap = synthetic_snapshot(n_books, n_matches)
+            cube, match_ids, bookmakers = ArbitrageScanner.build_cube(snap)
+            t_build = best_of(lambda: ArbitrageScanner.build_cube(snap), repeat=3)
+            t_scan = best_of(lambda: ArbitrageScanner.scan_cube(cube, match_ids, bookmakers))
+            n_arbs = len(ArbitrageScanner.scan_cube(cube, match_ids, bookmakers))
+            print(f"{n_books:>6} {n_matches:>8} {t_build*1e3:>10.1f} {t_scan*1e3:>9.2f} {n_arbs:>6}")
+
+if __name__ == "__main__":
+    main()
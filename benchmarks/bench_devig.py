@@ -0,0 +1,40 @@
+"""去水定价表压测：三种去水方法的建表耗时，以及查表裁决 vs 每批临时去水的裁决耗时
+
+用法: python benchmarks/bench_devig.py [场次数] [单子数]
+"""
+import sys, os, time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from fixtures import make_market, make_tickets
+from src.shadow_bookmaker.domain.devig import DEVIG_METHODS, PriceTable
+from src.shadow_bookmaker.domain.ledger import GlobalLedger
+from src.shadow_bookmaker.domain.risk_engine import RiskEngine
+
+def best_of(fn, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t)
+    return best
+
+def main():
+    n_matches = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    n_tickets = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    market = make_market(n_matches)
+    tickets = make_tickets(market, n_tickets)
+    engine = RiskEngine(GlobalLedger.from_rows({}))
+
+    print(f"{n_matches:,} 场 / {n_tickets:,} 张单 (单关 70%)")
+    for method in DEVIG_METHODS:
+        build = best_of(lambda: PriceTable(market, method))
+        table = PriceTable(market, method)
+        batch = best_of(lambda: engine.evaluate_batch(tickets, table))
+        scalar = best_of(lambda: [engine.evaluate(t, table) for t in tickets[:500]], repeat=3) / 500
+        print(f"{method:>12}: 建表 {build * 1000:7.2f} ms | 查表批量裁决 {batch * 1000:7.2f} ms | 查表逐张裁决 {scalar * 1e6:6.1f} µs/张")
+    engine.devig_method = "shin"
+    adhoc = best_of(lambda: engine.evaluate_batch(tickets, market))
+    print(f"对照 (传普通字典，每批临时 Shin 去水): 批量裁决 {adhoc * 1000:7.2f} ms")
+
+if __name__ == "__main__":
+    main()
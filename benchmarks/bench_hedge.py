@@ -0,0 +1,89 @@
+"""全书对冲优化压测：几千场的最低成本对冲一次求解的耗时，并对照逐场标量求解校验最优性与红线
+
+用法: python benchmarks/bench_hedge.py [场次数] [单场红线]
+对照是逐场二分：可行的总注码 S 满足 Σ max(0, (S + b_j)/o_j) <= S，左边减右边是凸的分段线性函数，
+先三分找谷底再二分找最小可行 S；与向量化解出的注码逐分量比对。
+"""
+import sys, os, time
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from src.shadow_bookmaker.domain.hedge_optimizer import HedgeOptimizer, hedged_pnl, solve_hedges
+from src.shadow_bookmaker.domain.ledger import GlobalLedger
+from src.shadow_bookmaker.domain.models import OddsDTO
+
+def make_book(n_matches: int, seed: int = 7):
+    rng = np.random.default_rng(seed)
+    probs = rng.dirichlet((4.0, 3.0, 2.5), size=n_matches)
+    sharp = 1.0 / (probs * rng.uniform(1.02, 1.05, size=(n_matches, 1)))
+    two_way = rng.random(n_matches) < 0.1  # 一成场次是两项盘 (没有平局)
+    sharp[two_way, 2] = 0.0
+    sharp[two_way, :2] = 1.0 / (probs[two_way, :2] / probs[two_way, :2].sum(axis=1, keepdims=True) * 1.03)
+    # 客户按比外盘略差的赔率下注，注额扎堆在热门赛果上：大多数场次稳赚，少数场次某个赛果深度击穿
+    stakes = rng.gamma(0.6, 8000.0, size=(n_matches, 3)) * (rng.random((n_matches, 3)) < 0.6)
+    stakes[two_way, 2] = 0.0
+    pnl = stakes.sum(axis=1, keepdims=True) - stakes * np.where(sharp > 0, sharp * 0.95, 0.0)
+    match_ids = [f"Home {j} vs Away {j}" for j in range(n_matches)]
+    market = {m_id: OddsDTO(bookmaker="Pinnacle", match_id=m_id, home_team=f"Home {j}", away_team=f"Away {j}",
+                            home_odds=float(sharp[j, 0]), away_odds=float(sharp[j, 1]), draw_odds=float(sharp[j, 2]) or None)
+              for j, m_id in enumerate(match_ids) if rng.random() > 0.02}  # 2% 场次缺报价
+    return GlobalLedger.from_rows(dict(zip(match_ids, pnl))), market
+
+def reference(pnl: np.ndarray, odds: np.ndarray, limit: float):
+    """逐场标量求解，None 表示压不回红线"""
+    valid = odds > 1.0
+    b = -limit - pnl[valid]
+    o = odds[valid]
+    if len(o) == 0 or (b <= 0).all(): return np.zeros(3) if (b <= 0).all() else None
+    f = lambda s: np.maximum((s + b) / o, 0.0).sum() - s
+    lo, hi = 0.0, float(np.abs(b).max() * o.max() * 10 + 1.0)
+    for _ in range(200):  # 三分找谷底
+        m1, m2 = lo + (hi - lo) / 3, hi - (hi - lo) / 3
+        if f(m1) <= f(m2): hi = m2
+        else: lo = m1
+    valley = (lo + hi) / 2
+    if f(valley) > 1e-6 * (1 + limit): return None
+    lo, hi = 0.0, valley
+    for _ in range(200):  # 二分找最小可行 S
+        mid = (lo + hi) / 2
+        if f(mid) <= 0: hi = mid
+        else: lo = mid
+    h = np.zeros(3)
+    h[valid] = np.maximum((hi + b) / o, 0.0)
+    return h
+
+def best_of(fn, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t)
+    return best
+
+def main():
+    n_matches = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    limit = float(sys.argv[2]) if len(sys.argv) > 2 else 30000.0
+    ledger, market = make_book(n_matches)
+
+    build = best_of(lambda: HedgeOptimizer.from_ledger(ledger, market))
+    optimizer = HedgeOptimizer.from_ledger(ledger, market)
+    solve = best_of(lambda: solve_hedges(optimizer.pnl, optimizer.odds, limit))
+    plan = optimizer.run(limit)
+    print(f"{n_matches:,} 场，红线 ¥{limit:,.0f}：击穿 {plan.breached_matches} 场 -> {len(plan.instructions)} 条对冲指令，"
+          f"压不回 {len(plan.unhedgeable)} 场 | 总注码 ¥{plan.total_stake:,.0f}，期望成本 ¥{plan.expected_cost:,.0f}")
+    print(f"  拷账本建表 {build * 1000:7.2f} ms | 向量化求解 {solve * 1000:7.2f} ms | run() 含出指令 {plan.elapsed * 1000:7.2f} ms")
+
+    # 校验：逐场标量对照 + 对冲后每个可打出的赛果都不破红线
+    hedges, feasible = solve_hedges(optimizer.pnl, optimizer.odds, limit)
+    t = time.perf_counter()
+    mismatched = 0
+    for i in range(n_matches):
+        ref = reference(optimizer.pnl[i], optimizer.odds[i], limit)
+        if (ref is None) != (not feasible[i]) or (ref is not None and not np.allclose(ref, hedges[i], rtol=1e-6, atol=1e-4)): mismatched += 1
+    scalar = time.perf_counter() - t
+    after = np.where(optimizer.odds > 1.0, hedged_pnl(optimizer.pnl, optimizer.odds, hedges), np.inf).min(axis=1)
+    violated = int((after[feasible] < -limit - 1e-6 * limit).sum())
+    print(f"  逐场标量对照 {scalar:6.2f} s，与向量化解不一致 {mismatched} 场 | 对冲后仍破红线 {violated} 场")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""账本事件流水压测：冷启动 (快照 + 尾巴 vs 从头重放) 与历史回溯耗时
+
+用法: python benchmarks/bench_ledger_replay.py [事件数]
+"""
+import sys, os, time, sqlite3, tempfile
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from src.shadow_bookmaker.config import settings
+from src.shadow_bookmaker.domain.ledger import GlobalLedger, OUTCOMES
+from src.shadow_bookmaker.infrastructure.database import DatabaseManager
+
+def fill(db: DatabaseManager, n_events: int, n_matches: int = 2000, batch: int = 200, seed: int = 7) -> list:
+    """按批确权灌入 n_events 笔边际记账，返回每批落盘后的时间戳 (供回溯取点)"""
+    rng = np.random.default_rng(seed)
+    ledger = GlobalLedger(db)
+    stamps = []
+    for start in range(0, n_events, batch):
+        size = min(batch, n_events - start)
+        matches = rng.integers(n_matches, size=size)
+        sels = rng.integers(3, size=size)
+        stakes = rng.uniform(100.0, 5000.0, size=size)
+        odds = rng.uniform(1.5, 4.0, size=size)
+        bets = [(f"Home {m} vs Away {m}", OUTCOMES[s], float(k), float(k * (o - 1.0)), f"T{start + i}")
+                for i, (m, s, k, o) in enumerate(zip(matches, sels, stakes, odds))]
+        ledger.commit_bets(bets, [])
+        stamps.append(time.time())
+    db.flush()
+    return stamps
+
+def timed(fn, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t)
+    return best
+
+def main():
+    n_events = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "ledger.db")
+        db = DatabaseManager(path)
+        t = time.perf_counter()
+        stamps = fill(db, n_events)
+        print(f"灌入 {n_events:,} 笔事件 (每 {settings.LEDGER_SNAPSHOT_EVERY:,} 笔一份快照): {time.perf_counter() - t:.2f}s")
+        live = GlobalLedger(db).to_frame()
+
+        snap = timed(lambda: GlobalLedger(db))
+        print(f"冷启动 (最近快照 + 尾巴): {snap * 1000:>9.1f} ms")
+        for frac in (0.25, 0.5, 0.9):
+            as_of = stamps[int(len(stamps) * frac) - 1]
+            print(f"回溯到 {frac:>4.0%} 处:          {timed(lambda: db.ledger_as_of(as_of)) * 1000:>9.1f} ms")
+        db.close()
+
+        # 对照组：删掉全部快照 (并把 ledger_pnl 清空)，冷启动只能从第一笔事件重放到底
+        with sqlite3.connect(path) as conn:
+            conn.execute("DELETE FROM ledger_snapshots")
+            conn.execute("DELETE FROM ledger_pnl")
+        settings.LEDGER_SNAPSHOT_EVERY = n_events + 1  # 别让冷启动顺手补快照
+        db = DatabaseManager(path)
+        full = timed(lambda: GlobalLedger(db))
+        print(f"冷启动 (全量重放):       {full * 1000:>9.1f} ms  ({full / snap:.1f}x)")
+        rebuilt = GlobalLedger(db).to_frame()
+        print(f"全量重放与快照启动结果一致: {rebuilt.loc[live.index].equals(live)}")
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""打点开销压测：每次记录 (span / timed / record) 的额外耗时，以及关掉打点后的残余开销，附分位数精度校验
+
+用法: python benchmarks/bench_metrics.py [次数]
+"""
+import sys, os, time
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from src.shadow_bookmaker.infrastructure.metrics import Metrics, LatencyHistogram
+
+def per_call(fn, n: int) -> float:
+    """跑 n 次 fn，返回每次的纳秒数 (取 3 轮最好成绩)"""
+    best = float("inf")
+    for _ in range(3):
+        t = time.perf_counter_ns()
+        fn(n)
+        best = min(best, time.perf_counter_ns() - t)
+    return best / n
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    for enabled in (True, False):
+        m = Metrics(enabled)
+        def work(): pass
+        timed_work = m.timed("bench.timed")(work)
+        def bare(k):
+            for _ in range(k): work()
+        def decorated(k):
+            for _ in range(k): timed_work()
+        def spanned(k):
+            for _ in range(k):
+                with m.span("bench.span"): pass
+        def recorded(k):
+            for i in range(k): m.record("bench.record", i)
+        base = per_call(bare, n)
+        print(f"打点{'开启' if enabled else '关闭'}:  空函数 {base:6.0f} ns | timed +{per_call(decorated, n) - base:6.0f} ns"
+              f" | span {per_call(spanned, n):6.0f} ns | record {per_call(recorded, n):6.0f} ns")
+
+    # 精度：对数正态分布的耗时样本，直方图分位数 vs numpy 精确分位数
+    samples = np.random.default_rng(7).lognormal(mean=12.0, sigma=1.5, size=200_000).astype(np.int64)
+    hist = LatencyHistogram()
+    for v in samples.tolist(): hist.record(v)
+    for q in (0.5, 0.9, 0.99, 0.999):
+        exact = np.quantile(samples, q, method="inverted_cdf") / 1e9
+        print(f"p{q * 100:g}: 直方图 {hist.quantile(q) * 1e3:9.4f} ms  精确 {exact * 1e3:9.4f} ms  误差 {hist.quantile(q) / exact - 1:+.2%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""赔率历史库压测：每笔写入开销、封存段的磁盘占用，以及区间 / as-of 查询延迟
+
+用法: python benchmarks/bench_odds_history.py [报价变动笔数]
+"""
+import sys, os, time, tempfile
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from src.shadow_bookmaker.domain.models import OddsDTO
+from src.shadow_bookmaker.infrastructure.odds_history import OddsHistory
+
+def main():
+    n_ticks = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    n_matches, books = 2000, ("Pinnacle", "Bet365", "WilliamHill")
+    rng = np.random.default_rng(7)
+    quotes = [OddsDTO.model_construct(bookmaker=b, match_id=f"Home {m} vs Away {m}", home_team=f"Home {m}", away_team=f"Away {m}",
+                                      home_odds=2.10, away_odds=3.40, draw_odds=3.25) for m in range(n_matches) for b in books]
+    picks = rng.integers(len(quotes), size=n_ticks)
+    drift = rng.normal(0.0, 0.02, size=(n_ticks, 3))
+    start = time.time() - 3 * 86400  # 三天的行情 (不触发降采样)
+    stamps = start + np.cumsum(rng.exponential(3 * 86400 / n_ticks, size=n_ticks))
+    with tempfile.TemporaryDirectory() as tmp:
+        history = OddsHistory(tmp)
+        # 预先生成变价后的报价，只计 append 本身
+        ticks = []
+        for i, j in enumerate(picks):
+            q = quotes[j]
+            q = quotes[j] = OddsDTO.model_construct(bookmaker=q.bookmaker, match_id=q.match_id, home_team=q.home_team, away_team=q.away_team,
+                                                    home_odds=round(max(1.01, q.home_odds + drift[i, 0]), 3), away_odds=round(max(1.01, q.away_odds + drift[i, 1]), 3), draw_odds=round(max(1.01, q.draw_odds + drift[i, 2]), 3))
+            ticks.append(q)
+        t = time.perf_counter()
+        for q, ts in zip(ticks, stamps): history.append(q, float(ts))
+        history.flush()
+        elapsed = time.perf_counter() - t
+        print(f"写入 {n_ticks:,} 笔 (含封存): {elapsed:.2f}s，每笔 {elapsed / n_ticks * 1e6:.2f} µs")
+        t = time.perf_counter()
+        history.compact()
+        print(f"整理老段 (往日按天合并): {time.perf_counter() - t:.2f}s")
+        stats = history.stats()
+        print(f"磁盘: {stats['bytes'] / 1e6:.1f} MB / {stats['segments']} 段，每笔 {stats['bytes'] / n_ticks:.1f} 字节 (原始 float64 5 列为 40 字节)")
+
+        reopened = OddsHistory(tmp)
+        keys = [(quotes[j].match_id, quotes[j].bookmaker) for j in rng.integers(len(quotes), size=1000)]
+        when = rng.uniform(stamps[0], stamps[-1], size=1000)
+        t = time.perf_counter()
+        for (m, b), ts in zip(keys, when): reopened.as_of(m, b, float(ts))
+        print(f"as-of 查询 (mmap 冷段): {(time.perf_counter() - t) / len(keys) * 1e6:>8.1f} µs/次")
+        t = time.perf_counter()
+        for m, b in keys[:200]: reopened.range(m, b, float(stamps[0]), float(stamps[-1]))
+        print(f"整段区间查询:           {(time.perf_counter() - t) / 200 * 1e6:>8.1f} µs/次")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""The Odds API 响应解析压测：旧版逐场 OddsDTO 全量校验 vs 流式解析 + 整批校验 (列式批次 + 惰性视图)
+
+用法: python benchmarks/bench_odds_parsing.py
+"""
+import sys, os, time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from fixtures import synthetic_payload
+from src.shadow_bookmaker.domain.models import OddsDTO
+from src.shadow_bookmaker.infrastructure.bookmakers.odds_parser import OddsBatch, iter_h2h_quotes
+
+class IdentityMapper:
+    def standardize(self, raw_name: str) -> str: return raw_name
+
+def legacy_parse(data: list, mapper) -> list:
+    """旧版 TheOddsAPIBookmaker.fetch_odds 的解析循环 (基线)"""
+    results = []
+    for match in data:
+        home_raw = match.get("home_team", ""); away_raw = match.get("away_team", "")
+        if not home_raw or not away_raw: continue
+        home_team = mapper.standardize(home_raw); away_team = mapper.standardize(away_raw)
+        match_id = f"{home_team} vs {away_team}"
+        for bookie in match.get("bookmakers", []):
+            if bookie["key"] == "pinnacle":
+                for market in bookie.get("markets", []):
+                    if market["key"] == "h2h":
+                        h_odds = a_odds = d_odds = 0.0
+                        for outcome in market["outcomes"]:
+                            if outcome["name"] == home_raw: h_odds = outcome["price"]
+                            elif outcome["name"] == away_raw: a_odds = outcome["price"]
+                            elif outcome["name"].lower() == "draw": d_odds = outcome["price"]
+                        if h_odds > 1.0 and a_odds > 1.0:
+                            results.append(OddsDTO(bookmaker="Pinnacle", match_id=match_id, home_team=home_team, away_team=away_team,
+                                                   home_odds=h_odds, away_odds=a_odds, draw_odds=d_odds if d_odds > 1.0 else None))
+    return results
+
+def batch_parse(data: list, mapper) -> list:
+    return OddsBatch("Pinnacle", iter_h2h_quotes(data, mapper, "pinnacle")).views()
+
+def best_of(fn, repeat: int = 5) -> float:
+    times = []
+    for _ in range(repeat):
+        t = time.perf_counter(); fn(); times.append(time.perf_counter() - t)
+    return min(times)
+
+def main():
+    mapper = IdentityMapper()
+    print(f"{'matches':>8} {'legacy_ms':>10} {'batch_ms':>9} {'speedup':>8}")
+    for n in (1000, 10000, 50000):
+        data = synthetic_payload(n)
+        assert legacy_parse(data, mapper) == [v.to_dto() for v in batch_parse(data, mapper)]
+        t_legacy = best_of(lambda: legacy_parse(data, mapper))
+        t_batch = best_of(lambda: batch_parse(data, mapper))
+        print(f"{n:>8} {t_legacy*1e3:>10.1f} {t_batch*1e3:>9.1f} {t_legacy/t_batch:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
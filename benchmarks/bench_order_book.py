@@ -0,0 +1,57 @@
+"""订单簿查询压测：百万级订单下的深翻页 (keyset vs OFFSET) 与汇总查询 (汇总表 vs 全表 GROUP BY vs pandas)
+
+用法: python benchmarks/bench_order_book.py [订单数]
+"""
+import sys, os, time, tempfile
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from src.shadow_bookmaker.infrastructure.database import DatabaseManager
+
+ACTIONS = ("ACCEPT_B_BOOK", "ACCEPT_PARTIAL_HEDGE", "ACCEPT_A_BOOK_HEDGE")
+
+def fill(db: DatabaseManager, n_tickets: int, n_matches: int = 500, batch: int = 50_000, seed: int = 7):
+    rng = np.random.default_rng(seed)
+    for start in range(0, n_tickets, batch):
+        size = min(batch, n_tickets - start)
+        m = rng.integers(n_matches, size=size); a = rng.integers(3, size=size); stake = rng.uniform(100, 5000, size=size)
+        rows = [(f"T{start + i}", "single", float(k), ACTIONS[j], float(k * 1.5), float(k * 0.5 if j else 0.0), f"Home {x} vs Away {x}", "home")
+                for i, (x, j, k) in enumerate(zip(m, a, stake))]
+        db.save_decisions({}, rows)
+
+def timed(fn, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t)
+    return best * 1000
+
+def main():
+    n_tickets = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DatabaseManager(os.path.join(tmp, "orders.db"))
+        t = time.perf_counter()
+        fill(db, n_tickets)
+        print(f"灌入 {n_tickets:,} 张订单 (含汇总表增量累加): {time.perf_counter() - t:.2f}s")
+
+        # 深翻页：翻到 90% 深处的一页
+        depth = int(n_tickets * 0.9)
+        cursor = n_tickets - depth + 1  # seq 从 1 递增、最新在前
+        print(f"第一页:                {timed(lambda: db.get_order_book(100)):>9.2f} ms")
+        print(f"深翻页 keyset:         {timed(lambda: db.get_order_book(100, before=cursor)):>9.2f} ms")
+        print(f"深翻页 OFFSET (对照):  {timed(lambda: db._read('SELECT * FROM order_book ORDER BY timestamp DESC LIMIT 100 OFFSET ?', (depth,)), 1):>9.2f} ms")
+        print(f"按场次过滤第一页:      {timed(lambda: db.get_order_book(100, match_id='Home 7 vs Away 7')):>9.2f} ms")
+
+        # 汇总
+        print(f"按场次汇总 (汇总表):   {timed(lambda: db.order_summary('match')):>9.2f} ms")
+        print(f"按动作汇总 (汇总表):   {timed(lambda: db.order_summary('action')):>9.2f} ms")
+        full = lambda: db._read("SELECT danger_match_id, COUNT(*), TOTAL(stake), TOTAL(retained_liability), TOTAL(hedge_stake) FROM order_book GROUP BY danger_match_id")
+        print(f"按场次汇总 (全表扫描): {timed(full, 1):>9.2f} ms")
+        frame = lambda: pd.DataFrame([dict(r) for r in db._read("SELECT * FROM order_book")]).groupby("danger_match_id")[["stake", "retained_liability", "hedge_stake"]].sum()
+        print(f"按场次汇总 (pandas):   {timed(frame, 1):>9.2f} ms")
+        db.close()
+
+if __name__ == "__main__":
+    main()
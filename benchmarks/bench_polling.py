@@ -0,0 +1,88 @@
+"""分级轮询压测：假时钟回放一整天，对着本地桩服务比较额度消耗与敞口场次的报价覆盖率、陈旧度
+
+用法: python benchmarks/bench_polling.py [联赛数] [敞口场次数] [敞口集中在几个联赛]
+基线是原来的固定节奏：每 60 秒拉一次聚合的 soccer_upcoming (一天 1440 个额度)，但它只带进行中的比赛与接下来的 8 场，
+离开赛稍远的敞口场次根本拿不到报价。分级轮询按联赛请求 (每个联赛各扣 1 个额度)，敞口越集中越能把额度压到要紧的联赛上。
+"""
+import sys, os, time, asyncio, random, calendar
+import httpx
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from odds_api_stub import StubOddsAPI
+from src.shadow_bookmaker.config import settings
+from src.shadow_bookmaker.infrastructure.bookmakers.poll_scheduler import _next_month_utc
+from src.shadow_bookmaker.infrastructure.bookmakers.the_odds_api import TheOddsAPIBookmaker
+from src.shadow_bookmaker.infrastructure.network import AsyncNetworkEngine
+
+class IdentityMapper:
+    def standardize(self, raw_name: str) -> str: return raw_name
+
+class FakeClock:
+    def __init__(self, t: float): self.t = t
+    def __call__(self) -> float: return self.t
+
+_BASELINE_EVERY = 60.0
+_WINDOW = (-6 * 3600, 2 * 3600)  # 敞口场次最要紧的窗口：开赛前 6 小时到开赛后 2 小时
+
+async def simulate(adaptive: bool, n_leagues: int, n_exposed: int, n_hot_leagues: int, daily_credits: float, hours: float = 24.0, seed: int = 11) -> dict:
+    clock = FakeClock(calendar.timegm((2026, 3, 10, 0, 0, 0)))
+    days_left = (_next_month_utc(clock.t) - clock.t) / 86400.0
+    stub = StubOddsAPI(n_leagues=n_leagues, quota=int(daily_credits * days_left), clock=clock)
+    network = AsyncNetworkEngine(transport=httpx.ASGITransport(stub.app()))
+    book = TheOddsAPIBookmaker(IdentityMapper(), clock=clock)
+    book.network = network
+
+    # 敞口：从几个联赛里挑当天开赛的若干场 (match_id 与解析器一致："主队 vs 客队")
+    rng, end = random.Random(seed), clock.t + hours * 3600
+    hot_leagues = rng.sample(sorted(stub.fixtures), min(n_hot_leagues, len(stub.fixtures)))
+    today = [(key, e["commence_time"], f"{e['home_team']} vs {e['away_team']}")
+             for key in hot_leagues for e in stub.fixtures[key] if clock.t < e["commence_time"] < end]
+    exposed = rng.sample(today, min(n_exposed, len(today)))
+    book.watch(m_id for _, _, m_id in exposed)
+
+    # 窗口内按时间加权：有报价的时长占比 (覆盖率) 与有报价时的平均陈旧度
+    covered = window = weighted_age = worst_age = 0.0
+    fetched_at = {}
+    wall = time.perf_counter()
+    while clock.t < end:
+        if adaptive:
+            served = {q.match_id for q in await book.fetch_odds()}
+            for league, _, m_id in exposed:
+                if m_id in served: fetched_at[m_id] = book.scheduler.leagues[league].last_ok
+            step = max(min(settings.MARKET_SOFT_TTL, book.next_poll_in() or settings.MARKET_SOFT_TTL), 1.0)
+        else:
+            data = await network.fetch_json(f"{book.base_url}/v4/sports/soccer_upcoming/odds", params={"apiKey": settings.ODDS_API_KEY, "regions": "eu", "markets": "h2h", "bookmakers": "pinnacle"})
+            served = {f"{e['home_team']} vs {e['away_team']}" for e in data}
+            fetched_at.update((m_id, clock.t) for m_id in served)
+            step = _BASELINE_EVERY
+        for _, kickoff, m_id in exposed:
+            if not kickoff + _WINDOW[0] <= clock.t < kickoff + _WINDOW[1]: continue
+            window += step
+            if m_id not in served: continue
+            age = clock.t - fetched_at[m_id]
+            covered += step
+            weighted_age += (age + step / 2) * step
+            worst_age = max(worst_age, age + step)
+        clock.t += step
+    await network.aclose()
+    return {"credits": stub.used, "odds_calls": stub.calls["odds"], "free_calls": stub.calls["sports"] + stub.calls["events"],
+            "coverage": covered / window if window else float("nan"), "mean_age": weighted_age / covered if covered else float("nan"),
+            "max_age": worst_age, "wall": time.perf_counter() - wall}
+
+def report(label: str, r: dict):
+    print(f"{label:>14}: 额度 {r['credits']:5.0f} | 敞口窗口覆盖 {r['coverage']:6.1%}，报价平均旧 {r['mean_age']:6.1f} s，最旧 {r['max_age']:6.0f} s"
+          f" | 报价请求 {r['odds_calls']} 次，免费请求 {r['free_calls']} 次 | 回放 {r['wall']:.1f} s")
+
+def main():
+    n_leagues = int(sys.argv[1]) if len(sys.argv) > 1 else 12
+    n_exposed = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    n_hot_leagues = int(sys.argv[3]) if len(sys.argv) > 3 else 2
+    settings.ODDS_API_KEY, settings.ODDS_API_SPORTS, settings.ODDS_API_DAILY_BUDGET = "stub", "", 0
+    baseline = 86400 / _BASELINE_EVERY
+    print(f"{n_leagues} 个联赛 / {n_exposed} 场敞口 (集中在 {n_hot_leagues} 个联赛)，回放 24 小时；窗口 = 开赛前 6 小时 ~ 开赛后 2 小时")
+    report("基线 (固定 60s)", asyncio.run(simulate(False, n_leagues, n_exposed, n_hot_leagues, baseline)))
+    for daily in (baseline, baseline / 2, baseline / 5):
+        report(f"分级 (日预算 {daily:.0f})", asyncio.run(simulate(True, n_leagues, n_exposed, n_hot_leagues, daily)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+"""全书蒙特卡洛压测：报告不同 (场景数 × 场次数 × 串关数) 规模下的模拟耗时
+
+用法: python benchmarks/bench_portfolio_sim.py
+"""
+import sys, os, time
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from src.shadow_bookmaker.domain.portfolio_sim import PortfolioSimulator
+
+def synthetic_book(n_matches: int, n_parlays: int, seed: int = 7) -> PortfolioSimulator:
+    rng = np.random.default_rng(seed)
+    probs = rng.dirichlet([4.0, 3.0, 2.5], size=n_matches)
+    pnl = rng.normal(0.0, 5000.0, size=(n_matches, 3))
+    match_ids = [f"Home {j} vs Away {j}" for j in range(n_matches)]
+    parlays = []
+    for k in range(n_parlays):
+        legs = rng.choice(n_matches, size=int(rng.integers(2, 6)), replace=False)
+        stake, liability = 1000.0, 1000.0 * float(rng.uniform(3, 30))
+        sels = rng.integers(3, size=len(legs))
+        # 与 GlobalLedger 一致：每条腿都在所在场次记一次边际盈亏
+        pnl[legs] += stake
+        pnl[legs, sels] -= stake + liability
+        parlays.append((k, tuple((match_ids[j], int(s)) for j, s in zip(legs, sels)), stake, liability))
+    return PortfolioSimulator(pnl, probs, match_ids, parlays)
+
+def main():
+    print(f"{'scenarios':>10} {'matches':>8} {'parlays':>8} {'sec':>7} {'E[pnl]':>12} {'VaR99':>12}")
+    for n_scenarios, n_matches, n_parlays in ((100_000, 1000, 0), (1_000_000, 1000, 0), (1_000_000, 1000, 500), (1_000_000, 200, 2000)):
+        sim = synthetic_book(n_matches, n_parlays)
+        t = time.perf_counter()
+        risk = sim.run(n_scenarios, seed=1)
+        print(f"{n_scenarios:>10} {n_matches:>8} {n_parlays:>8} {time.perf_counter() - t:>7.2f} {risk.expected_pnl:>12,.0f} {risk.var[0.99]:>12,.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""压测共用的确定性合成数据：同样的 (规模, 种子) 永远生成同样的盘口、单子、响应体、队名字典与预灌好的 SQLite 文件
+
+各压测脚本与 microbench.py 都从这里取数据，换机器、换版本跑出来的数字才有可比性。
+"""
+import sys, os, json, shutil, random, sqlite3, tempfile
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.shadow_bookmaker.domain.ledger import GlobalLedger, OUTCOMES
+from src.shadow_bookmaker.domain.models import CustomerTicket, OddsDTO, TicketLeg
+from src.shadow_bookmaker.infrastructure.database import DatabaseManager
+
+ACTIONS = ("ACCEPT_B_BOOK", "ACCEPT_PARTIAL_HEDGE", "ACCEPT_A_BOOK_HEDGE")
+_CACHE_DIR = os.path.join(tempfile.gettempdir(), "shadow_bookmaker_bench")
+
+def make_market(n_matches: int, seed: int = 7) -> dict:
+    rng = np.random.default_rng(seed)
+    # 先抽真实概率再加 3%~6% 抽水，得到像样的三项盘赔率
+    probs = rng.dirichlet((4.0, 3.0, 2.5), size=n_matches)
+    odds = 1.0 / (probs * rng.uniform(1.03, 1.06, size=(n_matches, 1)))
+    return {f"M{i}": OddsDTO(bookmaker="Pinnacle", match_id=f"M{i}", home_team=f"H{i}", away_team=f"A{i}",
+                             home_odds=float(h), away_odds=float(a), draw_odds=float(d)) for i, (h, a, d) in enumerate(odds)}
+
+def make_tickets(market: dict, n: int, seed: int = 11) -> list:
+    rng = np.random.default_rng(seed)
+    ids = list(market)
+    tickets = []
+    for i in range(n):
+        k = 1 if rng.random() < 0.7 else int(rng.integers(2, 4))
+        legs = [TicketLeg(match_id=ids[j], selection=OUTCOMES[int(rng.integers(3))], customer_odds=round(float(rng.uniform(1.5, 4.0)), 2))
+                for j in rng.choice(len(ids), size=k, replace=False)]
+        tickets.append(CustomerTicket(ticket_id=f"T{i}", ticket_type="single" if k == 1 else f"parlay_{k}", stake=1000.0, legs=legs))
+    return tickets
+
+def make_ledger(market: dict, seed: int = 13) -> GlobalLedger:
+    """内存草稿账本：每场都已经有一些正负盈亏，裁决时会走到对冲与击穿分支"""
+    rng = np.random.default_rng(seed)
+    return GlobalLedger.from_rows({m_id: row for m_id, row in zip(market, rng.normal(0.0, 12000.0, size=(len(market), 3)).tolist())})
+
+def synthetic_payload(n_matches: int, n_books: int = 8, seed: int = 7) -> list:
+    """模拟 soccer_upcoming 多地区多庄家响应：每场 n_books 家庄、h2h + totals 两个盘口"""
+    rng = random.Random(seed)
+    books = ["pinnacle"] + [f"book{i}" for i in range(n_books - 1)]
+    data = []
+    for j in range(n_matches):
+        home, away = f"Home FC {j}", f"Away United {j}"
+        data.append({
+            "id": f"evt{j}", "sport_key": "soccer_epl", "home_team": home, "away_team": away,
+            "bookmakers": [{"key": b, "title": b.title(), "markets": [
+                {"key": "h2h", "outcomes": [{"name": home, "price": round(rng.uniform(1.2, 6), 2)}, {"name": away, "price": round(rng.uniform(1.2, 6), 2)}, {"name": "Draw", "price": round(rng.uniform(2.8, 4.5), 2)}]},
+                {"key": "totals", "outcomes": [{"name": "Over", "price": 1.9, "point": 2.5}, {"name": "Under", "price": 1.9, "point": 2.5}]},
+            ]} for b in books],
+        })
+    return data
+
+_SYLLABLES = ("ar", "bel", "cas", "dor", "en", "fal", "gra", "hol", "ist", "jor", "kal", "lem", "mor", "nor", "ost", "par",
+              "quin", "ros", "sal", "tor", "ur", "val", "wes", "xan", "yor", "zel")
+_SUFFIXES = ("United", "City", "Rovers", "Athletic", "Wanderers", "Albion", "Town", "Sporting", "Real", "Dynamo")
+
+def team_dictionary(n_teams: int, seed: int = 7) -> dict:
+    """别名 -> 标准名 的大字典：每支球队带标准名本身与 "FC X"、"X FC"、缩写三个别名"""
+    rng = random.Random(seed)
+    names = set()
+    while len(names) < n_teams:
+        city = "".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(2, 4))).title()
+        names.add(f"{city} {rng.choice(_SUFFIXES)}")
+    mapping = {}
+    for name in sorted(names):
+        city = name.rsplit(" ", 1)[0]
+        for alias in (name, f"FC {city}", f"{city} FC", f"{city[:3].upper()} {name.rsplit(' ', 1)[1][:3]}"):
+            mapping.setdefault(alias, name)
+    return mapping
+
+def raw_team_names(mapping: dict, n: int, typo_share: float = 0.0, seed: int = 11) -> list:
+    """外盘吐出来的队名：从别名里抽，typo_share 的比例随机删/换一个字母 (走模糊匹配的慢路径)"""
+    rng = random.Random(seed)
+    aliases = list(mapping)
+    names = []
+    for _ in range(n):
+        name = rng.choice(aliases)
+        if rng.random() < typo_share:
+            i = rng.randrange(1, len(name))
+            name = name[:i] + (rng.choice("aeiou") if rng.random() < 0.5 else "") + name[i + 1:]
+        names.append(name)
+    return names
+
+def write_team_mapping(mapping: dict, path: str) -> str:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(mapping, f, ensure_ascii=False)
+    return path
+
+def _fill_order_book(db: DatabaseManager, n_tickets: int, n_matches: int, batch: int = 5000, seed: int = 7):
+    """按批确权灌入 n_tickets 张单子：订单流水 + 汇总表 + 账本事件 + 场次水位，与线上写入路径一致"""
+    rng = np.random.default_rng(seed)
+    ledger = GlobalLedger(db)
+    for start in range(0, n_tickets, batch):
+        size = min(batch, n_tickets - start)
+        m = rng.integers(n_matches, size=size); s = rng.integers(3, size=size); a = rng.integers(3, size=size)
+        stake = rng.uniform(100.0, 5000.0, size=size); odds = rng.uniform(1.5, 4.0, size=size)
+        bets = [(f"Home {x} vs Away {x}", OUTCOMES[j], float(k), float(k * (o - 1.0)), f"T{start + i}")
+                for i, (x, j, k, o) in enumerate(zip(m, s, stake, odds))]
+        tickets = [(f"T{start + i}", "single", float(k), ACTIONS[j], float(k * (o - 1.0)), float(k * 0.5 if j else 0.0), f"Home {x} vs Away {x}", OUTCOMES[y])
+                   for i, (x, y, j, k, o) in enumerate(zip(m, s, a, stake, odds))]
+        ledger.commit_bets(bets, tickets)
+    db.flush()
+
+def populated_db(n_tickets: int, n_matches: int = 2000, seed: int = 7, copy_to: str = None) -> str:
+    """预灌好的 SQLite 文件 (按规模与种子缓存在临时目录，第二次起直接复用)；给 copy_to 就拷一份出来，写压测不污染模板"""
+    template = os.path.join(_CACHE_DIR, f"orders_{n_tickets}_{n_matches}_{seed}.db")
+    if not os.path.exists(template):
+        os.makedirs(_CACHE_DIR, exist_ok=True)
+        building = f"{template}.building"
+        if os.path.exists(building): os.remove(building)
+        db = DatabaseManager(building)
+        _fill_order_book(db, n_tickets, n_matches, seed=seed)
+        db.close()
+        conn = sqlite3.connect(building)
+        conn.execute("PRAGMA journal_mode=DELETE")  # 并回 WAL，模板就是单个文件，可以直接拷
+        conn.close()
+        os.replace(building, template)
+    if copy_to is None: return template
+    shutil.copyfile(template, copy_to)
+    return copy_to
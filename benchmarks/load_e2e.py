@@ -0,0 +1,160 @@
+"""端到端容量压测：合成盘口 (或本地 Odds API 桩服务) -> BrokerOrchestrator -> 进单微批 -> SQLite，逐级加压找拐点
+
+用法: python benchmarks/load_e2e.py [--source sim|stub] [--matches 2000] [--rates 100,200,400,800,1600] [--stage 10] [--commit] [--shards 0] [--slo-ms 100]
+每一级按 Poisson 到达开环发单 (按时刻表发下一张，不等上一张返回)，延迟从计划到达时刻算起，排队也算在内；
+报告每级的达成吞吐、裁决延迟分位数、背压拒绝、裁决分布，以及 SQLite 文件与订单簿的增长。
+达成吞吐不到实际到达率的 90%、p99 超过 SLO 或出现背压拒绝的第一级就是拐点。
+--source stub 时行情走 TheOddsAPIBookmaker + AsyncNetworkEngine，请求经进程内传输层打进桩服务，连解析与分级轮询一起压。
+"""
+import sys, os, time, math, random, sqlite3, asyncio, argparse, tempfile, glob
+from collections import Counter
+import numpy as np
+import httpx
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from odds_api_stub import StubOddsAPI
+from src.shadow_bookmaker.config import settings
+from src.shadow_bookmaker.application.intake_service import IntakeOverloaded, TicketIntake
+from src.shadow_bookmaker.domain.ledger import OUTCOMES
+from src.shadow_bookmaker.domain.models import CustomerTicket, TicketLeg
+from src.shadow_bookmaker.infrastructure.bookmakers.market_sim import MarketSimulator
+from src.shadow_bookmaker.infrastructure.bookmakers.mock_bookies import SimulatedBookmaker
+from src.shadow_bookmaker.infrastructure.network import AsyncNetworkEngine
+
+_PER_LEAGUE = 50
+
+class TicketStream:
+    """按盘口生成工单：热门场次扎堆 (Zipf 式权重，制造场次锁争用)，客户赔率比锚点略差，八成单关"""
+    def __init__(self, market, skew: float, seed: int = 11):
+        self.rng = random.Random(seed)
+        self.match_ids = list(market)
+        self.odds = {m_id: (o.home_odds, o.away_odds, o.draw_odds or 0.0) for m_id, o in market.items()}
+        self.weights = list(np.cumsum(1.0 / np.arange(1, len(self.match_ids) + 1) ** skew))
+        self.seq = 0
+
+    def next(self) -> CustomerTicket:
+        self.seq += 1
+        n_legs = 1 if self.rng.random() < 0.8 else self.rng.randint(2, 4)
+        picked = dict.fromkeys(self.rng.choices(self.match_ids, cum_weights=self.weights, k=n_legs))
+        legs = []
+        for m_id in picked:
+            col = self.rng.choice([c for c in range(3) if self.odds[m_id][c] > 1.0])
+            legs.append(TicketLeg(match_id=m_id, selection=OUTCOMES[col], customer_odds=max(round(self.odds[m_id][col] * self.rng.uniform(0.9, 1.0), 2), 1.01)))
+        return CustomerTicket(ticket_id=f"E2E-{self.seq}", ticket_type="single" if len(legs) == 1 else f"parlay_{len(legs)}",
+                              stake=self.rng.choice([1000, 2000, 5000]), legs=legs)
+
+def sqlite_usage(db_path: str) -> tuple:
+    """(库文件 + WAL 字节数, 订单簿行数)"""
+    size = sum(os.path.getsize(p) for p in glob.glob(f"{db_path}*") if os.path.isfile(p))
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try: rows = conn.execute("SELECT COUNT(*) FROM order_book").fetchone()[0]
+    finally: conn.close()
+    return size, rows
+
+async def run_stage(intake: TicketIntake, stream: TicketStream, rate: float, duration: float, commit: bool, seed: int) -> dict:
+    rng = random.Random(seed)
+    latencies, actions, counters = [], Counter(), Counter()
+
+    async def one(ticket: CustomerTicket, due: float):
+        try: decision = await intake.submit(ticket, commit=commit)
+        except IntakeOverloaded:
+            counters["overloaded"] += 1
+            return
+        latencies.append(time.perf_counter() - due)
+        actions[decision.action] += 1
+
+    tasks = []
+    started = time.perf_counter()
+    due = started + rng.expovariate(rate)
+    while due < started + duration:
+        delay = due - time.perf_counter()
+        if delay > 0: await asyncio.sleep(delay)
+        # 醒来时已经过了时刻表的单子一次发完 (sleep 的粒度比高到达率的间隔粗)
+        while due <= time.perf_counter() and due < started + duration:
+            tasks.append(asyncio.create_task(one(stream.next(), due)))
+            due += rng.expovariate(rate)
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+    lat_ms = np.array(latencies) * 1000.0
+    return {"offered": len(tasks), "offered_rate": len(tasks) / duration, "decided": len(lat_ms), "elapsed": elapsed, "throughput": len(lat_ms) / elapsed,
+            "p50": float(np.percentile(lat_ms, 50)) if len(lat_ms) else float("nan"),
+            "p95": float(np.percentile(lat_ms, 95)) if len(lat_ms) else float("nan"),
+            "p99": float(np.percentile(lat_ms, 99)) if len(lat_ms) else float("nan"),
+            "max": float(lat_ms.max()) if len(lat_ms) else float("nan"),
+            "overloaded": counters["overloaded"], "actions": dict(actions)}
+
+def build_orchestrator(args, db_path: str):
+    from src.shadow_bookmaker.application.orchestrator import BrokerOrchestrator
+    from src.shadow_bookmaker.application.sharding import ShardRouter
+    settings.TEAM_MAPPING_PATH = os.path.join(os.path.dirname(db_path), "team_mapping.json")  # 合成队名别写进真实字典
+    settings.MARKET_SOFT_TTL = args.refresh
+    stub = None
+    if args.source == "stub":
+        stub = StubOddsAPI(n_leagues=math.ceil(args.matches / _PER_LEAGUE), matches_per_league=_PER_LEAGUE, quota=10**9, days=2.0, volatility=args.volatility)
+        settings.ODDS_API_KEY, settings.ODDS_API_SPORTS, settings.ODDS_API_DAILY_BUDGET = stub.api_key, "", 10**6
+    else:
+        settings.ODDS_API_KEY = ""
+    orchestrator = ShardRouter(args.shards, db_path=db_path) if args.shards else BrokerOrchestrator(db_path=db_path)
+    if stub is not None:
+        orchestrator.pinnacle.network = AsyncNetworkEngine(transport=httpx.ASGITransport(stub.app()))
+    else:
+        # tick 缩到几秒：一级压几十秒也能看到盘口在动、行情库在做增量合并
+        orchestrator.pinnacle = SimulatedBookmaker(orchestrator.mapper, MarketSimulator(args.matches, seed=7, volatility=args.volatility, tick=args.tick))
+    return orchestrator, stub
+
+async def main_async(args):
+    rates = [float(r) for r in args.rates.split(",")]
+    db_path = os.path.join(tempfile.mkdtemp(), "load_e2e.db")
+    orchestrator, stub = build_orchestrator(args, db_path)
+    intake = TicketIntake(orchestrator)
+    await orchestrator.start()
+    await intake.start()
+    try:
+        t = time.perf_counter()
+        market = await orchestrator.get_live_market(force_refresh=True)
+        if not market: raise SystemExit("没有可用盘口")
+        print(f"📡 行情源 {args.source} ({type(orchestrator.pinnacle).__name__})：{len(market):,} 场可定价，首轮抓盘 {time.perf_counter() - t:.2f}s"
+              f" | 分片 {args.shards or '单进程'} | commit={args.commit} | 每级 {args.stage:.0f}s | SLO p99 {args.slo_ms:.0f} ms")
+        stream = TicketStream(market, args.skew)
+        size0, rows0 = sqlite_usage(db_path)
+        print(f"{'目标/s':>8} {'达成/s':>8} {'p50':>7} {'p95':>7} {'p99':>7} {'max':>8} {'背压':>6} {'库增长':>9} {'字节/单':>7}  裁决分布")
+        breaking = None
+        for k, rate in enumerate(rates):
+            size_before, rows_before = sqlite_usage(db_path)
+            r = await run_stage(intake, stream, rate, args.stage, args.commit, seed=k)
+            await orchestrator.db.aflush()
+            size_after, rows_after = sqlite_usage(db_path)
+            grown, new_rows = size_after - size_before, rows_after - rows_before
+            broken = r["throughput"] < 0.9 * r["offered_rate"] or r["p99"] > args.slo_ms or r["overloaded"] > 0
+            print(f"{rate:>8.0f} {r['throughput']:>8.0f} {r['p50']:>7.1f} {r['p95']:>7.1f} {r['p99']:>7.1f} {r['max']:>8.1f} {r['overloaded']:>6}"
+                  f" {grown / 1e6:>7.2f}MB {grown / new_rows if new_rows else 0:>7.0f}  {r['actions']}{'  🚨' if broken else ''}")
+            if broken and breaking is None:
+                breaking = rate
+                if not args.keep_going: break
+        size, rows = sqlite_usage(db_path)
+        print(f"🗄️ SQLite: {size0 / 1e6:.2f}MB -> {size / 1e6:.2f}MB，订单簿 {rows0:,} -> {rows:,} 行"
+              + (f" | 桩服务额度消耗 {stub.used}，报价请求 {stub.calls['odds']} 次" if stub else ""))
+        print(f"🚨 拐点：目标 {breaking:.0f} 张/秒 (上一级是最后一个达标的负载)" if breaking else "✅ 所有级别都达标，可以继续往上加压")
+    finally:
+        await intake.stop()
+        await orchestrator.aclose()
+        await orchestrator.db.aflush()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--source", choices=("sim", "stub"), default="sim")
+    parser.add_argument("--matches", type=int, default=2000)
+    parser.add_argument("--rates", default="100,200,400,800,1600", help="逗号分隔的各级目标到达率 (张/秒)")
+    parser.add_argument("--stage", type=float, default=10.0, help="每级持续秒数")
+    parser.add_argument("--commit", action="store_true", help="放行即确权入账 (默认只裁决不入账，SQLite 不增长)")
+    parser.add_argument("--shards", type=int, default=0, help="风控分片进程数 (0 = 单进程)")
+    parser.add_argument("--slo-ms", type=float, default=100.0)
+    parser.add_argument("--skew", type=float, default=0.8, help="场次热度的 Zipf 指数，越大越扎堆")
+    parser.add_argument("--volatility", type=float, default=0.02)
+    parser.add_argument("--tick", type=float, default=5.0, help="合成盘口随机游走的步长 (秒)")
+    parser.add_argument("--refresh", type=float, default=5.0, help="行情快照的后台刷新间隔 (秒)")
+    parser.add_argument("--keep-going", action="store_true", help="过了拐点也把剩下的级别跑完")
+    asyncio.run(main_async(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""进单服务压测：并发 HTTP 客户端持续打单，报告吞吐 (张/秒)、裁决延迟分位数与背压拒绝数
+
+用法: python benchmarks/load_intake.py [--url http://127.0.0.1:8765] [--concurrency 64] [--duration 10] [--commit] [--shards 4]
+不给 --url 时在本进程后台拉起一个使用临时数据库的进单服务 (压测客户端与服务共享 GIL，数字偏保守)；
+--shards N 时内嵌服务走分片部署 (N 个风控工作进程)，比较不同 N 的吞吐就能看出随核数的扩展情况。
+"""
+import sys, os, time, asyncio, argparse, random, tempfile
+import httpx
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+def random_ticket(rng: random.Random, match_ids, seq: int) -> dict:
+    n_legs = 1 if rng.random() < 0.8 or len(match_ids) < 2 else rng.randint(2, min(4, len(match_ids)))
+    legs = [{"match_id": m_id, "selection": rng.choice(["home", "away", "draw"]), "customer_odds": round(rng.uniform(1.5, 3.5), 2)}
+            for m_id in rng.sample(match_ids, n_legs)]
+    return {"ticket_id": f"LOAD-{seq}", "ticket_type": "single" if n_legs == 1 else f"parlay_{n_legs}", "stake": rng.choice([1000, 2000, 5000]), "legs": legs}
+
+async def worker(http: httpx.AsyncClient, match_ids, deadline: float, commit: bool, seed: int, latencies: list, counters: dict):
+    rng = random.Random(seed)
+    seq = 0
+    while time.perf_counter() < deadline:
+        seq += 1
+        ticket = random_ticket(rng, match_ids, seed * 10_000_000 + seq)
+        t = time.perf_counter()
+        resp = await http.post("/tickets", json=ticket, params={"commit": "1"} if commit else None)
+        if resp.status_code == 503:
+            counters["overloaded"] += 1
+            await asyncio.sleep(float(resp.headers.get("Retry-After", "1")) / 100)
+            continue
+        resp.raise_for_status()
+        latencies.append(time.perf_counter() - t)
+        counters[resp.json()["action"]] = counters.get(resp.json()["action"], 0) + 1
+
+async def run(url: str, concurrency: int, duration: float, commit: bool):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30.0) as http:
+        match_ids = list((await http.get("/market")).json()["odds"])
+        if not match_ids: raise SystemExit("进单服务没有可用盘口")
+        latencies, counters = [], {"overloaded": 0}
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(http, match_ids, started + duration, commit, k, latencies, counters) for k in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        stats = (await http.get("/stats")).json()
+
+    lat_ms = np.array(latencies) * 1000.0
+    print(f"matches={len(match_ids)} concurrency={concurrency} duration={elapsed:.1f}s commit={commit}")
+    print(f"decisions={len(lat_ms)} throughput={len(lat_ms) / elapsed:,.0f}/s overloaded={counters.pop('overloaded')}")
+    if len(lat_ms):
+        p50, p95, p99 = np.percentile(lat_ms, [50, 95, 99])
+        print(f"latency_ms p50={p50:.1f} p95={p95:.1f} p99={p99:.1f} max={lat_ms.max():.1f}")
+    print(f"actions={counters}")
+    print(f"server batches={stats['batches']} avg_batch={stats['decided'] / max(stats['batches'], 1):.1f}")
+    lw = stats["lock_wait"]
+    print(f"shards={lw.get('shards', 0)} lock_wait acquired={lw['acquired']} contended={lw['contended']} mean_ms={lw['wait_mean'] * 1e3:.2f} max_ms={lw['wait_max'] * 1e3:.2f}")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--commit", action="store_true", help="放行即确权入账 (默认只裁决不入账)")
+    parser.add_argument("--shards", type=int, default=0, help="内嵌服务的风控分片进程数 (0 = 单进程)")
+    args = parser.parse_args()
+    url = args.url
+    if not url:
+        from src.shadow_bookmaker.application.orchestrator import BrokerOrchestrator
+        from src.shadow_bookmaker.application.sharding import ShardRouter
+        from src.shadow_bookmaker.presentation.api import serve_in_background
+        db_path = os.path.join(tempfile.mkdtemp(), "load_intake.db")
+        url = serve_in_background(orchestrator=ShardRouter(args.shards, db_path=db_path) if args.shards else BrokerOrchestrator(db_path=db_path))
+    asyncio.run(run(url, args.concurrency, args.duration, args.commit))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""热路径微基准套件：裁决、账本推演、队名清洗、赔率解析与 SQLite 读写，结果存 JSON 并可对照基线做回归闸门
+
+用法: python benchmarks/microbench.py [--scale small|medium|large] [--only 子串] [--repeat 5] [--save 结果.json] [--compare 基线.json] [--threshold 0.25]
+数据全部来自 fixtures.py 的确定性生成器，同一规模每次跑的是同一份输入；结果按"每次操作耗时"比较 (取多轮里最快的一轮)。
+给了 --compare 时，任何一项比基线慢过 threshold (默认 25%) 就记为回归并以退出码 1 结束，可直接挂进 CI。
+"""
+import sys, os, json, time, asyncio, platform, argparse, contextlib, statistics, subprocess, tempfile
+from typing import Callable, Dict, Tuple
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import httpx
+import numpy as np
+from fixtures import make_market, make_tickets, make_ledger, synthetic_payload, team_dictionary, raw_team_names, write_team_mapping, populated_db
+from src.shadow_bookmaker.config import settings
+from src.shadow_bookmaker.application.team_mapper import TeamMapper
+from src.shadow_bookmaker.domain.devig import PriceTable
+from src.shadow_bookmaker.domain.ledger import GlobalLedger, OUTCOMES
+from src.shadow_bookmaker.domain.risk_engine import RiskEngine
+from src.shadow_bookmaker.infrastructure.bookmakers.odds_parser import OddsBatch, iter_h2h_quotes
+from src.shadow_bookmaker.infrastructure.bookmakers.the_odds_api import TheOddsAPIBookmaker
+from src.shadow_bookmaker.infrastructure.database import DatabaseManager
+from src.shadow_bookmaker.infrastructure.network import AsyncNetworkEngine
+
+_RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+# 规模档位：场次 / 单子 / 队名字典 / 响应体场次 / 预灌订单数
+SCALES = {
+    "small":  {"matches": 500,    "tickets": 500,    "teams": 2_000,   "payload": 1_000,  "orders": 20_000},
+    "medium": {"matches": 5_000,  "tickets": 2_000,  "teams": 20_000,  "payload": 10_000, "orders": 200_000},
+    "large":  {"matches": 20_000, "tickets": 10_000, "teams": 100_000, "payload": 50_000, "orders": 1_000_000},
+}
+
+# 用例：setup(规模, 临时目录) -> (跑一轮的函数, 这一轮包含的操作数)
+CASES: Dict[str, Callable[[dict, str], Tuple[Callable[[], object], int]]] = {}
+
+def case(name: str):
+    def register(setup):
+        CASES[name] = setup
+        return setup
+    return register
+
+@case("risk.evaluate")
+def _risk_evaluate(size: dict, tmp: str):
+    market = make_market(size["matches"])
+    engine, table = RiskEngine(make_ledger(market)), PriceTable(market)
+    tickets = make_tickets(market, min(size["tickets"], 1000))
+    return (lambda: [engine.evaluate(t, table) for t in tickets]), len(tickets)
+
+@case("risk.evaluate_batch")
+def _risk_evaluate_batch(size: dict, tmp: str):
+    market = make_market(size["matches"])
+    engine, table = RiskEngine(make_ledger(market)), PriceTable(market)
+    tickets = make_tickets(market, size["tickets"])
+    return (lambda: engine.evaluate_batch(tickets, table)), len(tickets)
+
+def _singles(size: dict):
+    """只有单关、空账本：开赛前洪峰最常见的形态，标量与批量通道跑同一份输入"""
+    market = make_market(size["matches"])
+    return RiskEngine(GlobalLedger.from_rows({})), PriceTable(market), [t for t in make_tickets(market, size["tickets"] * 2) if len(t.legs) == 1]
+
+@case("risk.evaluate_singles")
+def _risk_evaluate_singles(size: dict, tmp: str):
+    engine, table, tickets = _singles(size)
+    return (lambda: [engine.evaluate(t, table) for t in tickets]), len(tickets)
+
+@case("risk.evaluate_batch_singles")
+def _risk_evaluate_batch_singles(size: dict, tmp: str):
+    engine, table, tickets = _singles(size)
+    return (lambda: engine.evaluate_batch(tickets, table)), len(tickets)
+
+@case("ledger.simulate_bet")
+def _ledger_simulate_bet(size: dict, tmp: str):
+    market = make_market(size["matches"])
+    ledger = make_ledger(market)
+    rng = np.random.default_rng(5)
+    ids = list(market)
+    bets = [(ids[m], OUTCOMES[s], 1000.0, float(k)) for m, s, k in zip(rng.integers(len(ids), size=10_000), rng.integers(3, size=10_000), rng.uniform(500, 5000, size=10_000))]
+    return (lambda: [ledger.simulate_bet(*b) for b in bets]), len(bets)
+
+def _mapper(mapping: dict, tmp: str, name: str) -> TeamMapper:
+    return TeamMapper(write_team_mapping(mapping, os.path.join(tmp, f"{name}.json")))
+
+@case("mapper.standardize_exact")
+def _mapper_exact(size: dict, tmp: str):
+    mapping = team_dictionary(size["teams"])
+    mapper, names = _mapper(mapping, tmp, "exact"), raw_team_names(mapping, 20_000)
+    return (lambda: [mapper.standardize(n) for n in names]), len(names)
+
+@case("mapper.standardize_fuzzy")
+def _mapper_fuzzy(size: dict, tmp: str):
+    mapping = team_dictionary(size["teams"])
+    mapper, names = _mapper(mapping, tmp, "fuzzy"), raw_team_names(mapping, 500, typo_share=1.0)
+    settings.TEAM_LEARN_THRESHOLD = 101  # 不学别名：否则第二轮起全是精确命中，测不到慢路径
+    def run():
+        mapper._cache.clear()  # 每轮都是冷缓存
+        return [mapper.standardize(n) for n in names]
+    return run, len(names)
+
+def _payload_mapper(payload: list, tmp: str) -> TeamMapper:
+    # 线上字典里本来就有这些队名：解析阶段走精确命中，测的是解析本身
+    return _mapper({name: name for e in payload for name in (e["home_team"], e["away_team"])}, tmp, "payload")
+
+@case("odds.parse")
+def _odds_parse(size: dict, tmp: str):
+    payload = synthetic_payload(size["payload"])
+    mapper = _payload_mapper(payload, tmp)
+    return (lambda: OddsBatch("Pinnacle", iter_h2h_quotes(payload, mapper, "pinnacle")).views()), len(payload)
+
+@case("odds.fetch_odds")
+def _odds_fetch(size: dict, tmp: str):
+    """TheOddsAPIBookmaker.fetch_odds 全程：HTTP 走进程内假传输层，含 JSON 解码、解析、调度记账"""
+    payload = synthetic_payload(size["payload"])
+    mapper, body = _payload_mapper(payload, tmp), json.dumps(payload).encode()
+    quota = {"x-requests-remaining": "100000", "x-requests-used": "0", "x-requests-last": "1"}
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path.endswith("/odds"): return httpx.Response(200, content=body, headers={**quota, "content-type": "application/json"})
+        return httpx.Response(200, json=[], headers=quota)
+    settings.ODDS_API_KEY, settings.ODDS_API_SPORTS, settings.ODDS_API_DAILY_BUDGET = "bench", "soccer_epl", 10_000
+    async def fetch():
+        book = TheOddsAPIBookmaker(mapper)  # 每轮一个新实例：调度器是空的，联赛必然到期
+        book.network = AsyncNetworkEngine(transport=httpx.MockTransport(handler))
+        try:
+            quotes = await book.fetch_odds()
+        finally:
+            await book.network.aclose()
+        assert len(quotes) == len(payload)
+        return quotes
+    return (lambda: asyncio.run(fetch())), len(payload)
+
+@case("db.save_decisions")
+def _db_save_decisions(size: dict, tmp: str):
+    """往预灌好的库里按批确权 200 张单 (流水 + 汇总 + 事件 + 水位同一事务)，fsync 落盘为止"""
+    db = DatabaseManager(populated_db(size["orders"], copy_to=os.path.join(tmp, "write.db")))
+    ledger = GlobalLedger(db)
+    rng = np.random.default_rng(9)
+    batch, counter = 200, iter(range(10**9))
+    def run():
+        n = next(counter)
+        m, s, k = rng.integers(2000, size=batch), rng.integers(3, size=batch), rng.uniform(100, 5000, size=batch)
+        bets = [(f"Home {x} vs Away {x}", OUTCOMES[j], float(v), float(v), f"B{n}-{i}") for i, (x, j, v) in enumerate(zip(m, s, k))]
+        tickets = [(f"B{n}-{i}", "single", float(v), "ACCEPT_B_BOOK", float(v), 0.0, f"Home {x} vs Away {x}", OUTCOMES[j]) for i, (x, j, v) in enumerate(zip(m, s, k))]
+        ledger.commit_bets(bets, tickets)
+        db.flush()
+    return run, batch
+
+@case("db.load_ledger")
+def _db_load_ledger(size: dict, tmp: str):
+    """冷启动恢复水位 (最近快照 + 之后的事件尾巴)"""
+    db = DatabaseManager(populated_db(size["orders"], copy_to=os.path.join(tmp, "read.db")))
+    return db.load_ledger, 1
+
+@case("db.order_book_page")
+def _db_order_book_page(size: dict, tmp: str):
+    """订单簿 keyset 翻到一半深处的一页 (100 行)"""
+    db = DatabaseManager(populated_db(size["orders"], copy_to=os.path.join(tmp, "page.db")))
+    before = size["orders"] // 2
+    return (lambda: db.get_order_book(100, before)), 1
+
+@contextlib.contextmanager
+def restored_settings():
+    """用例可以随手改 settings (关学习、填假 key)，出了这个块原样改回，不串到后面的用例"""
+    saved = settings.model_dump()
+    try: yield
+    finally:
+        for key, value in saved.items(): setattr(settings, key, value)
+
+def measure(fn: Callable[[], object], ops: int, repeat: int) -> dict:
+    fn()  # 预热：首轮的缓存、懒加载、JIT 式初始化不算
+    times = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t)
+    best = min(times)
+    return {"ops": ops, "best_s": best, "median_s": statistics.median(times), "per_op_us": best / ops * 1e6}
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=10,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or "unknown"
+    except Exception:
+        return "unknown"
+
+def run_suite(scale: str, only: str = None, repeat: int = 5) -> dict:
+    size = SCALES[scale]
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, setup in CASES.items():
+            if only and only not in name: continue
+            with restored_settings():
+                fn, ops = setup(size, tmp)
+                results[name] = measure(fn, ops, repeat)
+            r = results[name]
+            print(f"{name:>26}: {r['per_op_us']:12.2f} µs/op  (最快一轮 {r['best_s'] * 1000:9.2f} ms，中位 {r['median_s'] * 1000:9.2f} ms，{ops:,} 次操作)")
+    return {"meta": {"scale": scale, "sizes": size, "repeat": repeat, "commit": _git_commit(), "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                     "python": platform.python_version(), "numpy": np.__version__, "machine": platform.machine(), "platform": platform.platform()},
+            "results": results}
+
+def compare(current: dict, baseline: dict, threshold: float) -> list:
+    """逐项对比每次操作耗时，返回慢过阈值的用例名"""
+    regressions = []
+    print(f"\n对照基线 {baseline['meta'].get('commit', '?')} ({baseline['meta'].get('timestamp', '?')})，回归阈值 +{threshold:.0%}")
+    for name, r in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            print(f"{name:>26}: 基线里没有这一项")
+            continue
+        ratio = r["per_op_us"] / base["per_op_us"]
+        flag = "🚨 回归" if ratio > 1.0 + threshold else ("⚡ 变快" if ratio < 1.0 / (1.0 + threshold) else "")
+        print(f"{name:>26}: {base['per_op_us']:12.2f} -> {r['per_op_us']:12.2f} µs/op  ({ratio:5.2f}x) {flag}")
+        if ratio > 1.0 + threshold: regressions.append(name)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", choices=list(SCALES), default="small")
+    parser.add_argument("--only", help="只跑名字里含这个子串的用例")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--save", help="结果 JSON 路径 (默认 benchmarks/results/<规模>-<提交>.json)")
+    parser.add_argument("--compare", help="基线结果 JSON：有用例慢过阈值则退出码为 1")
+    parser.add_argument("--threshold", type=float, default=0.25)
+    args = parser.parse_args()
+
+    print(f"🏁 微基准 ({args.scale}: {SCALES[args.scale]})，每项 {args.repeat} 轮取最快")
+    current = run_suite(args.scale, args.only, args.repeat)
+    path = args.save or os.path.join(_RESULTS_DIR, f"{args.scale}-{current['meta']['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(current, f, ensure_ascii=False, indent=2)
+    print(f"💾 结果已写入 {path}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline["meta"]["scale"] != args.scale:
+            sys.exit(f"基线规模是 {baseline['meta']['scale']}，本次是 {args.scale}，每次操作的耗时不可比")
+        regressions = compare(current, baseline, args.threshold)
+        if regressions:
+            print(f"🚨 {len(regressions)} 项回归: {', '.join(regressions)}")
+            sys.exit(1)
+        print("✅ 没有超过阈值的回归")
+
+if __name__ == "__main__":
+    main()
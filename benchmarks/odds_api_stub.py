@@ -0,0 +1,123 @@
+"""The Odds API 本地桩服务：若干足球联赛 + 几天的赛程，按官方规则扣额度并回送 x-requests-* 额度响应头
+
+用法: python benchmarks/odds_api_stub.py [--port 8790] [--leagues 12] [--per-league 20] [--quota 20000] [--volatility 0.02]
+然后 ODDS_API_KEY=stub ODDS_API_BASE_URL=http://127.0.0.1:8790 启动系统，即可离线联调分级轮询与额度预算。
+/v4/sports 与 /v4/sports/{key}/events 不扣额度；/v4/sports/{key}/odds 每次扣 地区数 × 盘口数，返回空列表不扣。
+赔率接口回送 ETag，带 If-None-Match 且报价没变时回 304 (照常扣额度，省的是下载与解析)。
+聚合键 soccer_upcoming 仿照官方的 upcoming：只返回进行中的比赛与接下来的 8 场。
+赔率来自 MarketSimulator：全部场次的真实概率按同一个种子做随机游走，联赛数 × 每联赛场次开到几千场就是容量规划用的大盘。
+"""
+import sys, os, time, math, zlib, random, argparse
+from typing import Callable, Dict, List
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from src.shadow_bookmaker.infrastructure.bookmakers.market_sim import MarketSimulator
+
+_LIVE_WINDOW = 2 * 3600  # 开赛后 2 小时内仍算进行中，照常出现在赛程与赔率里
+_UPCOMING_KEY, _UPCOMING_NEXT = "soccer_upcoming", 8
+
+def _iso(ts: float) -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(ts))
+
+class StubOddsAPI:
+    """桩服务状态：赛程、额度与调用计数；时钟可注入，压测脚本用假时钟回放一整天"""
+    def __init__(self, n_leagues: int = 12, matches_per_league: int = 20, days: float = 4.0, quota: int = 20000,
+                 clock: Callable[[], float] = time.time, api_key: str = "stub", seed: int = 7, volatility: float = 0.02):
+        self.clock, self.api_key = clock, api_key
+        self.remaining, self.used = quota, 0
+        self.calls: Dict[str, int] = {"sports": 0, "events": 0, "odds": 0, "not_modified": 0}
+        rng = random.Random(seed)
+        start = math.floor(clock() / 3600) * 3600
+        self.fixtures: Dict[str, List[dict]] = {}
+        for l in range(n_leagues):
+            key = f"soccer_stub_league_{l:02d}"
+            # 开赛时间落在整点或半点，联赛内扎堆 (同一轮比赛集中在几个时段)
+            slots = [start + rng.randrange(1, int(days * 24)) * 3600 for _ in range(max(matches_per_league // 4, 1))]
+            self.fixtures[key] = [{"id": f"{key}-{j}", "sport_key": key, "commence_time": rng.choice(slots) + rng.choice((0, 1800)),
+                                   "home_team": f"Home {l}-{j}", "away_team": f"Away {l}-{j}"} for j in range(matches_per_league)]
+        self.sports = [{"key": key, "group": "Soccer", "title": key, "active": True, "has_outrights": False} for key in self.fixtures]
+        self.sports += [{"key": "soccer_fifa_world_cup_winner", "group": "Soccer", "title": "World Cup Winner", "active": True, "has_outrights": True},
+                        {"key": "basketball_nba", "group": "Basketball", "title": "NBA", "active": True, "has_outrights": False}]
+        events = [e for league in self.fixtures.values() for e in league]
+        self.market = MarketSimulator(seed=seed, volatility=volatility, clock=clock, teams=[(e["home_team"], e["away_team"]) for e in events])
+        self._rows = {e["id"]: i for i, e in enumerate(events)}
+
+    def _events(self, key: str) -> List[dict]:
+        now = self.clock()
+        if key != _UPCOMING_KEY: return [e for e in self.fixtures.get(key, []) if e["commence_time"] > now - _LIVE_WINDOW]
+        events = sorted((e for league in self.fixtures.values() for e in league if e["commence_time"] > now - _LIVE_WINDOW), key=lambda e: e["commence_time"])
+        live = [e for e in events if e["commence_time"] <= now]
+        return live + events[len(live):len(live) + _UPCOMING_NEXT]
+
+    def _odds(self, event: dict, prices: list) -> dict:
+        prices = prices[self._rows[event["id"]]]
+        outcomes = [{"name": event["home_team"], "price": prices[0]}, {"name": event["away_team"], "price": prices[1]}, {"name": "Draw", "price": prices[2]}]
+        return {**event, "commence_time": _iso(event["commence_time"]),
+                "bookmakers": [{"key": "pinnacle", "title": "Pinnacle", "markets": [{"key": "h2h", "outcomes": outcomes}]}]}
+
+    def _respond(self, body, cost: int = 0) -> JSONResponse:
+        self.remaining -= cost
+        self.used += cost
+        return JSONResponse(body, headers={"x-requests-remaining": str(self.remaining), "x-requests-used": str(self.used), "x-requests-last": str(cost)})
+
+    def _denied(self, request: Request):
+        if request.query_params.get("apiKey") != self.api_key:
+            return JSONResponse({"message": "API key is not valid", "error_code": "INVALID_KEY"}, status_code=401)
+        return None
+
+    async def list_sports(self, request: Request):
+        if (denied := self._denied(request)) is not None: return denied
+        self.calls["sports"] += 1
+        return self._respond(self.sports)
+
+    async def list_events(self, request: Request):
+        if (denied := self._denied(request)) is not None: return denied
+        key = request.path_params["sport"]
+        if key not in self.fixtures: return JSONResponse({"message": "Unknown sport", "error_code": "UNKNOWN_SPORT"}, status_code=404)
+        self.calls["events"] += 1
+        return self._respond([{**e, "commence_time": _iso(e["commence_time"])} for e in self._events(key)])
+
+    async def list_odds(self, request: Request):
+        if (denied := self._denied(request)) is not None: return denied
+        key = request.path_params["sport"]
+        if key not in self.fixtures and key != _UPCOMING_KEY: return JSONResponse({"message": "Unknown sport", "error_code": "UNKNOWN_SPORT"}, status_code=404)
+        events = self._events(key)
+        cost = len(request.query_params.get("regions", "us").split(",")) * len(request.query_params.get("markets", "h2h").split(",")) if events else 0
+        if self.remaining < cost:
+            return JSONResponse({"message": "Usage quota has been reached", "error_code": "OUT_OF_USAGE_CREDITS"}, status_code=429)
+        self.calls["odds"] += 1
+        prices = self.market.odds().tolist()  # 一次请求只补走一次游走，整张表取行
+        response = self._respond([self._odds(e, prices) for e in events], cost)
+        etag = f'"{zlib.crc32(response.body):08x}"'
+        if request.headers.get("if-none-match") == etag:
+            self.calls["not_modified"] += 1
+            return Response(status_code=304, headers={**{k: v for k, v in response.headers.items() if k.startswith("x-requests-")}, "ETag": etag})
+        response.headers["ETag"] = etag
+        return response
+
+    def app(self) -> Starlette:
+        return Starlette(routes=[
+            Route("/v4/sports", self.list_sports),
+            Route("/v4/sports/{sport}/events", self.list_events),
+            Route("/v4/sports/{sport}/odds", self.list_odds),
+        ])
+
+def main():
+    import uvicorn
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8790)
+    parser.add_argument("--leagues", type=int, default=12)
+    parser.add_argument("--per-league", type=int, default=20)
+    parser.add_argument("--quota", type=int, default=20000)
+    parser.add_argument("--volatility", type=float, default=0.02)
+    args = parser.parse_args()
+    stub = StubOddsAPI(n_leagues=args.leagues, matches_per_league=args.per_league, quota=args.quota, volatility=args.volatility)
+    print(f"🧪 The Odds API 桩服务: http://127.0.0.1:{args.port}  (apiKey={stub.api_key}，{args.leagues} 个联赛 × {args.per_league} 场，额度 {args.quota})")
+    uvicorn.run(stub.app(), host="127.0.0.1", port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
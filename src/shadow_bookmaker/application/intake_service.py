@@ -0,0 +1,143 @@
+import asyncio
+import time
+from collections import deque
+from typing import Deque, List, Optional, Set, Tuple
+from src.shadow_bookmaker.domain.models import CustomerTicket, RiskDecision
+from src.shadow_bookmaker.config import settings
+from src.shadow_bookmaker.infrastructure.metrics import metrics
+
+class IntakeOverloaded(RuntimeError):
+    """进单队列已满 (背压)：调用方应稍后重试"""
+
+# (工单, 是否直接确权, 等待结果的 future, 入队时间)
+_Pending = Tuple[CustomerTicket, bool, asyncio.Future, float]
+
+class TicketIntake:
+    """无界面进单服务核心：工单先进有界队列，由单个批处理协程攒成微批再交给风控批量通道。
+
+    攒批在"攒够 max_batch 张"和"最老一张已等满 max_wait 秒"之间取先到者，所以单张单子的排队延迟有上界；
+    风控算得慢时队列自然积压、下一批自动变大。队列满了直接抛 IntakeOverloaded，不无限排队。
+    最多 max_inflight 个微批同时在跑：同场的批次在编排器的场次锁上按出批顺序排队，不相干场次的批次互不等待。
+    """
+    def __init__(self, orchestrator, max_queue: int = None, max_batch: int = None, max_wait: float = None, max_inflight: int = None):
+        self.orchestrator = orchestrator
+        self.max_queue = settings.INTAKE_MAX_QUEUE if max_queue is None else max_queue
+        self.max_batch = settings.INTAKE_MAX_BATCH if max_batch is None else max_batch
+        self.max_wait = settings.INTAKE_MAX_WAIT if max_wait is None else max_wait
+        self.max_inflight = settings.INTAKE_MAX_INFLIGHT if max_inflight is None else max_inflight
+        self._pending: Deque[_Pending] = deque()
+        self._has_items: Optional[asyncio.Event] = None
+        self._batch_full: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._inflight: Set[asyncio.Task] = set()
+        self.stats = {"submitted": 0, "overloaded": 0, "batches": 0, "decided": 0, "committed": 0, "errors": 0}
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._pending)
+
+    @property
+    def inflight(self) -> int:
+        return len(self._inflight)
+
+    @property
+    def running(self) -> bool:
+        return self._worker is not None and not self._worker.done()
+
+    async def start(self):
+        if self.running: return
+        self._has_items = asyncio.Event()
+        self._batch_full = asyncio.Event()
+        self._slots = asyncio.Semaphore(self.max_inflight)
+        if self._pending: self._has_items.set()
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try: await self._worker
+            except asyncio.CancelledError: pass
+            self._worker = None
+        for task in list(self._inflight): task.cancel()
+        await asyncio.gather(*self._inflight, return_exceptions=True)
+        while self._pending:
+            fut = self._pending.popleft()[2]
+            if not fut.done(): fut.set_exception(IntakeOverloaded("进单服务已停止"))
+
+    def _check_capacity(self, n: int):
+        if len(self._pending) + n > self.max_queue:
+            self.stats["overloaded"] += n
+            raise IntakeOverloaded(f"进单队列已满 ({len(self._pending)}/{self.max_queue})，请稍后重试")
+
+    def _enqueue(self, ticket: CustomerTicket, commit: bool) -> asyncio.Future:
+        fut = asyncio.get_running_loop().create_future()
+        self._pending.append((ticket, commit, fut, time.perf_counter()))
+        self.stats["submitted"] += 1
+        self._has_items.set()
+        if len(self._pending) >= self.max_batch: self._batch_full.set()
+        return fut
+
+    async def submit(self, ticket: CustomerTicket, commit: bool = False) -> RiskDecision:
+        """提交一张工单，等它所在的微批裁决完成；commit=True 时放行即确权入账"""
+        if not self.running: raise RuntimeError("进单服务未启动")
+        self._check_capacity(1)
+        return await self._enqueue(ticket, commit)
+
+    async def submit_many(self, tickets: List[CustomerTicket], commit: bool = False) -> List[RiskDecision]:
+        """整批提交 (全有或全无：队列放不下整批就整批拒绝)，结果按提交顺序返回"""
+        if not self.running: raise RuntimeError("进单服务未启动")
+        self._check_capacity(len(tickets))
+        return list(await asyncio.gather(*[self._enqueue(t, commit) for t in tickets]))
+
+    async def _run(self):
+        while True:
+            await self._slots.acquire()
+            await self._has_items.wait()
+            # 凑批：攒够 max_batch 张，或者最老的一张已经等满 max_wait，先到先走
+            remaining = self._pending[0][3] + self.max_wait - time.perf_counter()
+            if len(self._pending) < self.max_batch and remaining > 0:
+                try: await asyncio.wait_for(self._batch_full.wait(), remaining)
+                except asyncio.TimeoutError: pass
+            batch = [self._pending.popleft() for _ in range(min(self.max_batch, len(self._pending)))]
+            if not self._pending: self._has_items.clear()
+            if len(self._pending) < self.max_batch: self._batch_full.clear()
+            task = asyncio.create_task(self._process(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._batch_done)
+
+    def _batch_done(self, task: asyncio.Task):
+        self._inflight.discard(task)
+        self._slots.release()
+
+    @metrics.timed("intake.batch")
+    async def _process(self, batch: List[_Pending]):
+        self.stats["batches"] += 1
+        try: await self._process_groups(batch)
+        except asyncio.CancelledError:
+            for _, _, fut, _ in batch:
+                if not fut.done(): fut.set_exception(IntakeOverloaded("进单服务已停止"))
+            raise
+
+    async def _process_groups(self, batch: List[_Pending]):
+        # 确权单先走：它们会改动账本，随后的只读预览单看到的是确权后的水位
+        for commit in (True, False):
+            group = [item for item in batch if item[1] == commit]
+            if not group: continue
+            tickets = [t for t, _, _, _ in group]
+            try:
+                if commit:
+                    decisions = await self.orchestrator.evaluate_and_commit(tickets)
+                    self.stats["committed"] += sum(d.action != "REJECT" for d in decisions)
+                else:
+                    decisions = await self.orchestrator.evaluate_incoming_tickets(tickets)
+            except Exception as e:
+                self.stats["errors"] += len(group)
+                for _, _, fut, _ in group:
+                    if not fut.done(): fut.set_exception(e)
+                continue
+            self.stats["decided"] += len(group)
+            now = time.perf_counter()
+            for (_, _, fut, enqueued), decision in zip(group, decisions):
+                metrics.record("intake.ticket", int((now - enqueued) * 1e9))  # 单张单子从进队列到出裁决
+                if not fut.done(): fut.set_result(decision)
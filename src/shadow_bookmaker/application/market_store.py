@@ -0,0 +1,110 @@
+import heapq
+import time
+from typing import Callable, Dict, Iterable, List, Mapping, Optional, Tuple
+from src.shadow_bookmaker.domain.models import MarketChange, MarketSnapshot, OddsDTO
+from src.shadow_bookmaker.config import settings
+
+def _max_move(old: OddsDTO, new: OddsDTO) -> float:
+    moves = [abs(new.home_odds / old.home_odds - 1.0), abs(new.away_odds / old.away_odds - 1.0)]
+    if old.draw_odds and new.draw_odds: moves.append(abs(new.draw_odds / old.draw_odds - 1.0))
+    elif old.draw_odds != new.draw_odds: moves.append(1.0)  # 平局盘口开/关视为大幅变动
+    return max(moves)
+
+class MarketStore:
+    """增量行情库：按 (场次, 庄家) 合并每轮抓盘结果，只对真正变了的报价发事件。
+
+    某个源这一轮没返回某场比赛不会立刻删掉它，而是等到该场的 TTL 过期才下架；
+    下游订阅者按变动幅度过滤事件，只重算变动的场次，工作量与变动数成正比而不是与全场次成正比。
+    """
+    def __init__(self, sharp_bookmaker: str = "Pinnacle", default_ttl: float = None):
+        self.sharp_bookmaker = sharp_bookmaker
+        self.default_ttl = settings.MARKET_QUOTE_TTL if default_ttl is None else default_ttl
+        self.books: Dict[str, Dict[str, OddsDTO]] = {}
+        self.sharp: Dict[str, OddsDTO] = {}                       # 风控锚点视图，随增量原地维护
+        self.updated_at: Dict[Tuple[str, str], float] = {}        # (场次, 庄家) -> 最近一次从源头抓到的时间 (报价自带 fetched_at 就以它为准)
+        self.last_quoted: Dict[str, float] = {}                   # 庄家 -> 最近一次真正从源头抓到报价的时间
+        self._ttl: Dict[str, float] = {}                          # 单场 TTL 覆盖 (如临场比赛缩短)
+        self._expiry_heap: List[Tuple[float, str, str]] = []      # 惰性过期堆：(到期时间, 场次, 庄家)
+        self._subscribers: List[Tuple[Callable[[List[MarketChange]], None], float]] = []
+        self.failed_sources: List[str] = []
+        self.fetched_at = 0.0
+
+    def set_sharp_bookmaker(self, name: str):
+        if name == self.sharp_bookmaker: return
+        self.sharp_bookmaker = name
+        self.sharp = {m_id: quotes[name] for m_id, quotes in self.books.items() if name in quotes}
+
+    def set_ttl(self, match_id: str, ttl: float):
+        self._ttl[match_id] = ttl
+
+    def set_ttls(self, ttls: Mapping[str, float]):
+        """整体替换单场 TTL 覆盖 (赛程里消失的场次回到默认 TTL，覆盖表不会越攒越多)"""
+        self._ttl = dict(ttls)
+
+    def subscribe(self, callback: Callable[[List[MarketChange]], None], min_move: float = 0.0):
+        """订阅行情事件；min_move > 0 时只推送赔率相对变动超过该幅度的 moved 事件 (added/removed 总是推送)"""
+        self._subscribers.append((callback, min_move))
+
+    def _put(self, odds: OddsDTO):
+        self.books.setdefault(odds.match_id, {})[odds.bookmaker] = odds
+        if odds.bookmaker == self.sharp_bookmaker: self.sharp[odds.match_id] = odds
+
+    def _drop(self, match_id: str, bookmaker: str) -> Optional[OddsDTO]:
+        quotes = self.books.get(match_id, {})
+        old = quotes.pop(bookmaker, None)
+        if not quotes: self.books.pop(match_id, None)
+        if bookmaker == self.sharp_bookmaker: self.sharp.pop(match_id, None)
+        self.updated_at.pop((match_id, bookmaker), None)
+        return old
+
+    def apply(self, quotes: Iterable[OddsDTO], now: float = None, failed_sources: List[str] = None) -> List[MarketChange]:
+        """合并一轮抓盘结果，返回本轮的变动事件并推送给订阅者"""
+        now = time.time() if now is None else now
+        changes: List[MarketChange] = []
+        for odds in quotes:
+            # 数据源沿用缓存重放的报价带着当初的抓取时间：不能因为这一轮又交了一次就给它续命
+            stamped = getattr(odds, "fetched_at", None)
+            seen = now if stamped is None else min(stamped, now)
+            ttl = self._ttl.get(odds.match_id, self.default_ttl)
+            if seen + ttl <= now: continue  # 源头抓到时就已经过了 TTL：不入库，库里的旧报价按原到期时间下架
+            key = (odds.match_id, odds.bookmaker)
+            old = self.books.get(odds.match_id, {}).get(odds.bookmaker)
+            self.updated_at[key] = seen
+            if seen > self.last_quoted.get(odds.bookmaker, 0.0): self.last_quoted[odds.bookmaker] = seen
+            heapq.heappush(self._expiry_heap, (seen + ttl, *key))
+            if old is None:
+                self._put(odds)
+                changes.append(MarketChange.model_construct(kind="added", match_id=odds.match_id, bookmaker=odds.bookmaker, old=None, new=odds, max_move=0.0))
+            elif (old.home_odds, old.away_odds, old.draw_odds) != (odds.home_odds, odds.away_odds, odds.draw_odds):
+                self._put(odds)
+                changes.append(MarketChange.model_construct(kind="moved", match_id=odds.match_id, bookmaker=odds.bookmaker, old=old, new=odds, max_move=_max_move(old, odds)))
+        changes.extend(self.expire(now))
+        self.fetched_at = now
+        self.failed_sources = list(failed_sources or [])
+        self._publish(changes)
+        return changes
+
+    def expire(self, now: float = None) -> List[MarketChange]:
+        """下架过了 TTL 还没再出现的报价 (只弹堆顶已到期的条目，不扫全表)"""
+        now = time.time() if now is None else now
+        removed = []
+        while self._expiry_heap and self._expiry_heap[0][0] <= now:
+            _, match_id, bookmaker = heapq.heappop(self._expiry_heap)
+            last_seen = self.updated_at.get((match_id, bookmaker))
+            # 堆里是惰性条目：报价之后又刷新过就跳过，以最新一次刷新推入的条目为准
+            if last_seen is None or last_seen + self._ttl.get(match_id, self.default_ttl) > now: continue
+            old = self._drop(match_id, bookmaker)
+            removed.append(MarketChange.model_construct(kind="removed", match_id=match_id, bookmaker=bookmaker, old=old, new=None, max_move=0.0))
+        return removed
+
+    def _publish(self, changes: List[MarketChange]):
+        if not changes: return
+        for callback, min_move in self._subscribers:
+            batch = changes if min_move <= 0 else [c for c in changes if c.kind != "moved" or c.max_move >= min_move]
+            if not batch: continue
+            try: callback(batch)
+            except Exception as e: print(f"📡 行情订阅者处理失败: {e}")
+
+    def snapshot(self) -> MarketSnapshot:
+        """只读快照视图 (与行情库共享底层字典，不做拷贝)"""
+        return MarketSnapshot.model_construct(books=self.books, sharp_bookmaker=self.sharp_bookmaker, fetched_at=self.fetched_at, failed_sources=self.failed_sources)
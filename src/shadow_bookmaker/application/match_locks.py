@@ -0,0 +1,58 @@
+import asyncio
+import contextlib
+import time
+import zlib
+from typing import Iterable, List
+from src.shadow_bookmaker.config import settings
+
+class MatchLocks:
+    """按场次分条的异步锁：match_id 按 CRC32 落到固定数量的锁条上，每条锁只串行化落在它上面的场次。
+
+    "沙盘推演 → 确权入账"全程攥着本单涉及场次的锁，同场并发的单子只能排队，不会都拿着旧水位闯过红线；
+    不相干的场次落在别的锁条上照常并行。一张单跨多条锁 (串关) 时按锁条编号升序加锁，互相之间不会死锁。
+    """
+    def __init__(self, stripes: int = None):
+        n = settings.MATCH_LOCK_STRIPES if stripes is None else stripes
+        self._locks = [asyncio.Lock() for _ in range(n)]
+        # 等锁埋点：加锁次数、其中需要排队的次数、累计/最长等待秒数
+        self.stats = {"acquired": 0, "contended": 0, "wait_total": 0.0, "wait_max": 0.0}
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+    def stripe_of(self, match_id: str) -> int:
+        # 不用内置 hash()：字符串哈希每个进程随机加盐，CRC32 在任何进程里都落在同一条锁上
+        return zlib.crc32(match_id.encode("utf-8")) % len(self._locks)
+
+    def stripes_of(self, match_ids: Iterable[str]) -> List[int]:
+        return sorted({self.stripe_of(m_id) for m_id in match_ids})
+
+    @contextlib.asynccontextmanager
+    async def hold(self, match_ids: Iterable[str]):
+        """攥住这些场次所在的全部锁条，退出时逆序释放"""
+        async with self._hold(self.stripes_of(match_ids)): yield
+
+    @contextlib.asynccontextmanager
+    async def hold_all(self):
+        """攥住全部锁条 (清库之类改动整本账的操作)"""
+        async with self._hold(range(len(self._locks))): yield
+
+    @contextlib.asynccontextmanager
+    async def _hold(self, stripes: Iterable[int]):
+        held: List[asyncio.Lock] = []
+        started = time.perf_counter()
+        contended = False
+        try:
+            for i in stripes:
+                lock = self._locks[i]
+                contended = contended or lock.locked()
+                await lock.acquire()
+                held.append(lock)
+            waited = time.perf_counter() - started
+            self.stats["acquired"] += 1
+            self.stats["contended"] += contended
+            self.stats["wait_total"] += waited
+            self.stats["wait_max"] = max(self.stats["wait_max"], waited)
+            yield
+        finally:
+            for lock in reversed(held): lock.release()
@@ -0,0 +1,76 @@
+import asyncio
+import time
+from typing import Dict, List, Optional
+from src.shadow_bookmaker.domain.models import MarketSnapshot, OddsDTO
+from src.shadow_bookmaker.infrastructure.bookmakers.base import BaseBookmaker
+from src.shadow_bookmaker.config import settings
+from src.shadow_bookmaker.infrastructure.metrics import metrics
+
+class CircuitBreaker:
+    """熔断器：连续失败 N 次就跳闸，冷却期内直接跳过该源；冷却结束放一次试探请求 (半开)"""
+    def __init__(self, max_failures: int = None, cooldown: float = None):
+        self.max_failures = settings.SOURCE_BREAKER_FAILURES if max_failures is None else max_failures
+        self.cooldown = settings.SOURCE_BREAKER_COOLDOWN if cooldown is None else cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None: return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.cooldown else "open"
+
+    def allow(self) -> bool:
+        return self.state != "open"
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.max_failures or self.opened_at is not None:
+            self.opened_at = time.monotonic()  # 半开试探失败也会重新计时
+
+class OddsAggregator:
+    """多源并发抓盘：每个源独立超时 + 独立熔断，一个慢源拖不垮其他源，失败时返回部分结果"""
+    def __init__(self, sharp: BaseBookmaker, others: List[BaseBookmaker] = None, timeouts: Dict[str, float] = None):
+        self.sharp = sharp
+        self.others = list(others or [])
+        self.timeouts = dict(timeouts or {})
+        self.breakers: Dict[str, CircuitBreaker] = {}
+
+    @property
+    def sources(self) -> List[BaseBookmaker]:
+        return [self.sharp] + self.others
+
+    def _breaker(self, source: BaseBookmaker) -> CircuitBreaker:
+        return self.breakers.setdefault(source.name, CircuitBreaker())
+
+    async def _fetch_one(self, source: BaseBookmaker) -> List[OddsDTO]:
+        breaker = self._breaker(source)
+        if not breaker.allow(): raise RuntimeError(f"{source.name} 熔断中")
+        try:
+            with metrics.span(f"source.{source.name}"):
+                odds = await asyncio.wait_for(source.fetch_odds(), self.timeouts.get(source.name, settings.SOURCE_TIMEOUT))
+        except Exception:
+            breaker.record_failure()
+            raise
+        breaker.record_success()
+        return odds
+
+    async def fetch(self) -> MarketSnapshot:
+        sources = self.sources
+        results = await asyncio.gather(*(self._fetch_one(src) for src in sources), return_exceptions=True)
+
+        books: Dict[str, Dict[str, OddsDTO]] = {}
+        failed = []
+        for src, res in zip(sources, results):
+            if isinstance(res, BaseException):
+                print(f"📡 数据源 {src.name} 本轮掉线 ({type(res).__name__}: {res})")
+                failed.append(src.name)
+                continue
+            for odds in res: books.setdefault(odds.match_id, {})[odds.bookmaker] = odds
+        return MarketSnapshot.model_construct(books=books, sharp_bookmaker=self.sharp.name, fetched_at=time.time(), failed_sources=failed)
+
+    async def aclose(self):
+        await asyncio.gather(*(src.aclose() for src in self.sources), return_exceptions=True)
@@ -1,52 +1,239 @@
 import asyncio
+import os
 import time
-from typing import List, Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+import pandas as pd
 from src.shadow_bookmaker.domain.risk_engine import RiskEngine
-from src.shadow_bookmaker.domain.ledger import GlobalLedger
-from src.shadow_bookmaker.domain.models import CustomerTicket, RiskDecision, OddsDTO
+from src.shadow_bookmaker.domain.ledger import GlobalLedger, OUTCOMES
+from src.shadow_bookmaker.domain.models import CustomerTicket, RiskDecision, OddsDTO, MarketSnapshot, ArbitrageOpportunity, PortfolioRisk, HedgePlan
+from src.shadow_bookmaker.domain.portfolio_sim import PortfolioSimulator
+from src.shadow_bookmaker.domain.hedge_optimizer import HedgeOptimizer
+from src.shadow_bookmaker.domain.devig import PriceTable
+from src.shadow_bookmaker.domain.calculator import ArbitrageScanner
 from src.shadow_bookmaker.application.team_mapper import TeamMapper
+from src.shadow_bookmaker.application.odds_aggregator import OddsAggregator
+from src.shadow_bookmaker.application.market_store import MarketStore
+from src.shadow_bookmaker.application.risk_desk import RiskDesk
 from src.shadow_bookmaker.infrastructure.database import DatabaseManager
-from src.shadow_bookmaker.infrastructure.bookmakers.mock_bookies import PinnacleMock
+from src.shadow_bookmaker.infrastructure.odds_history import OddsHistory
+from src.shadow_bookmaker.infrastructure.metrics import metrics
+from src.shadow_bookmaker.infrastructure.bookmakers.mock_bookies import PinnacleMock, ScraperMock, SimulatedBookmaker
 
 # 🔌 拔掉玩具插头，准备接入真实雷达！
 from src.shadow_bookmaker.infrastructure.bookmakers.the_odds_api import TheOddsAPIBookmaker
 from src.shadow_bookmaker.config import settings
 
 class BrokerOrchestrator:
-    def __init__(self):
+    def __init__(self, db_path: str = None):
         self.mapper = TeamMapper()
-        self.db = DatabaseManager()
-        self.ledger = GlobalLedger(self.db) 
-        self.risk_engine = RiskEngine(ledger=self.ledger, max_global_liability=30000.0)
+        # db_path 只给压测/演练用：指向临时库，不污染真实账本
+        self.db = DatabaseManager(db_path) if db_path else DatabaseManager()
+        self.ledger = self._open_ledger()
+        self.risk_engine = RiskEngine(ledger=self.ledger, max_global_liability=30000.0, max_snapshot_age=settings.MARKET_MAX_AGE)
+        # 🔒 风控台：场次锁 + 锁内推演/确权 (分片部署时每个分片进程各有一个)
+        self.desk = RiskDesk(self.db, self.ledger, self.risk_engine)
+        self.match_locks = self.desk.match_locks
         
-        # 智能双擎：有钥匙开超跑，没钥匙骑自行车
-        if settings.ODDS_API_KEY:
-            self.pinnacle = TheOddsAPIBookmaker(self.mapper)
-        else:
-            self.pinnacle = PinnacleMock(self.mapper)
+        # 智能双擎：有钥匙开超跑，没钥匙骑自行车 (配了 SIM_MATCHES 则骑合成盘口的测功机)
+        if settings.ODDS_API_KEY: sharp = TheOddsAPIBookmaker(self.mapper)
+        elif settings.SIM_MATCHES > 0: sharp = SimulatedBookmaker(self.mapper)
+        else: sharp = PinnacleMock(self.mapper)
+        # 📡 多源并发抓盘：Pinnacle 做风控锚点，其余庄家只用来比价套利
+        self.aggregator = OddsAggregator(sharp, [ScraperMock(self.mapper)])
+        # 🧩 增量行情库：按场次合并每轮结果，下游订阅 market.subscribe() 只处理变动的场次
+        self.market = MarketStore(sharp.name)
+        # 📈 赔率时间序列：每一次报价变动都追加进列式历史库 (盘口走势、收盘线、接单时的锚点价)
+        self.odds_history = OddsHistory(os.path.join(os.path.dirname(db_path), "odds_history")) if db_path else OddsHistory()
+        self.market.subscribe(self.odds_history.record)
             
-        # 🛡️ 架构师防御手段：60秒极速缓存墙
-        self._market_cache: Dict[str, OddsDTO] = {}
+        # 🛡️ 架构师防御手段：过期仍可读 (stale-while-revalidate) 缓存墙 + 单飞抓取
+        self._snapshot = MarketSnapshot()
+        self._market_cache: PriceTable = PriceTable({})
         self._last_fetch_time = 0
+        self._inflight: Optional[asyncio.Task] = None
+        self._refresher: Optional[asyncio.Task] = None
+        # 🎲 全书蒙特卡洛专用工作线程：大块 NumPy 运算释放 GIL，模拟再久也不卡进单
+        self._risk_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="portfolio-risk")
 
-    async def get_live_market(self, force_refresh=False) -> Dict[str, OddsDTO]:
-        """抓取外网数据（即使你1秒内点100次，它也只会在满60秒后才真正去外网抓取，其余时间读内存极速返回）"""
-        if force_refresh or not self._market_cache or (time.time() - self._last_fetch_time > 60):
-            odds_list = await self.pinnacle.fetch_odds()
-            if odds_list:
-                self._market_cache = {odds.match_id: odds for odds in odds_list}
-                self._last_fetch_time = time.time()
+    def _open_ledger(self) -> GlobalLedger:
+        return GlobalLedger(self.db)
+
+    @property
+    def pinnacle(self):
+        return self.aggregator.sharp
+
+    @pinnacle.setter
+    def pinnacle(self, bookmaker):
+        self.aggregator.sharp = bookmaker
+
+    async def start(self, background_refresh: bool = True):
+        """显式开启网络生命周期 (预热各数据源的共享连接池，并拉起后台刷新任务)"""
+        for source in self.aggregator.sources:
+            network = getattr(source, "network", None)
+            if network is not None: await network.start()
+        if background_refresh and (self._refresher is None or self._refresher.done()):
+            self._refresher = asyncio.create_task(self._refresh_forever())
+
+    async def aclose(self):
+        for task in (self._refresher, self._inflight):
+            if task is not None and not task.done() and task.get_loop() is asyncio.get_running_loop(): task.cancel()
+        self._refresher = self._inflight = None
+        await self.aggregator.aclose()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    @property
+    def snapshot_age(self) -> float:
+        """当前快照距上次成功抓取过去了多少秒 (从未抓到过则为无穷大)"""
+        return time.time() - self._last_fetch_time if self._last_fetch_time else float("inf")
+
+    def _exposed_matches(self) -> List[str]:
+        """有敞口 (逐腿边际视图里最坏盈亏为负) 的场次：串关的每条腿都决定它赔不赔，都要盯盘"""
+        return [m_id for m_id, worst in zip(self.ledger.match_ids, self.ledger.matrix.min(axis=1).tolist()) if worst < 0]
+
+    @metrics.timed("market.refresh")
+    async def _fetch_and_swap(self):
+        # 🔥 先把有敞口的场次告诉各数据源：分级轮询的源会优先、加倍刷新这些场次所在的联赛
+        try:
+            exposed = self._exposed_matches()
+        except Exception as e:
+            print(f"📡 敞口场次汇总失败，本轮按普通节奏刷新: {e}")
+            exposed = []
+        for source in self.aggregator.sources: source.watch(exposed)
+        snapshot = await self.aggregator.fetch()
+        self.market.set_sharp_bookmaker(snapshot.sharp_bookmaker)
+        # ⏳ 单场报价 TTL 跟着所在联赛的轮询间隔走：远期联赛半小时、三小时才刷一次，固定 TTL 会在下次刷新前就把它下架
+        ttls = {}
+        for source in self.aggregator.sources:
+            for m_id, ttl in source.quote_ttls().items(): ttls[m_id] = max(ttls.get(m_id, 0.0), ttl, self.market.default_ttl)
+        self.market.set_ttls(ttls)
+        self.market.apply((odds for quotes in snapshot.books.values() for odds in quotes.values()), failed_sources=snapshot.failed_sources)
+        self._snapshot = self.market.snapshot()
+        # 📐 定价表：每轮快照把全部场次的锚点赔率整列去水一次，之后每张单子每条腿只是查表
+        self._market_cache = PriceTable(self.market.sharp, settings.DEVIG_METHOD)
+        # 快照年龄以锚点庄家最近一次真正从源头抓到报价的时间为准 (数据源沿用缓存重放的报价不算)
+        quoted = self.market.last_quoted.get(snapshot.sharp_bookmaker)
+        if quoted: self._last_fetch_time = max(self._last_fetch_time, quoted)
+
+    def _refresh(self) -> asyncio.Task:
+        """单飞抓取：同一时刻最多一个外网请求在路上，并发调用方共享同一个任务，不重复烧额度"""
+        loop = asyncio.get_running_loop()
+        if self._inflight is None or self._inflight.done() or self._inflight.get_loop() is not loop:
+            self._inflight = loop.create_task(self._fetch_and_swap())
+        return self._inflight
+
+    def _next_refresh_in(self) -> float:
+        """下次后台刷新的等待秒数：默认软过期节奏，分级轮询的源有联赛提前到点就提前醒 (至少隔 1 秒)"""
+        hints = [h for h in (source.next_poll_in() for source in self.aggregator.sources) if h is not None]
+        return max(min([settings.MARKET_SOFT_TTL, *hints]), 1.0)
+
+    async def _refresh_forever(self):
+        while True:
+            await asyncio.sleep(self._next_refresh_in())
+            try: await asyncio.shield(self._refresh())
+            except asyncio.CancelledError: raise
+            except Exception as e: print(f"📡 后台刷新大盘失败: {e}")
+
+    async def get_market_snapshot(self, force_refresh=False) -> MarketSnapshot:
+        """读大盘快照：新鲜直接返回；过了软过期先返回旧快照、后台单飞刷新；过了硬过期或从未抓到才阻塞等待"""
+        age = self.snapshot_age
+        if force_refresh or not self._market_cache or age > settings.MARKET_MAX_AGE:
+            await asyncio.shield(self._refresh())
+        elif age > settings.MARKET_SOFT_TTL:
+            self._refresh()
+        return self._snapshot
+
+    async def get_live_market(self, force_refresh=False) -> PriceTable:
+        """风控锚点盘口 (match_id -> Pinnacle 报价，附整列去水概率的定价表)，与套利扫描共用同一份快照"""
+        await self.get_market_snapshot(force_refresh)
         return self._market_cache
+
+    async def scan_arbitrage(self, total_capital: float = 1000.0, top_n: int = None) -> List[ArbitrageOpportunity]:
+        """全市场套利扫描 (两项/三项盘)，按利润率排序"""
+        snapshot = await self.get_market_snapshot()
+        return ArbitrageScanner.scan(snapshot, total_capital, top_n=top_n)
         
+    async def simulate_portfolio_risk(self, n_scenarios: int = None, bankroll_limit: float = None, seed: Optional[int] = None) -> PortfolioRisk:
+        """全书蒙特卡洛：期望盈亏、VaR/CVaR、击穿资金红线的概率"""
+        market_data = await self.get_live_market()
+        # 在事件循环线程上拍下账本与盘口的私有副本，抽样结算丢给工作线程
+        simulator = PortfolioSimulator.from_ledger(self.ledger, market_data)
+        return await asyncio.get_running_loop().run_in_executor(self._risk_pool, simulator.run, n_scenarios, bankroll_limit, seed)
+
+    async def plan_hedges(self, limit: float = None) -> HedgePlan:
+        """全书对冲方案：把每场最坏盈亏压回红线 (缺省为风控的单场红线) 的最低成本对冲指令"""
+        market_data = await self.get_live_market()
+        optimizer = HedgeOptimizer.from_ledger(self.ledger, market_data)
+        limit = self.risk_engine.max_global_liability if limit is None else limit
+        return await asyncio.get_running_loop().run_in_executor(self._risk_pool, optimizer.run, limit)
+
+    @metrics.timed("orchestrator.evaluate")
     async def evaluate_incoming_tickets(self, tickets: List[CustomerTicket]) -> List[RiskDecision]:
+        """只裁决不入账 (预览)"""
+        market_data = await self.get_live_market()  # 可能要等外网，放在锁外
+        return await self.desk.evaluate(tickets, market_data, self.snapshot_age)
+
+    @metrics.timed("orchestrator.evaluate_and_commit")
+    async def evaluate_and_commit(self, tickets: List[CustomerTicket], durable: bool = False) -> List[RiskDecision]:
+        """裁决即入账：推演与确权在同一把场次锁里完成"""
         market_data = await self.get_live_market()
-        return [self.risk_engine.evaluate(ticket, market_data) for ticket in tickets]
+        return await self.desk.evaluate_and_commit(tickets, market_data, self.snapshot_age, durable=durable)
+
+    @metrics.timed("orchestrator.confirm")
+    async def confirm_decision(self, decision: RiskDecision, ticket: CustomerTicket, durable: bool = True) -> Tuple[bool, RiskDecision]:
+        """人工签字确权 (比较后提交)：与前台预览的裁决一致才入账，否则不入账并返回最新裁决，让操盘手按新条件重新确认"""
+        if decision.action == "REJECT": return False, decision
+        market_data = await self.get_live_market()
+        return await self.desk.confirm(decision, ticket, market_data, self.snapshot_age, durable=durable)
+
+    def commit_decision(self, decision: RiskDecision, ticket: CustomerTicket, durable: bool = False):
+        """durable=True 时阻塞到本单已 fsync 落盘 (调用方自己保证裁决后账本没被别人改过)"""
+        self.commit_decisions([(decision, ticket)], durable=durable)
+
+    def commit_decisions(self, pairs: List[Tuple[RiskDecision, CustomerTicket]], durable: bool = False):
+        """批量确权：N 张放行单的水位变动 + 订单流水在同一事务里原子提交，不会出现账本与流水对不上"""
+        self.desk.commit_decisions(pairs, durable=durable)
+
+    async def acommit_decisions(self, pairs: List[Tuple[RiskDecision, CustomerTicket]], durable: bool = False):
+        """commit_decisions 的异步版：攥着涉及场次的锁入账，不和在途的裁决交错"""
+        await self.desk.commit(pairs, durable=durable)
+
+    def sharp_price_at(self, match_id: str, ts: float) -> Optional[OddsDTO]:
+        """ts 时刻 (unix 秒) 风控锚点庄家对该场的报价 (如接单那一刻的 Pinnacle 价)"""
+        return self.odds_history.as_of(match_id, self.market.sharp_bookmaker, ts)
+
+    async def exposure_frame(self) -> pd.DataFrame:
+        """全书 (场次 × 主/客/平) 盈亏表的副本 (联合视图，串关只算一次)"""
+        return self.ledger.to_frame().copy()
+
+    async def exposure_as_of(self, ts: float) -> pd.DataFrame:
+        """历史回溯：按账本事件流水重建 ts 时刻 (unix 秒) 的全书盈亏表 (分片部署共用同一个库，无需分发)"""
+        states = await asyncio.to_thread(self.db.ledger_as_of, ts)
+        parlays = await asyncio.to_thread(self.db.parlays_as_of, ts)
+        return GlobalLedger.from_rows({m_id: [st[o] for o in OUTCOMES] for m_id, st in states.items()},
+                                      [(t_id, [(m_id, OUTCOMES.index(sel)) for m_id, sel in legs], stake, liability) for t_id, legs, stake, liability in parlays]).to_frame().copy()
+
+    async def lock_stats(self) -> dict:
+        """场次锁等锁埋点 (分片部署时汇总各分片)"""
+        locks = self.match_locks.stats
+        return {**locks, "stripes": len(self.match_locks), "wait_mean": locks["wait_total"] / locks["acquired"] if locks["acquired"] else 0.0}
+
+    async def metrics_snapshot(self) -> dict:
+        """分环节耗时直方图 (分片部署时汇总各分片)，交给 metrics.summary / metrics.prometheus 出报表"""
+        return metrics.snapshot()
+
+    async def awipe_all_data(self):
+        """清库 (攥住全部场次锁，不和在途的确权交错)"""
+        async with self.match_locks.hold_all():
+            await asyncio.to_thread(self.db.clear_all)  # 同步等落盘，别卡住事件循环
+            self.ledger.clear()
 
-    def commit_decision(self, decision: RiskDecision, ticket: CustomerTicket):
-        if decision.action in ["ACCEPT_B_BOOK", "ACCEPT_PARTIAL_HEDGE", "ACCEPT_A_BOOK_HEDGE"]:
-            self.ledger.commit_bet(decision.danger_match_id, decision.danger_selection, decision.retained_stake, decision.retained_liability)
-            self.db.save_ticket(ticket.ticket_id, ticket.ticket_type, ticket.stake, decision.action, decision.retained_liability, decision.hedge_stake, decision.danger_match_id, decision.danger_selection)
-            
     def wipe_all_data(self):
         self.db.clear_all()
-        self.ledger.pl_states.clear()
\ No newline at end of file
+        self.ledger.clear()
\ No newline at end of file
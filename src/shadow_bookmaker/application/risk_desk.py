@@ -0,0 +1,89 @@
+import asyncio
+from typing import Dict, List, Tuple
+from src.shadow_bookmaker.domain.models import CustomerTicket, RiskDecision, OddsDTO
+from src.shadow_bookmaker.domain.ledger import GlobalLedger
+from src.shadow_bookmaker.domain.risk_engine import RiskEngine
+from src.shadow_bookmaker.application.match_locks import MatchLocks
+from src.shadow_bookmaker.infrastructure.database import DatabaseManager
+from src.shadow_bookmaker.infrastructure.metrics import metrics
+
+_ACCEPTED = ("ACCEPT_B_BOOK", "ACCEPT_PARTIAL_HEDGE", "ACCEPT_A_BOOK_HEDGE")
+
+def touched_matches(tickets: List[CustomerTicket]) -> List[str]:
+    return [leg.match_id for t in tickets for leg in t.legs]
+
+def same_terms(a: RiskDecision, b: RiskDecision) -> bool:
+    """两份裁决的入账条款是否一致 (动作、对冲量、截留部分、危险腿)"""
+    return (a.action, a.hedge_stake, a.retained_stake, a.retained_liability, a.danger_match_id, a.danger_selection) == \
+           (b.action, b.hedge_stake, b.retained_stake, b.retained_liability, b.danger_match_id, b.danger_selection)
+
+def ledger_entries(pairs: List[Tuple[RiskDecision, CustomerTicket]]) -> Tuple[list, list, list]:
+    """把放行单翻译成 (边际记账, 订单流水, 串关簿) 三份记录；边际记账每行 (match_id, selection, stake, liability, ticket_id)"""
+    accepted = [(d, t) for d, t in pairs if d.action in _ACCEPTED]
+    bets, parlays = [], []
+    for d, t in accepted:
+        if len(t.legs) > 1:
+            # 串关：全额进簿，每条腿都记一次边际盈亏，联合结构另存进串关簿 (危险腿排第一当锚腿，联合视图里负债只记在它身上)；
+            # 对冲是危险腿上的一笔外盘单关 (只要危险腿打出就赢)，按一笔反向单关记在危险腿所在的场次
+            bets.extend((leg.match_id, leg.selection, t.stake, t.liability, t.ticket_id) for leg in t.legs)
+            legs = sorted(((leg.match_id, leg.selection) for leg in t.legs), key=lambda leg: leg != (d.danger_match_id, d.danger_selection))
+            parlays.append((t.ticket_id, legs, t.stake, t.liability))
+            if d.hedge_stake > 0: bets.append((d.danger_match_id, d.danger_selection, -d.hedge_stake, -(d.hedge_stake * (d.hedge_odds - 1.0)), t.ticket_id))
+        else:
+            bets.append((d.danger_match_id, d.danger_selection, d.retained_stake, d.retained_liability, t.ticket_id))
+    rows = [(t.ticket_id, t.ticket_type, t.stake, d.action, d.retained_liability, d.hedge_stake, d.danger_match_id, d.danger_selection) for d, t in accepted]
+    return bets, rows, parlays
+
+class RiskDesk:
+    """风控台：一本账 + 风控引擎 + 场次锁，负责"锁内推演 → 确权入账"。
+
+    单进程部署时由 BrokerOrchestrator 持有整本账；分片部署时每个分片进程各持有一个，只管自己那段 match_id。
+    盘口由调用方传进来，风控台自己不碰外网。
+    """
+    def __init__(self, db: DatabaseManager, ledger: GlobalLedger, risk_engine: RiskEngine, match_locks: MatchLocks = None):
+        self.db = db
+        self.ledger = ledger
+        self.risk_engine = risk_engine
+        # 🔒 场次分条锁：沙盘推演到确权入账全程攥着本单涉及场次的锁，同场并发单子不会拿旧水位各自过红线
+        self.match_locks = match_locks or MatchLocks()
+
+    async def evaluate(self, tickets: List[CustomerTicket], market_data: Dict[str, OddsDTO], snapshot_age: float) -> List[RiskDecision]:
+        """只裁决不入账 (预览)；等同场正在入账的批次落完盘再读水位"""
+        async with self.match_locks.hold(touched_matches(tickets)):
+            # 洪峰进单走批量通道：同场单子按进单顺序串行占用水位，结果与逐张 evaluate + commit 完全一致
+            return self.risk_engine.evaluate_batch(tickets, market_data, snapshot_age=snapshot_age)
+
+    async def evaluate_and_commit(self, tickets: List[CustomerTicket], market_data: Dict[str, OddsDTO], snapshot_age: float, durable: bool = False) -> List[RiskDecision]:
+        """裁决即入账：推演与确权在同一把场次锁里完成，放行的单子按裁决原样记账"""
+        async with self.match_locks.hold(touched_matches(tickets)):
+            decisions = self.risk_engine.evaluate_batch(tickets, market_data, snapshot_age=snapshot_age)
+            await self._acommit(list(zip(decisions, tickets)), durable)
+        return decisions
+
+    async def confirm(self, decision: RiskDecision, ticket: CustomerTicket, market_data: Dict[str, OddsDTO], snapshot_age: float, durable: bool = True) -> Tuple[bool, RiskDecision]:
+        """比较后提交：锁住本单涉及的场次按当前账本重新裁决，与预览一致才入账，否则返回最新裁决"""
+        if decision.action == "REJECT": return False, decision
+        async with self.match_locks.hold(touched_matches([ticket])):
+            fresh = self.risk_engine.evaluate_batch([ticket], market_data, snapshot_age=snapshot_age)[0]
+            if not same_terms(decision, fresh): return False, fresh
+            await self._acommit([(fresh, ticket)], durable)
+        return True, fresh
+
+    async def commit(self, pairs: List[Tuple[RiskDecision, CustomerTicket]], durable: bool = False):
+        """按给定裁决原样入账 (不重新裁决)，等同场在途的批次落完盘再记"""
+        async with self.match_locks.hold(touched_matches([t for _, t in pairs])):
+            await self._acommit(pairs, durable)
+
+    def commit_decisions(self, pairs: List[Tuple[RiskDecision, CustomerTicket]], durable: bool = False):
+        """同步批量确权 (不加锁：调用方自己保证裁决后账本没被别人改过)"""
+        bets, rows, parlays = ledger_entries(pairs)
+        if rows: self.ledger.commit_bets(bets, rows, durable=durable, parlays=parlays)
+
+    @metrics.timed("desk.commit")
+    async def _acommit(self, pairs: List[Tuple[RiskDecision, CustomerTicket]], durable: bool):
+        """commit_decisions 的锁内异步版：事务在工作线程里等提交，事件循环照常处理其他场次的单子"""
+        bets, rows, parlays = ledger_entries(pairs)
+        if not rows: return
+        new_states = self.ledger.stage_bets(bets)
+        await asyncio.to_thread(self.db.save_decisions, new_states, rows, durable, parlays, bets)
+        self.ledger.apply_states(new_states, parlays)
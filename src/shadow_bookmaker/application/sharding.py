@@ -0,0 +1,401 @@
+"""分片部署：N 个风控工作进程各管一段 match_id (CRC32 取模)，路由进程负责抓盘、分发与跨分片串关。
+
+每个分片进程持有自己那段场次的 GlobalLedger 行、RiskEngine 和场次锁，启动时只从 SQLite 恢复归自己管的行，
+所以单关和同分片串关的推演/确权完全在分片内完成，不同分片跑在不同的核上互不抢 GIL。
+跨分片串关走两阶段：按分片编号升序逐个"预留"涉及的场次 (分片攥住场次锁并交出当前水位)，
+路由在草稿账本上裁决，整单在一个 SQLite 事务里落盘，再通知各分片把新水位换进内存并释放锁。
+SQLite 始终是权威：分片进程挂了会被拉起，重新从库里恢复自己那段账。
+"""
+import asyncio
+import atexit
+import itertools
+import multiprocessing
+import threading
+import time
+import zlib
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+import pandas as pd
+from src.shadow_bookmaker.domain.models import CustomerTicket, RiskDecision, OddsDTO, PortfolioRisk, HedgePlan
+from src.shadow_bookmaker.domain.ledger import GlobalLedger
+from src.shadow_bookmaker.domain.risk_engine import RiskEngine
+from src.shadow_bookmaker.domain.portfolio_sim import PortfolioSimulator
+from src.shadow_bookmaker.domain.hedge_optimizer import HedgeOptimizer
+from src.shadow_bookmaker.domain.devig import PriceTable
+from src.shadow_bookmaker.application.risk_desk import RiskDesk, ledger_entries, same_terms
+from src.shadow_bookmaker.application.orchestrator import BrokerOrchestrator
+from src.shadow_bookmaker.infrastructure.database import DatabaseManager
+from src.shadow_bookmaker.infrastructure.metrics import metrics
+from src.shadow_bookmaker.config import settings
+
+class ShardUnavailable(RuntimeError):
+    """分片进程中途退出 (路由会自动把它重新拉起)"""
+
+def shard_of(match_id: str, n_shards: int) -> int:
+    # 与 MatchLocks 同一个哈希：CRC32 跨进程稳定，内置 hash() 每个进程随机加盐
+    return zlib.crc32(match_id.encode("utf-8")) % n_shards
+
+def _portable(odds) -> OddsDTO:
+    # 惰性报价视图 (OddsView) 引用整批列数据，跨进程前换成独立的小对象
+    return odds.to_dto() if hasattr(odds, "to_dto") else odds
+
+# ----------------------------------------------------------------------
+# 分片进程
+# ----------------------------------------------------------------------
+class ShardWorker:
+    """分片进程里的请求处理器：一个 RiskDesk + 跨分片串关的场次预留表"""
+    def __init__(self, desk: RiskDesk):
+        self.desk = desk
+        self._reservations: Dict[int, object] = {}  # 预留号 -> 已进入的场次锁上下文
+
+    async def evaluate(self, tickets: List[CustomerTicket], market_data: Dict[str, OddsDTO], snapshot_age: float, commit: bool, durable: bool) -> List[RiskDecision]:
+        if commit: return await self.desk.evaluate_and_commit(tickets, market_data, snapshot_age, durable=durable)
+        return await self.desk.evaluate(tickets, market_data, snapshot_age)
+
+    async def confirm(self, decision: RiskDecision, ticket: CustomerTicket, market_data: Dict[str, OddsDTO], snapshot_age: float, durable: bool) -> Tuple[bool, RiskDecision]:
+        return await self.desk.confirm(decision, ticket, market_data, snapshot_age, durable=durable)
+
+    async def commit(self, pairs: List[Tuple[RiskDecision, CustomerTicket]], durable: bool):
+        await self.desk.commit(pairs, durable=durable)
+
+    async def reserve(self, res_id: int, match_ids: Optional[List[str]]) -> Dict[str, List[float]]:
+        """第一阶段：攥住这些场次 (None = 全部) 的锁直到 apply/release，返回它们当前的水位"""
+        hold = self.desk.match_locks.hold_all() if match_ids is None else self.desk.match_locks.hold(match_ids)
+        await hold.__aenter__()
+        self._reservations[res_id] = hold
+        return {m_id: self.desk.ledger.state_row(m_id).tolist() for m_id in match_ids or ()}
+
+    async def apply(self, res_id: int, new_states: Dict[str, Dict[str, float]], parlays: List[tuple]):
+        """第二阶段：路由已把整单落盘，把新水位 (与串关) 换进内存并释放预留"""
+        try: self.desk.ledger.apply_states(new_states, parlays)
+        finally: await self.release(res_id)
+
+    async def clear(self, res_id: int):
+        """清库的内存部分 (路由已清空 SQLite)，之后释放全部锁"""
+        try: self.desk.ledger.clear()
+        finally: await self.release(res_id)
+
+    async def release(self, res_id: int):
+        hold = self._reservations.pop(res_id, None)
+        if hold is not None: await hold.__aexit__(None, None, None)
+
+    async def exposure(self) -> Tuple[List[str], list, list]:
+        ledger = self.desk.ledger
+        return ledger.match_ids, ledger.matrix.copy(), ledger.parlays.items()
+
+    async def lock_stats(self) -> dict:
+        return dict(self.desk.match_locks.stats)
+
+    async def metrics_snapshot(self) -> dict:
+        return metrics.snapshot()
+
+def _pump(conn, loop: asyncio.AbstractEventLoop, inbox: asyncio.Queue):
+    """收信线程：阻塞读管道，把请求转进事件循环 (管道断开时投递 None 收工)"""
+    while True:
+        try: msg = conn.recv()
+        except (EOFError, OSError): msg = None
+        loop.call_soon_threadsafe(inbox.put_nowait, msg)
+        if msg is None: return
+
+async def _serve_shard(shard_id: int, n_shards: int, db_path: Optional[str], max_liability: float, conn):
+    db = DatabaseManager(db_path) if db_path else DatabaseManager()
+    # 🔁 重启恢复：只从 SQLite 里捞归本分片管的场次
+    ledger = GlobalLedger(db, owns=lambda m_id: shard_of(m_id, n_shards) == shard_id)
+    worker = ShardWorker(RiskDesk(db, ledger, RiskEngine(ledger, max_global_liability=max_liability, max_snapshot_age=settings.MARKET_MAX_AGE)))
+    inbox: asyncio.Queue = asyncio.Queue()
+    threading.Thread(target=_pump, args=(conn, asyncio.get_running_loop(), inbox), name=f"shard-{shard_id}-inbox", daemon=True).start()
+
+    async def handle(req_id: int, op: str, args: tuple):
+        try: reply = (req_id, True, await getattr(worker, op)(*args))
+        except Exception as e: reply = (req_id, False, e)
+        try: conn.send(reply)
+        except Exception as e: conn.send((req_id, False, RuntimeError(f"分片 {shard_id} 回包失败: {e!r}")))  # 结果或异常本身无法序列化
+
+    tasks = set()
+    while (msg := await inbox.get()) is not None:
+        task = asyncio.create_task(handle(*msg))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    for task in list(tasks): task.cancel()
+    db.close()
+
+def _shard_main(shard_id: int, n_shards: int, db_path: Optional[str], max_liability: float, conn):
+    asyncio.run(_serve_shard(shard_id, n_shards, db_path, max_liability, conn))
+
+# ----------------------------------------------------------------------
+# 路由进程
+# ----------------------------------------------------------------------
+class ShardRouter(BrokerOrchestrator):
+    """分片模式的编排器：对外接口与 BrokerOrchestrator 一致 (进单服务/API 无需区分)，
+    抓盘与快照仍在本进程，风控与账本交给按 match_id 分片的工作进程"""
+    def __init__(self, n_shards: int = None, db_path: str = None):
+        self.n_shards = settings.SHARD_COUNT if n_shards is None else n_shards
+        if self.n_shards < 1: raise ValueError("分片数至少为 1")
+        self.db_path = db_path
+        super().__init__(db_path)
+        self._ctx = multiprocessing.get_context("spawn")
+        self._procs: List = [None] * self.n_shards
+        self._conns: List = [None] * self.n_shards
+        self._spawned_at: List[float] = [0.0] * self.n_shards
+        self._pending: Dict[int, Tuple[int, asyncio.Future]] = {}  # 请求号 -> (分片, 等回包的 future)
+        self._req_ids = itertools.count()
+        self._res_ids = itertools.count()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._closing = False
+        self._exposed: List[str] = []  # 上一轮刷新前从各分片汇总出的敞口场次
+
+    def _open_ledger(self) -> GlobalLedger:
+        # 权威账本在各分片进程里，路由只留一本空草稿
+        return GlobalLedger(None)
+
+    def shard_of(self, match_id: str) -> int:
+        return shard_of(match_id, self.n_shards)
+
+    # ---------------- 进程生命周期 ----------------
+    def _spawn(self, k: int):
+        parent, child = self._ctx.Pipe()
+        proc = self._ctx.Process(target=_shard_main, args=(k, self.n_shards, self.db_path, self.risk_engine.max_global_liability, child),
+                                 name=f"risk-shard-{k}", daemon=True)
+        proc.start()
+        child.close()
+        self._procs[k], self._conns[k], self._spawned_at[k] = proc, parent, time.monotonic()
+        threading.Thread(target=self._listen, args=(k, parent), name=f"shard-{k}-replies", daemon=True).start()
+
+    def _listen(self, k: int, conn):
+        """回包线程：阻塞读管道，把结果转回事件循环；管道断开说明分片进程没了"""
+        while True:
+            try: msg = conn.recv()
+            except (EOFError, OSError): msg = None
+            try:
+                if msg is None: self._loop.call_soon_threadsafe(self._on_exit, k, conn)
+                else: self._loop.call_soon_threadsafe(self._resolve, *msg)
+            except RuntimeError: return  # 事件循环已关闭
+            if msg is None: return
+
+    def _resolve(self, req_id: int, ok: bool, payload):
+        _, fut = self._pending.pop(req_id, (None, None))
+        if fut is None or fut.done(): return
+        if ok: fut.set_result(payload)
+        else: fut.set_exception(payload)
+
+    def _on_exit(self, k: int, conn):
+        if self._conns[k] is not conn: return  # 已经换成新进程了
+        for req_id, (shard, fut) in list(self._pending.items()):
+            if shard != k: continue
+            del self._pending[req_id]
+            if not fut.done(): fut.set_exception(ShardUnavailable(f"分片 {k} 进程已退出"))
+        if self._closing: return
+        # 刚拉起就退出 (启动即崩) 不再原地重试，免得死循环刷进程
+        if time.monotonic() - self._spawned_at[k] < settings.SHARD_RESPAWN_MIN_UPTIME:
+            print(f"🧩 分片 {k} 启动后 {settings.SHARD_RESPAWN_MIN_UPTIME:.0f} 秒内就退出，放弃重启")
+            return
+        print(f"🧩 分片 {k} 进程退出，重新拉起并从 SQLite 恢复")
+        self._spawn(k)
+
+    async def start(self, background_refresh: bool = True):
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+            # 解释器退出时 multiprocessing 会先杀掉守护子进程：提前标记收工，别把它们当成崩溃又拉起来
+            atexit.register(setattr, self, "_closing", True)
+            for k in range(self.n_shards): self._spawn(k)
+        await super().start(background_refresh)
+
+    async def aclose(self):
+        self._closing = True
+        for conn in self._conns:
+            if conn is None: continue
+            try: conn.send(None)  # 分片收到 None 就收工退出
+            except OSError: pass
+        for proc, conn in zip(self._procs, self._conns):
+            if proc is None: continue
+            await asyncio.to_thread(proc.join, 5.0)
+            if proc.is_alive(): proc.terminate()
+            conn.close()
+        await super().aclose()
+
+    async def _call(self, k: int, op: str, *args):
+        if self._loop is None: raise RuntimeError("分片路由未启动 (先 await start())")
+        req_id = next(self._req_ids)
+        fut = self._loop.create_future()
+        self._pending[req_id] = (k, fut)
+        try: self._conns[k].send((req_id, op, args))
+        except OSError as e:
+            self._pending.pop(req_id, None)
+            raise ShardUnavailable(f"分片 {k} 不可用: {e!r}") from e
+        return await fut
+
+    # ---------------- 风控 ----------------
+    def _market_for(self, market_data: PriceTable, tickets: List[CustomerTicket]) -> PriceTable:
+        # 从快照定价表里切出这批单子涉及的行下发 (分片不再重复去水)
+        return market_data.subset((leg.match_id for t in tickets for leg in t.legs), _portable)
+
+    async def _dispatch(self, tickets: List[CustomerTicket], commit: bool, durable: bool) -> List[RiskDecision]:
+        """按进单顺序分段：段内单分片的单子按分片并行下发，遇到跨分片串关先把前面的段跑完再单独两阶段处理"""
+        market_data = await self.get_live_market()
+        age = self.snapshot_age
+        decisions: List[Optional[RiskDecision]] = [None] * len(tickets)
+        segment: Dict[int, List[int]] = defaultdict(list)
+
+        async def flush():
+            shards = list(segment.items())
+            segment.clear()
+            results = await asyncio.gather(*[
+                self._call(k, "evaluate", [tickets[i] for i in idx], self._market_for(market_data, [tickets[i] for i in idx]), age, commit, durable)
+                for k, idx in shards])
+            for (_, idx), shard_decisions in zip(shards, results):
+                for i, d in zip(idx, shard_decisions): decisions[i] = d
+
+        for i, t in enumerate(tickets):
+            owners = {self.shard_of(leg.match_id) for leg in t.legs}
+            if len(owners) == 1:
+                segment[owners.pop()].append(i)
+                continue
+            if segment: await flush()
+            decisions[i] = (await self._two_phase(t, market_data, age, commit, durable))[1]
+        if segment: await flush()
+        return decisions
+
+    async def _two_phase(self, ticket: CustomerTicket, market_data: Dict[str, OddsDTO], age: float, commit: bool, durable: bool,
+                         expected: RiskDecision = None, decided: RiskDecision = None) -> Tuple[bool, RiskDecision]:
+        """跨分片串关：预留 → 草稿裁决 → 整单落盘 → 各分片换入新水位 (任何一步失败都释放已预留的分片)；
+        给了 decided 就跳过裁决，按它原样入账"""
+        by_shard: Dict[int, List[str]] = defaultdict(list)
+        for leg in ticket.legs: by_shard[self.shard_of(leg.match_id)].append(leg.match_id)
+        res_id = next(self._res_ids)
+        reserved: List[int] = []
+        try:
+            rows: Dict[str, List[float]] = {}
+            # 全局按分片编号升序预留，分片内再按锁条升序加锁 —— 并发的跨分片串关之间不会死锁
+            for k in sorted(by_shard):
+                reserved.append(k)
+                rows.update(await self._call(k, "reserve", res_id, by_shard[k]))
+            scratch = GlobalLedger.from_rows(rows)
+            engine = RiskEngine(scratch, self.risk_engine.max_global_liability, self.risk_engine.min_house_edge, self.risk_engine.max_snapshot_age)
+            decision = decided or engine.evaluate_batch([ticket], market_data, snapshot_age=age)[0]
+            if expected is not None and not same_terms(expected, decision): return False, decision
+            bets, db_rows, parlays = ledger_entries([(decision, ticket)])
+            if not commit or not db_rows: return False, decision
+            new_states = scratch.stage_bets(bets)
+            await asyncio.to_thread(self.db.save_decisions, new_states, db_rows, durable, parlays, bets)
+            # 已落盘：此后就算某个分片挂了，它重启时也会从库里读到这单
+            done, reserved = reserved, []
+            results = await asyncio.gather(*[self._call(k, "apply", res_id, {m: s for m, s in new_states.items() if self.shard_of(m) == k}, parlays) for k in done],
+                                           return_exceptions=True)
+            for k, r in zip(done, results):
+                if isinstance(r, Exception): print(f"🧩 分片 {k} 换入串关 {ticket.ticket_id} 失败 (库里已入账，分片重启后恢复): {r!r}")
+            return True, decision
+        finally:
+            if reserved: await asyncio.gather(*[self._call(k, "release", res_id) for k in reserved], return_exceptions=True)
+
+    async def evaluate_incoming_tickets(self, tickets: List[CustomerTicket]) -> List[RiskDecision]:
+        """只裁决不入账 (预览)；跨分片串关只看已入账的水位，看不到同一批里排在它前面的预览单"""
+        return await self._dispatch(tickets, commit=False, durable=False)
+
+    async def evaluate_and_commit(self, tickets: List[CustomerTicket], durable: bool = False) -> List[RiskDecision]:
+        return await self._dispatch(tickets, commit=True, durable=durable)
+
+    async def confirm_decision(self, decision: RiskDecision, ticket: CustomerTicket, durable: bool = True) -> Tuple[bool, RiskDecision]:
+        if decision.action == "REJECT": return False, decision
+        market_data = await self.get_live_market()
+        owners = {self.shard_of(leg.match_id) for leg in ticket.legs}
+        if len(owners) == 1:
+            return tuple(await self._call(owners.pop(), "confirm", decision, ticket, self._market_for(market_data, [ticket]), self.snapshot_age, durable))
+        return await self._two_phase(ticket, market_data, self.snapshot_age, True, durable, expected=decision)
+
+    async def acommit_decisions(self, pairs: List[Tuple[RiskDecision, CustomerTicket]], durable: bool = False):
+        """按给定裁决原样入账：单分片的单子按分片成批下发，跨分片串关按进单顺序逐张两阶段入账"""
+        segment: Dict[int, list] = defaultdict(list)
+
+        async def flush():
+            shards = list(segment.items())
+            segment.clear()
+            await asyncio.gather(*[self._call(k, "commit", part, durable) for k, part in shards])
+
+        for decision, ticket in pairs:
+            if decision.action == "REJECT": continue
+            owners = {self.shard_of(leg.match_id) for leg in ticket.legs}
+            if len(owners) == 1:
+                segment[owners.pop()].append((decision, ticket))
+                continue
+            if segment: await flush()
+            await self._two_phase(ticket, {}, 0.0, True, durable, decided=decision)
+        if segment: await flush()
+
+    def commit_decisions(self, pairs: List[Tuple[RiskDecision, CustomerTicket]], durable: bool = False):
+        """同步入口 (给不在事件循环里的调用方)：转交路由的事件循环，阻塞到各分片都入完账"""
+        self._blocking(self.acommit_decisions(pairs, durable=durable))
+
+    def _blocking(self, coro):
+        """从别的线程把协程投进路由的事件循环并等结果；在事件循环线程里同步等待会卡死自己，直接报错"""
+        try: running = asyncio.get_running_loop()
+        except RuntimeError: running = None
+        if self._loop is None or running is self._loop:
+            coro.close()
+            raise RuntimeError("分片路由未启动" if self._loop is None else "事件循环里请直接 await 异步版本 (acommit_decisions / awipe_all_data)")
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    # ---------------- 全书视图 ----------------
+    async def _gather_book(self) -> GlobalLedger:
+        """把各分片的账拼成一本草稿账 (跨分片串关在每个涉及的分片里都有一份，按 ticket_id 去重)"""
+        parts = await asyncio.gather(*[self._call(k, "exposure") for k in range(self.n_shards)])
+        rows, parlays = {}, {}
+        for match_ids, matrix, shard_parlays in parts:
+            rows.update(zip(match_ids, matrix.tolist()))
+            for p in shard_parlays: parlays[p[0]] = p
+        return GlobalLedger.from_rows(rows, list(parlays.values()))
+
+    def _exposed_matches(self) -> List[str]:
+        return self._exposed
+
+    async def _fetch_and_swap(self):
+        # 分片的账在子进程里，只能异步汇总：刷新前先把敞口场次算好缓存起来，基类按同步接口读缓存
+        try:
+            book = await self._gather_book()
+        except Exception as e:
+            print(f"📡 分片账汇总失败，本轮沿用上次的敞口场次: {e}")
+        else:
+            self._exposed = [m_id for m_id, worst in zip(book.match_ids, book.matrix.min(axis=1).tolist()) if worst < 0]
+        await super()._fetch_and_swap()
+
+    async def exposure_frame(self) -> pd.DataFrame:
+        return (await self._gather_book()).to_frame().copy()
+
+    async def simulate_portfolio_risk(self, n_scenarios: int = None, bankroll_limit: float = None, seed: Optional[int] = None) -> PortfolioRisk:
+        market_data = await self.get_live_market()
+        simulator = PortfolioSimulator.from_ledger(await self._gather_book(), market_data)
+        return await asyncio.get_running_loop().run_in_executor(self._risk_pool, simulator.run, n_scenarios, bankroll_limit, seed)
+
+    async def plan_hedges(self, limit: float = None) -> HedgePlan:
+        market_data = await self.get_live_market()
+        optimizer = HedgeOptimizer.from_ledger(await self._gather_book(), market_data)
+        limit = self.risk_engine.max_global_liability if limit is None else limit
+        return await asyncio.get_running_loop().run_in_executor(self._risk_pool, optimizer.run, limit)
+
+    async def lock_stats(self) -> dict:
+        parts = await asyncio.gather(*[self._call(k, "lock_stats") for k in range(self.n_shards)])
+        total = {"acquired": sum(p["acquired"] for p in parts), "contended": sum(p["contended"] for p in parts),
+                 "wait_total": sum(p["wait_total"] for p in parts), "wait_max": max(p["wait_max"] for p in parts)}
+        return {**total, "stripes": len(self.match_locks) * self.n_shards, "shards": self.n_shards,
+                "wait_mean": total["wait_total"] / total["acquired"] if total["acquired"] else 0.0}
+
+    async def metrics_snapshot(self) -> dict:
+        # 路由自己 (抓盘、跨分片串关) 的直方图 + 各分片进程的，按环节合并
+        parts = await asyncio.gather(*[self._call(k, "metrics_snapshot") for k in range(self.n_shards)])
+        return {stage: h.to_dict() for stage, h in metrics.combine(metrics.snapshot(), *parts).items()}
+
+    async def awipe_all_data(self):
+        """清库：先攥住所有分片的全部场次锁，清空 SQLite，再让各分片清内存并放锁"""
+        res_id = next(self._res_ids)
+        reserved: List[int] = []
+        try:
+            for k in range(self.n_shards):
+                reserved.append(k)
+                await self._call(k, "reserve", res_id, None)
+            await asyncio.to_thread(self.db.clear_all)
+            done, reserved = reserved, []
+            await asyncio.gather(*[self._call(k, "clear", res_id) for k in done])
+        finally:
+            if reserved: await asyncio.gather(*[self._call(k, "release", res_id) for k in reserved], return_exceptions=True)
+
+    def wipe_all_data(self):
+        self._blocking(self.awipe_all_data())
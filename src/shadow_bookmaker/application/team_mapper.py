@@ -1,23 +1,100 @@
+import atexit
 import json
 import os
+import time
+import threading
+from collections import Counter, OrderedDict, defaultdict
+from typing import Dict, List, Set
 from thefuzz import process
 from src.shadow_bookmaker.config import settings
+from src.shadow_bookmaker.infrastructure.metrics import metrics
+
+def _trigrams(name: str) -> Set[str]:
+    s = f"  {name.lower().strip()} "
+    return {s[i:i + 3] for i in range(len(s) - 2)}
 
 class TeamMapper:
-    """防腐层：把万国牌名字洗成标准拼写"""
-    def __init__(self):
-        self.mapping = {}
-        if os.path.exists(settings.TEAM_MAPPING_PATH):
-            with open(settings.TEAM_MAPPING_PATH, 'r', encoding='utf-8') as f:
+    """防腐层：把万国牌名字洗成标准拼写
+
+    精确字典命中 -> LRU 缓存命中 -> 三元组倒排索引粗筛出少量候选 -> thefuzz 精排。
+    高置信度的模糊结果会作为别名回写 team_mapping.json，下次就是精确命中。
+    """
+    def __init__(self, mapping_path: str = None):
+        self.mapping_path = mapping_path or settings.TEAM_MAPPING_PATH
+        self.mapping: Dict[str, str] = {}
+        if os.path.exists(self.mapping_path):
+            with open(self.mapping_path, 'r', encoding='utf-8') as f:
                 self.mapping = json.load(f)
-        self.standard_names = list(set(self.mapping.values())) if self.mapping else []
-        
+        self.standard_names: List[str] = []
+        self._standard_set: Set[str] = set()
+        self._index: Dict[str, List[int]] = defaultdict(list)  # 三元组 -> 标准名下标
+        for name in set(self.mapping.values()): self._add_standard(name)
+
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._last_save = float("-inf")
+        atexit.register(self.save)
+
+    def _add_standard(self, name: str):
+        if name in self._standard_set: return
+        idx = len(self.standard_names)
+        self.standard_names.append(name)
+        self._standard_set.add(name)
+        for g in _trigrams(name): self._index[g].append(idx)
+
+    def _candidates(self, raw_name: str) -> List[str]:
+        """倒排索引粗筛：按共享三元组个数取前 N 名，跳过烂大街的三元组 (如 ' fc')，保证耗时不随字典膨胀"""
+        votes: Counter = Counter()
+        for g in _trigrams(raw_name):
+            postings = self._index.get(g)
+            if postings and len(postings) <= settings.TEAM_INDEX_MAX_POSTINGS: votes.update(postings)
+        return [self.standard_names[i] for i, _ in votes.most_common(settings.TEAM_FUZZY_CANDIDATES)]
+
     def standardize(self, raw_name: str) -> str:
         if not raw_name: return "Unknown"
         if raw_name in self.mapping: return self.mapping[raw_name]
-        
-        if self.standard_names:
-            best_match, score = process.extractOne(raw_name, self.standard_names)
-            if score >= 85: return best_match # 模糊匹配兜底
-            
-        return raw_name
\ No newline at end of file
+        if raw_name in self._standard_set: return raw_name
+
+        with self._lock:
+            if raw_name in self._cache:
+                self._cache.move_to_end(raw_name)
+                return self._cache[raw_name]
+
+        # ⏱️ 只给慢路径 (粗筛 + 精排) 计时：精确命中就是一次字典查找，打点比它本身还贵，其耗时算在 odds.parse 里
+        result = raw_name
+        with metrics.span("mapper.fuzzy_match"):
+            candidates = self._candidates(raw_name)
+            if candidates:
+                best_match, score = process.extractOne(raw_name, candidates)
+                if score >= settings.TEAM_FUZZY_THRESHOLD: result = best_match # 模糊匹配兜底
+                if score >= settings.TEAM_LEARN_THRESHOLD: self.learn_alias(raw_name, best_match)
+
+        with self._lock:
+            self._cache[raw_name] = result
+            if len(self._cache) > settings.TEAM_CACHE_SIZE: self._cache.popitem(last=False)
+        return result
+
+    def learn_alias(self, raw_name: str, standard_name: str):
+        """把别名写进字典；落盘做了节流，洪峰期成批学到的新别名合并成一次写文件"""
+        with self._lock:
+            if self.mapping.get(raw_name) == standard_name: return
+            self.mapping[raw_name] = standard_name
+            self._add_standard(standard_name)
+            self._cache.pop(raw_name, None)
+            self._dirty = True
+            due = time.monotonic() - self._last_save >= settings.TEAM_ALIAS_SAVE_INTERVAL
+        if due: self.save()
+
+    def save(self):
+        """原子落盘 (先写临时文件再替换，避免写一半崩溃把 JSON 弄坏)"""
+        with self._lock:
+            if not self._dirty: return
+            directory = os.path.dirname(self.mapping_path)
+            if directory: os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.mapping_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.mapping, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.mapping_path)
+            self._dirty = False
+            self._last_save = time.monotonic()
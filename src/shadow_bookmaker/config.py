@@ -2,8 +2,52 @@ from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
     ODDS_API_KEY: str = ""  # 🌟 真实外盘的上帝之钥
+    ODDS_API_BASE_URL: str = "https://api.the-odds-api.com"  # 指向本地桩服务即可离线联调 (见 benchmarks/odds_api_stub.py)
+    ODDS_API_SPORTS: str = ""       # 逗号分隔的联赛 key；留空则从 /v4/sports 自动发现在售的足球联赛 (不耗额度)
+    ODDS_API_DAILY_BUDGET: int = 0  # 每天最多花多少额度；0 = 按响应头里的剩余额度均摊到本月剩余天数
+    SIM_MATCHES: int = 0             # 没配 ODDS_API_KEY 时：>0 则用这么多场随机游走的合成盘口做锚点 (压测 / 容量规划)，0 = 两场的演示盘
+    SIM_SEED: int = 7                # 合成盘口的随机种子
+    SIM_VOLATILITY: float = 0.02     # 合成盘口每分钟的 logit 游走幅度
+    SIM_JUMP_RATE: float = 0.002     # 合成盘口每分钟每场发生跳变 (进球 / 伤停) 的概率
     REQUEST_TIMEOUT: int = 15
     TEAM_MAPPING_PATH: str = "data/team_mapping.json"
+    TEAM_FUZZY_THRESHOLD: int = 85      # 模糊匹配放行分数
+    TEAM_LEARN_THRESHOLD: int = 95      # 达到该分数的模糊结果回写为别名
+    TEAM_FUZZY_CANDIDATES: int = 8      # 三元组粗筛后送去精排的候选数
+    TEAM_INDEX_MAX_POSTINGS: int = 2000 # 出现在过多队名里的三元组不参与投票
+    TEAM_CACHE_SIZE: int = 4096         # 已解析队名 LRU 上限
+    TEAM_ALIAS_SAVE_INTERVAL: float = 5.0  # 学到的别名最短多久回写一次 team_mapping.json (秒)
+    MARKET_SOFT_TTL: float = 60.0       # 快照超过该秒数即在后台刷新，调用方继续读旧快照
+    MARKET_MAX_AGE: float = 300.0       # 快照超过该秒数风控拒绝定价，读取方阻塞等待刷新
+    MARKET_QUOTE_TTL: float = 600.0     # 某场报价连续多久没在抓盘结果里出现就下架 (秒)；分级轮询的联赛按 2 个轮询间隔放长
+    SOURCE_TIMEOUT: float = 20.0        # 单个数据源本轮抓盘的最长等待 (秒)
+    SOURCE_BREAKER_FAILURES: int = 3    # 连续失败几次后熔断该源
+    SOURCE_BREAKER_COOLDOWN: float = 60.0  # 熔断冷却时间 (秒)
+    HTTP_MAX_CONNECTIONS: int = 10   # 每个网络引擎共享连接池的上限
+    HTTP2: bool = False              # 需要额外安装 h2
+    DB_FLUSH_INTERVAL: float = 0.05  # 写后队列最长攒批时间 (秒)，即落盘延迟上界
+    DB_WRITE_BATCH: int = 512        # 单个事务最多合并的写入条数
+    LEDGER_SNAPSHOT_EVERY: int = 20000  # 账本事件每攒这么多条压一份快照，冷启动最多重放这么长的尾巴
+    ODDS_HISTORY_SEGMENT_ROWS: int = 50_000        # 赔率历史内存头部攒够这么多笔就封存成一个列式段
+    ODDS_HISTORY_SEGMENT_SECONDS: float = 600.0    # ...或者最早一笔已经在内存里待了这么久 (秒)
+    ODDS_HISTORY_DOWNSAMPLE_AFTER_DAYS: float = 7.0  # 超过这么多天的段按天合并降采样
+    ODDS_HISTORY_DOWNSAMPLE_SECONDS: float = 300.0 # 降采样桶宽 (秒)：每个 (场次, 庄家, 桶) 只留最后一笔
+    ODDS_HISTORY_RETENTION_DAYS: float = 180.0     # 超过这么多天的段整段删除
+    DEVIG_METHOD: str = "proportional"  # 锚点赔率去水方法: proportional / power / shin (每轮快照建一次定价表)
+    MC_SCENARIOS: int = 1_000_000    # 全书蒙特卡洛默认场景数
+    MC_CHUNK_ELEMENTS: int = 4_000_000  # 每块抽样的 (场景 × 场次) 上限，控制内存峰值
+    MC_BANKROLL_LIMIT: float = 300000.0  # 全书资金红线：报告亏损超过它的概率
+    INTAKE_URL: str = ""             # 独立进单服务地址；留空则控制台在本进程后台拉起一个
+    INTAKE_HOST: str = "127.0.0.1"
+    INTAKE_PORT: int = 8765
+    INTAKE_MAX_QUEUE: int = 5000     # 进单队列上限，满了返回 503 (背压)
+    INTAKE_MAX_BATCH: int = 256      # 单个微批最多几张单
+    INTAKE_MAX_WAIT: float = 0.005   # 攒批延迟预算：最老一张单最多等多久就必须出批 (秒)
+    INTAKE_MAX_INFLIGHT: int = 4     # 同时在跑的微批上限 (不同场次的批次靠分条锁并行)
+    MATCH_LOCK_STRIPES: int = 64     # 场次锁条数：同一条上的场次串行，不同条上的并行
+    SHARD_COUNT: int = 0             # 风控分片进程数 (按 match_id 哈希分段)；0 = 单进程模式。分片部署请单独起 api 服务并配 INTAKE_URL
+    SHARD_RESPAWN_MIN_UPTIME: float = 5.0  # 分片活不过这么多秒就退出视为启动即崩，不再自动重启
+    METRICS_ENABLED: bool = True     # 分环节耗时直方图 (/metrics)；关掉后打点装饰器原样返回原函数，零开销
     
     model_config = SettingsConfigDict(env_file='.env', extra='ignore')
 
@@ -1,5 +1,6 @@
-from typing import List, Optional
-from src.shadow_bookmaker.domain.models import OddsDTO, ArbitrageOpportunity
+import numpy as np
+from typing import List, Optional, Sequence
+from src.shadow_bookmaker.domain.models import OddsDTO, ArbitrageOpportunity, MarketSnapshot
 
 class ArbitrageCalculator:
     @staticmethod
@@ -34,4 +35,61 @@ class ArbitrageCalculator:
                 recommended_stakes={"home": stake_home, "away": stake_away},
                 total_investment=total_capital
             )
-        return None
\ No newline at end of file
+        return None
+
+class ArbitrageScanner:
+    """全市场套利雷达：把整张多庄快照铺成 (庄家 × 场次 × 主/客/平) 赔率立方体，一次 max/argmax 找出各结果最优价。
+
+    有任何一家开出平局赔率的场次按三项盘计算 (漏掉平局的两项"套利"在足球里是假套利)；
+    最优价来自同一家庄家也照样收录 —— 那是对方自己挂错了价。
+    """
+    @staticmethod
+    def build_cube(snapshot: MarketSnapshot):
+        match_ids = list(snapshot.books.keys())
+        bookmakers = sorted({b for quotes in snapshot.books.values() for b in quotes})
+        book_idx = {b: i for i, b in enumerate(bookmakers)}
+        cube = np.zeros((len(bookmakers), len(match_ids), 3), dtype=np.float64)  # 0 = 该庄未开此盘
+        for j, m_id in enumerate(match_ids):
+            for b, o in snapshot.books[m_id].items():
+                cube[book_idx[b], j] = (o.home_odds, o.away_odds, o.draw_odds or 0.0)
+        return cube, match_ids, bookmakers
+
+    @staticmethod
+    def scan_cube(cube: np.ndarray, match_ids: Sequence[str], bookmakers: Sequence[str], total_capital: float = 1000.0, min_margin: float = 0.0, top_n: Optional[int] = None) -> List[ArbitrageOpportunity]:
+        if cube.size == 0: return []
+        best_book = cube.argmax(axis=0)                      # (场次, 3)
+        best = np.take_along_axis(cube, best_book[None], axis=0)[0]
+        three_way = best[:, 2] > 0
+        with np.errstate(divide="ignore"):
+            inv = np.where(best > 0, 1.0 / best, np.inf)
+        inv[~three_way, 2] = 0.0
+        implied = inv.sum(axis=1)
+
+        # 核心公式：隐含概率之和 < 1.0 即存在无风险套利
+        margin = 1.0 - implied
+        hits = np.flatnonzero(margin > min_margin)
+        hits = hits[np.argsort(-margin[hits], kind="stable")]
+        if top_n is not None: hits = hits[:top_n]
+
+        # 资金分配：每个结果投 (总资金 / 隐含概率) / 赔率，保证任何赛果收益相等
+        stakes = (total_capital / implied[hits])[:, None] * inv[hits]
+        results = []
+        for k, j in enumerate(hits):
+            is_3way = bool(three_way[j])
+            rec = {"home": float(stakes[k, 0]), "away": float(stakes[k, 1])}
+            if is_3way: rec["draw"] = float(stakes[k, 2])
+            results.append(ArbitrageOpportunity.model_construct(
+                match_id=match_ids[j], profit_margin=float(margin[j]),
+                best_home_odds=float(best[j, 0]), best_home_bookie=bookmakers[best_book[j, 0]],
+                best_away_odds=float(best[j, 1]), best_away_bookie=bookmakers[best_book[j, 1]],
+                best_draw_odds=float(best[j, 2]) if is_3way else None,
+                best_draw_bookie=bookmakers[best_book[j, 2]] if is_3way else None,
+                recommended_stakes=rec, total_investment=total_capital
+            ))
+        return results
+
+    @classmethod
+    def scan(cls, snapshot: MarketSnapshot, total_capital: float = 1000.0, min_margin: float = 0.0, top_n: Optional[int] = None) -> List[ArbitrageOpportunity]:
+        """按利润率从高到低返回全部套利机会"""
+        cube, match_ids, bookmakers = cls.build_cube(snapshot)
+        return cls.scan_cube(cube, match_ids, bookmakers, total_capital, min_margin, top_n)
@@ -0,0 +1,118 @@
+from typing import Callable, Dict, Iterable, Iterator, List, Mapping
+import numpy as np
+from src.shadow_bookmaker.domain.models import OddsDTO
+from src.shadow_bookmaker.config import settings
+
+# 去水方法：赔率隐含概率 π (和 > 1，多出来的就是抽水) -> 和为 1 的真实概率
+#   proportional: p = π / Σπ，抽水按比例摊到每个赛果
+#   power:        p = π^k，解 Σπ^k = 1 (冷门吃的水更多，修正"冷门偏差")
+#   shin:         Shin (1993) 内幕交易模型，解内幕资金占比 z，冷门偏差的修正介于前两者之间
+DEVIG_METHODS = ("proportional", "power", "shin")
+_ITERATIONS = 40  # 牛顿 / 二分的固定迭代次数：整列一起迭代，不按行判收敛
+
+def implied_matrix(odds: np.ndarray) -> np.ndarray:
+    """(场次 × 主/客/平) 赔率矩阵 -> 隐含概率，平局赔率 <= 0 视为无平局盘口 (概率记 0)"""
+    implied = np.zeros_like(odds, dtype=np.float64)
+    implied[:, :2] = 1.0 / odds[:, :2]
+    has_draw = odds[:, 2] > 0
+    implied[has_draw, 2] = 1.0 / odds[has_draw, 2]
+    return implied
+
+def _proportional(implied: np.ndarray) -> np.ndarray:
+    # 逐列相加 (不用 sum)：加法顺序固定，与历史裁决逐位一致
+    return implied / (implied[:, 0] + implied[:, 1] + implied[:, 2])[:, None]
+
+def _power(implied: np.ndarray) -> np.ndarray:
+    # f(k) = Σπ^k - 1 关于 k 单调递减且是凸函数，从 k = 1 出发的牛顿迭代单调收敛，不会越过根
+    has = implied > 0
+    log_p = np.log(np.where(has, implied, 1.0))
+    k = np.ones(len(implied))
+    for _ in range(_ITERATIONS):
+        powered = np.where(has, np.exp(log_p * k[:, None]), 0.0)
+        f = powered.sum(axis=1) - 1.0
+        slope = (powered * log_p).sum(axis=1)
+        k = np.maximum(k - f / np.where(slope < 0, slope, -1.0), 1e-6)
+    return np.where(has, np.exp(log_p * k[:, None]), 0.0)
+
+def _shin(implied: np.ndarray) -> np.ndarray:
+    # p_i(z) = (sqrt(z² + 4(1-z)·π_i²/Σπ) - z) / (2(1-z))，Σp_i 随 z 单调递减：在 [0, 1) 上二分解 Σp = 1
+    booksum = implied.sum(axis=1, keepdims=True)
+    scaled = implied ** 2 / booksum
+    lo, hi = np.zeros((len(implied), 1)), np.full((len(implied), 1), 0.999)
+
+    def probs(z):
+        return np.where(implied > 0, (np.sqrt(z * z + 4.0 * (1.0 - z) * scaled) - z) / (2.0 * (1.0 - z)), 0.0)
+
+    for _ in range(_ITERATIONS):
+        mid = (lo + hi) / 2
+        over = probs(mid).sum(axis=1, keepdims=True) > 1.0
+        lo, hi = np.where(over, mid, lo), np.where(over, hi, mid)
+    # 没有抽水 (Σπ <= 1) 的行 z 停在 0，和不足 1 的部分由最后的归一化补齐
+    return probs((lo + hi) / 2)
+
+_SOLVERS: Dict[str, Callable[[np.ndarray], np.ndarray]] = {"proportional": _proportional, "power": _power, "shin": _shin}
+
+def devig(odds: np.ndarray, method: str = "proportional") -> np.ndarray:
+    """(场次 × 主/客/平) 赔率矩阵整列去水成真实概率 (每行和为 1)；无平局盘口的平局概率为 0"""
+    if method not in _SOLVERS: raise ValueError(f"未知去水方法 {method!r}，可选: {', '.join(DEVIG_METHODS)}")
+    odds = np.asarray(odds, dtype=np.float64).reshape(-1, 3)
+    if len(odds) == 0: return np.zeros((0, 3))
+    probs = _SOLVERS[method](implied_matrix(odds))
+    if method == "proportional": return probs
+    return probs / probs.sum(axis=1, keepdims=True)  # 迭代解的残差归一化掉
+
+class PriceTable(Mapping[str, OddsDTO]):
+    """一份锚点快照的定价表：每轮抓盘只建一次，把全部场次的 (主/客/平) 赔率与去水概率整列算好。
+
+    本身就是只读的 match_id -> OddsDTO 映射，原来收 Dict[str, OddsDTO] 的地方原样能用；
+    风控每条腿的定价变成查行号 + 取列表元素，换去水方法只影响建表，不影响裁决速度。
+    """
+    def __init__(self, quotes: Mapping[str, OddsDTO], method: str = None):
+        self.method = settings.DEVIG_METHOD if method is None else method
+        self._quotes: Dict[str, OddsDTO] = dict(quotes)  # 拷贝一份：行情库原地维护的字典之后再变也不影响这份快照
+        self.match_ids: List[str] = list(self._quotes)
+        self.index: Dict[str, int] = {m_id: i for i, m_id in enumerate(self.match_ids)}
+        self.odds = np.array([[o.home_odds, o.away_odds, o.draw_odds or 0.0] for o in self._quotes.values()], dtype=np.float64).reshape(-1, 3)
+        self.probs = devig(self.odds, self.method)
+        # 标量通道逐腿查价用纯 Python 列表：取元素比 NumPy 标量索引快一个数量级
+        self._odds_rows = self.odds.tolist()
+        self._prob_rows = self.probs.tolist()
+
+    @classmethod
+    def coerce(cls, sharp_market: Mapping[str, OddsDTO], match_ids: Iterable[str] = None, method: str = None) -> "PriceTable":
+        """已经是定价表就原样返回；普通字典则只对 match_ids (缺省为全部) 里有报价的场次临时建表"""
+        if isinstance(sharp_market, PriceTable): return sharp_market
+        if match_ids is None: return cls(sharp_market, method)
+        return cls({m_id: sharp_market[m_id] for m_id in dict.fromkeys(match_ids) if m_id in sharp_market}, method)
+
+    def subset(self, match_ids: Iterable[str], convert: Callable[[OddsDTO], OddsDTO] = None) -> "PriceTable":
+        """切出若干场次的小表 (直接取行，不重新去水)，分片路由按单子下发用；convert 用来把报价换成可跨进程的对象"""
+        rows = [self.index[m_id] for m_id in dict.fromkeys(match_ids) if m_id in self.index]
+        table = PriceTable.__new__(PriceTable)
+        table.method = self.method
+        table.match_ids = [self.match_ids[r] for r in rows]
+        table._quotes = {m_id: (convert(self._quotes[m_id]) if convert else self._quotes[m_id]) for m_id in table.match_ids}
+        table.index = {m_id: i for i, m_id in enumerate(table.match_ids)}
+        table.odds, table.probs = self.odds[rows], self.probs[rows]
+        table._odds_rows = [self._odds_rows[r] for r in rows]
+        table._prob_rows = [self._prob_rows[r] for r in rows]
+        return table
+
+    def prob(self, match_id: str, col: int) -> float:
+        return self._prob_rows[self.index[match_id]][col]
+
+    def sharp_odds(self, match_id: str, col: int) -> float:
+        """锚点赔率；无平局盘口的平局记 0"""
+        return self._odds_rows[self.index[match_id]][col]
+
+    def __getitem__(self, match_id: str) -> OddsDTO:
+        return self._quotes[match_id]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.match_ids)
+
+    def __len__(self) -> int:
+        return len(self.match_ids)
+
+    def __contains__(self, match_id) -> bool:
+        return match_id in self._quotes
@@ -0,0 +1,108 @@
+import time
+from typing import Mapping, Sequence, Tuple, Union
+import numpy as np
+from src.shadow_bookmaker.domain.models import HedgeInstruction, HedgePlan, OddsDTO
+from src.shadow_bookmaker.domain.ledger import GlobalLedger, OUTCOMES
+from src.shadow_bookmaker.domain.devig import PriceTable
+
+# 每场的对冲是一个 3 变量线性规划 (各场互不相干，整本账就是块对角的大 LP)：
+#   变量 h_j >= 0 为在外盘按锚点赔率 o_j 买赛果 j 的注码，记 S = Σh；打出 j 时本场盈亏变为 P_j + h_j·o_j - S
+#   约束 P_j + h_j·o_j - S >= -L，即 h_j >= (S + b_j) / o_j，其中 b_j = -L - P_j (b_j > 0 就是击穿了红线)
+# 给定 S，各 h_j 的下界 max(0, (S + b_j)/o_j) 都随 S 单调不减；只要下界之和不超过 S 就可行。
+# 所以最小可行的 S 对应的下界就是逐分量最小的可行解 —— 对任何非负的单位成本都是最优解。
+# 最小的 S 落在某个"活跃集" A (h_j > 0 的赛果) 上：S = Σ_A h_j = Σ_A (S + b_j)/o_j，
+#   解得 S = Σ_A (b_j/o_j) / (1 - Σ_A 1/o_j)；三项盘只有 7 个非空活跃集，整本账一次把 7 个候选全算出来，
+#   挑自洽 (A 内 S + b_j >= 0、A 外 <= 0) 的最小 S 即可，不需要迭代求解器。
+_ACTIVE_SETS = np.array([[bool(mask >> j & 1) for j in range(3)] for mask in range(1, 8)])
+
+def solve_hedges(pnl: np.ndarray, odds: np.ndarray, limit: Union[float, np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """(场次 × 主/客/平) 盈亏与锚点赔率 -> (最低成本对冲注码矩阵, 每场能否压回红线)。
+
+    limit 可以是统一红线，也可以是每场各自的红线；赔率 <= 1 的赛果 (两项盘的平局、没报价) 既不能买也不计入约束。
+    压不回红线的场次 (各赛果都亏到对冲也救不回来，或整场没报价) 注码全为 0。
+    """
+    pnl = np.asarray(pnl, dtype=np.float64).reshape(-1, 3)
+    odds = np.asarray(odds, dtype=np.float64).reshape(-1, 3)
+    limit = np.broadcast_to(np.asarray(limit, dtype=np.float64), (len(pnl),))
+    valid = odds > 1.0
+    safe_odds = np.where(valid, odds, 1.0)
+    inv = np.where(valid, 1.0 / safe_odds, 0.0)
+    b = np.where(valid, -limit[:, None] - pnl, -np.inf)  # 买不了的赛果也不会打出，约束永远满足
+    b_quoted = np.where(valid, b, 0.0)
+    breached = (b > 0).any(axis=1)
+
+    # 7 个活跃集的候选 S：(场次 × 活跃集)
+    act = _ACTIVE_SETS[None, :, :]
+    quoted = ~(act & ~valid[:, None, :]).any(axis=2)  # 活跃集里只能有可买的赛果
+    denom = 1.0 - (act * inv[:, None, :]).sum(axis=2)
+    num = (act * (b_quoted * inv)[:, None, :]).sum(axis=2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        s = num / denom
+    gap = s[:, :, None] + b[:, None, :]
+    tol = 1e-9 * (1.0 + np.abs(limit))[:, None, None]
+    consistent = quoted & (denom > 0) & (s >= 0) & np.where(act, gap >= -tol, gap <= tol).all(axis=2)
+    best = np.where(consistent, s, np.inf).min(axis=1)
+    best = np.where(breached, best, 0.0)
+    feasible = np.isfinite(best)
+
+    hedges = np.where(valid & feasible[:, None], np.maximum((np.where(feasible, best, 0.0)[:, None] + b_quoted) / safe_odds, 0.0), 0.0)
+    return hedges, feasible
+
+def hedged_pnl(pnl: np.ndarray, odds: np.ndarray, hedges: np.ndarray) -> np.ndarray:
+    """下完对冲后的 (场次 × 主/客/平) 盈亏：打出的赛果赢回 h·(o-1)，其余赛果输掉各自的注码"""
+    return pnl + hedges * np.where(odds > 1.0, odds, 0.0) - hedges.sum(axis=1, keepdims=True)
+
+class HedgeOptimizer:
+    """全书对冲优化器：拿整本账的 (场次 × 主/客/平) 盈亏与锚点赔率，一次解出把每场都压回红线的最低成本对冲。
+
+    和逐张单子的泄洪对冲不同，这里看的是累计敞口：很多张小单各自没击穿、合起来击穿的场次也会被找出来。
+    账本取联合视图 (每张串关只记在锚腿上)，逐腿视图会把 N 串 1 的负债对冲 N 次。
+    构造时拷贝账本矩阵与定价表的私有副本，run() 可以丢进工作线程跑。
+    """
+    def __init__(self, pnl: np.ndarray, odds: np.ndarray, probs: np.ndarray, match_ids: Sequence[str]):
+        self.match_ids = list(match_ids)
+        self.pnl = np.asarray(pnl, dtype=np.float64).reshape(-1, 3)
+        self.odds = np.asarray(odds, dtype=np.float64).reshape(-1, 3)
+        self.probs = np.asarray(probs, dtype=np.float64).reshape(-1, 3)
+
+    @classmethod
+    def from_ledger(cls, ledger: GlobalLedger, sharp_market: Mapping[str, OddsDTO]) -> "HedgeOptimizer":
+        match_ids = ledger.match_ids
+        prices = PriceTable.coerce(sharp_market, match_ids)
+        rows = np.array([prices.index.get(m_id, -1) for m_id in match_ids], dtype=np.int64)
+        priced = rows >= 0
+        odds = np.zeros((len(match_ids), 3), dtype=np.float64)
+        probs = np.zeros((len(match_ids), 3), dtype=np.float64)
+        if priced.any():
+            odds[priced] = prices.odds[rows[priced]]
+            probs[priced] = prices.probs[rows[priced]]
+        return cls(ledger.joint_matrix().copy(), odds, probs, match_ids)
+
+    def run(self, limit: float) -> HedgePlan:
+        started = time.perf_counter()
+        hedges, feasible = solve_hedges(self.pnl, self.odds, limit)
+        hedges = np.ceil(hedges * 100.0) / 100.0  # 注码按分向上取整，对冲后盈亏最多偏离几分钱
+        worst_before = self.pnl.min(axis=1)
+        worst_after = np.where(self.odds > 1.0, hedged_pnl(self.pnl, self.odds, hedges), np.inf).min(axis=1)
+        # 期望成本 = 注码 × (1 - 去水概率 × 赔率)，即按真实概率让出去的抽水
+        costs = hedges * (1.0 - self.probs * self.odds)
+
+        # 整场没报价的场次没有可买的赛果，击穿了也只能记为压不回
+        breached = worst_before < -limit
+        unhedgeable = [self.match_ids[i] for i in np.flatnonzero(breached & (~feasible | ~(self.odds > 1.0).any(axis=1)))]
+
+        # 指令按对冲前的最坏盈亏排序，最危险的场次在最前面
+        rows, cols = np.nonzero(hedges > 0)
+        order = np.lexsort((cols, worst_before[rows]))
+        rows, cols = rows[order], cols[order]
+        instructions = [
+            HedgeInstruction.model_construct(match_id=self.match_ids[r], selection=OUTCOMES[c], hedge_stake=h, hedge_odds=o,
+                                             expected_cost=e, worst_before=wb, worst_after=wa)
+            for r, c, h, o, e, wb, wa in zip(rows.tolist(), cols.tolist(), hedges[rows, cols].tolist(), self.odds[rows, cols].tolist(),
+                                             costs[rows, cols].tolist(), worst_before[rows].tolist(), worst_after[rows].tolist())
+        ]
+        return HedgePlan(
+            limit=limit, n_matches=len(self.match_ids), breached_matches=int(breached.sum()),
+            instructions=instructions, total_stake=float(hedges.sum()), expected_cost=float(costs.sum()),
+            unhedgeable=unhedgeable, elapsed=time.perf_counter() - started,
+        )
@@ -1,27 +1,168 @@
-from collections import defaultdict
-from typing import Dict
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+import pandas as pd
 from src.shadow_bookmaker.infrastructure.database import DatabaseManager
+from src.shadow_bookmaker.domain.parlay_book import ParlayBook
+
+# 账本矩阵的列顺序：0/1/2 = 主/客/平
+OUTCOMES = ("home", "away", "draw")
+_COL = {o: i for i, o in enumerate(OUTCOMES)}
 
 class GlobalLedger:
-    def __init__(self, db: DatabaseManager):
+    """全局水池：所有场次的盈亏存成一张 (场次 × 主/客/平) 的 NumPy 矩阵，match_id -> 行号 单独建索引。
+
+    单场读写是 O(1) 的行操作；最坏盈亏、Top-N 敞口、全书总敞口都是整列向量化运算。
+    串关按"其余腿全中"的假设把边际盈亏记进每条腿所在的行 (matrix，逐场风控定价用的边际视图)，联合赛果另由 ParlayBook 稀疏记录；
+    跨场加总的查询 (最坏盈亏、Top-N、总敞口、看板) 读 joint_matrix，N 串一的负债只算一次。
+    分片部署时给 owns 过滤器，只恢复归本分片管的场次 (以及至少有一条腿落在本分片的串关)。
+    """
+    def __init__(self, db: Optional[DatabaseManager], capacity: int = 1024, owns: Callable[[str], bool] = None):
         self.db = db
+        self._index: Dict[str, int] = {}
+        self._ids: List[str] = []
+        self._pnl = np.zeros((capacity, 3), dtype=np.float64)
+        self.parlays = ParlayBook()
+        if db is None: return  # 不连库的草稿账本 (见 from_rows)
         # ⚡ 核心进化：系统启动时直接从本地物理硬盘恢复水池状态！
-        self.pl_states = defaultdict(lambda: {"home": 0.0, "away": 0.0, "draw": 0.0})
-        self.pl_states.update(self.db.load_ledger())
+        for match_id, state in self.db.load_ledger().items():
+            if owns is None or owns(match_id): self._set_row(match_id, state)
+        for ticket_id, legs, stake, liability in self.db.load_parlays():
+            if owns is None or any(owns(m_id) for m_id, _ in legs):
+                self.parlays.add(ticket_id, [(m_id, _COL[sel]) for m_id, sel in legs], stake, liability)
+
+    @classmethod
+    def from_rows(cls, rows: Dict[str, Sequence[float]], parlays: Sequence[tuple] = ()) -> "GlobalLedger":
+        """内存草稿账本：直接用 (主/客/平) 行与串关簿条目搭一本账，不连库、不能 commit_bets"""
+        ledger = cls(None, capacity=max(len(rows), 1))
+        for match_id, row in rows.items():
+            ledger._set_row(match_id, dict(zip(OUTCOMES, row)))
+        for ticket_id, legs, stake, liability in parlays:
+            ledger.parlays.add(ticket_id, legs, stake, liability)
+        return ledger
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def _row(self, match_id: str) -> int:
+        """取行号，新场次自动开行 (容量不够就翻倍扩容)"""
+        row = self._index.get(match_id)
+        if row is None:
+            row = len(self._ids)
+            if row == len(self._pnl):
+                self._pnl = np.vstack([self._pnl, np.zeros_like(self._pnl)])
+            self._index[match_id] = row
+            self._ids.append(match_id)
+        return row
+
+    def _set_row(self, match_id: str, state: Dict[str, float]):
+        row = self._row(match_id)  # 先开行再取矩阵：扩容会换掉 self._pnl
+        self._pnl[row] = [state[o] for o in OUTCOMES]
+
+    def state_row(self, match_id: str) -> np.ndarray:
+        """单场水位 (主/客/平) 的副本；没有敞口的场次返回全 0"""
+        row = self._index.get(match_id)
+        return self._pnl[row].copy() if row is not None else np.zeros(3)
+
+    def state_rows(self, match_ids: Sequence[str]) -> np.ndarray:
+        """一批场次的 (场次 × 主/客/平) 水位副本，一次花式索引取完；没有敞口的场次为全 0"""
+        rows = np.fromiter((self._index.get(m_id, -1) for m_id in match_ids), dtype=np.int64, count=len(match_ids))
+        out = np.zeros((len(rows), 3))
+        known = rows >= 0
+        out[known] = self._pnl[rows[known]]
+        return out
+
+    def get_state(self, match_id: str) -> Dict[str, float]:
+        row = self._index.get(match_id)
+        if row is None: return {o: 0.0 for o in OUTCOMES}
+        return {o: float(v) for o, v in zip(OUTCOMES, self._pnl[row])}
 
     def simulate_bet(self, match_id: str, selection: str, stake: float, liability: float) -> Dict[str, float]:
         """沙盘推演：在内存中极速计算，不写硬盘"""
-        current_state = self.pl_states[match_id].copy()
+        current_state = self.get_state(match_id)
         for outcome in ["home", "away", "draw"]:
             if outcome == selection: current_state[outcome] -= liability
             else: current_state[outcome] += stake
         return current_state
 
     def commit_bet(self, match_id: str, selection: str, stake: float, liability: float):
-        """核心动作：确认接单后，更新内存的同时，立刻写死到物理硬盘"""
-        new_state = self.simulate_bet(match_id, selection, stake, liability)
-        self.pl_states[match_id] = new_state
-        self.db.save_ledger_state(match_id, new_state)
+        """核心动作：确认接单后，更新内存的同时，立刻写死到物理硬盘 (连同一条账本事件)"""
+        self.commit_bets([(match_id, selection, stake, liability, None)], [])
+
+    def commit_bets(self, bets: List[Tuple[str, str, float, float, str]], tickets: List[tuple], durable: bool = False, parlays: List[tuple] = ()):
+        """批量确权：先在草稿上推演全部 (match_id, selection, stake, liability, ticket_id)，
+        连同订单流水、账本事件 (与串关簿) 在同一个事务里落盘；事务成功后才把新水位换进内存
+
+        串关的每条腿都要在 bets 里各有一条边际记账，parlays 每行为 (ticket_id, [(match_id, selection)], stake, liability)。
+        """
+        new_states = self.stage_bets(bets)
+        self.db.save_decisions(new_states, tickets, durable=durable, parlays=parlays, bets=bets)
+        self.apply_states(new_states, parlays)
+
+    def stage_bets(self, bets: List[Tuple[str, str, float, float, str]]) -> Dict[str, Dict[str, float]]:
+        """只推演不生效：返回每个被触碰场次记完这些单子后的新水位 (内存与硬盘都不动)"""
+        new_states: Dict[str, Dict[str, float]] = {}
+        for match_id, selection, stake, liability, _ in bets:
+            state = new_states.get(match_id) or self.get_state(match_id)
+            new_states[match_id] = {o: (v - liability if o == selection else v + stake) for o, v in state.items()}
+        return new_states
+
+    def apply_states(self, new_states: Dict[str, Dict[str, float]], parlays: List[tuple] = ()):
+        """把已经落盘的新水位 (与串关) 换进内存"""
+        for match_id, state in new_states.items():
+            self._set_row(match_id, state)
+        for ticket_id, legs, stake, liability in parlays:
+            self.parlays.add(ticket_id, [(m_id, _COL[sel]) for m_id, sel in legs], stake, liability)
+
+    def clear(self):
+        self._index.clear()
+        self._ids.clear()
+        self._pnl[:] = 0.0
+        self.parlays.clear()
+
+    # ------------------------------------------------------------------
+    # 组合敞口查询 (全部向量化)
+    # ------------------------------------------------------------------
+    @property
+    def match_ids(self) -> List[str]:
+        return list(self._ids)
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """(场次 × 主/客/平) 盈亏矩阵的只读视图，行顺序与 match_ids 一致"""
+        view = self._pnl[:len(self._ids)]
+        view.flags.writeable = False
+        return view
+
+    def joint_matrix(self) -> np.ndarray:
+        """串关只算一次的 (场次 × 主/客/平) 盈亏：每张串关的负债只留在锚腿所在的行，其余腿的边际记账扣回去。
+
+        逐腿的 matrix 对每一场都假设其余腿全中，看单场没错，跨场加总却把 N 串一的负债算了 N 次。
+        这里任何联合赛果下的合计都不高于真实盈亏 (锚腿打出、别的腿没中时仍按赔付计)，所有腿全中时两者相等。
+        没有串关时直接返回 matrix 的只读视图。
+        """
+        if not len(self.parlays): return self.matrix
+        return self.matrix + self.parlays.joint_correction(self._index, len(self._ids))
+
+    def worst_cases(self) -> np.ndarray:
+        """每场的最坏盈亏 (三种赛果里的最小值，按联合视图)"""
+        return self.joint_matrix().min(axis=1)
+
+    def top_exposures(self, n: int = 10) -> List[Tuple[str, float]]:
+        """最坏盈亏最惨的前 N 场 (argpartition，不做全量排序)"""
+        worst = self.worst_cases()
+        if len(worst) == 0: return []
+        n = min(n, len(worst))
+        idx = np.argpartition(worst, n - 1)[:n]
+        idx = idx[np.argsort(worst[idx], kind="stable")]
+        return [(self._ids[i], float(worst[i])) for i in idx]
+
+    def total_exposure(self) -> float:
+        """全书总敞口：所有场次最坏情况下亏损之和 (只计亏损部分，正数表示要赔出去的钱)"""
+        return float(-np.minimum(self.worst_cases(), 0.0).sum())
+
+    def to_frame(self) -> pd.DataFrame:
+        """导出给看板的联合视图 (没有串关时零拷贝，直接引用账本矩阵的内存)"""
+        return pd.DataFrame(self.joint_matrix(), index=pd.Index(self._ids, name="match_id"), columns=list(OUTCOMES), copy=False)
 
-    def get_all_exposures(self):
-        return dict(self.pl_states)
\ No newline at end of file
+    def get_all_exposures(self) -> Dict[str, Dict[str, float]]:
+        return {m_id: self.get_state(m_id) for m_id in self._ids}
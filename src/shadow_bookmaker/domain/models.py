@@ -1,5 +1,5 @@
-from pydantic import BaseModel, Field
-from typing import List, Literal, Optional
+from pydantic import BaseModel, Field, model_validator
+from typing import Dict, List, Literal, Optional
 
 class OddsDTO(BaseModel):
     bookmaker: str
@@ -9,17 +9,62 @@ class OddsDTO(BaseModel):
     home_odds: float = Field(gt=1.0)
     away_odds: float = Field(gt=1.0)
     draw_odds: Optional[float] = None
+    fetched_at: Optional[float] = None  # 源头真正抓到这份报价的时间 (unix 秒)；沿用缓存重放的报价保留原值，None 按入库时刻算
+
+class MarketSnapshot(BaseModel):
+    """多源合并快照：match_id -> {bookmaker -> OddsDTO}；风控读锚点庄家，套利读全部庄家"""
+    books: Dict[str, Dict[str, OddsDTO]] = {}
+    sharp_bookmaker: str = "Pinnacle"
+    fetched_at: float = 0.0
+    failed_sources: List[str] = []
+
+    def sharp_market(self) -> Dict[str, OddsDTO]:
+        return {m_id: quotes[self.sharp_bookmaker] for m_id, quotes in self.books.items() if self.sharp_bookmaker in quotes}
+
+    def quotes_for(self, match_id: str) -> List[OddsDTO]:
+        return list(self.books.get(match_id, {}).values())
+
+class MarketChange(BaseModel):
+    """增量行情事件：某场某庄的报价新增 / 变动 / 过期下架"""
+    kind: Literal["added", "moved", "removed"]
+    match_id: str
+    bookmaker: str
+    old: Optional[OddsDTO] = None
+    new: Optional[OddsDTO] = None
+    max_move: float = 0.0  # 主/客/平三项赔率里最大的相对变动幅度
+
+class ArbitrageOpportunity(BaseModel):
+    match_id: str
+    profit_margin: float
+    best_home_odds: float
+    best_home_bookie: str
+    best_away_odds: float
+    best_away_bookie: str
+    best_draw_odds: Optional[float] = None  # 三项盘才有
+    best_draw_bookie: Optional[str] = None
+    recommended_stakes: Dict[str, float]
+    total_investment: float
 
 class TicketLeg(BaseModel):
     match_id: str
     selection: Literal["home", "away", "draw"]
     customer_odds: float
 
+MAX_PARLAY_LEGS = 10
+
 class CustomerTicket(BaseModel):
     ticket_id: str
-    ticket_type: Literal["single", "parlay_2"]
+    ticket_type: Literal["single", "parlay_2", "parlay_3", "parlay_4", "parlay_5", "parlay_6", "parlay_7", "parlay_8", "parlay_9", "parlay_10"]
     stake: float = Field(..., ge=1000, le=50000)
     legs: List[TicketLeg]
+
+    @model_validator(mode="after")
+    def _check_legs(self):
+        # 单关 1 条腿，N 串 1 正好 N 条腿，且每条腿各占一场 (同场两条腿是互斥/强相关的假串关)
+        expected = 1 if self.ticket_type == "single" else int(self.ticket_type.split("_")[1])
+        if len(self.legs) != expected: raise ValueError(f"{self.ticket_type} 需要 {expected} 条腿，收到 {len(self.legs)} 条")
+        if len({leg.match_id for leg in self.legs}) != len(self.legs): raise ValueError("串关的每条腿必须来自不同赛事")
+        return self
     
     @property
     def total_odds(self) -> float:
@@ -44,4 +89,41 @@ class RiskDecision(BaseModel):
     retained_stake: float = 0.0
     retained_liability: float = 0.0
     danger_match_id: str = ""
-    danger_selection: str = ""
\ No newline at end of file
+    danger_selection: str = ""
+
+class PortfolioRisk(BaseModel):
+    """全书蒙特卡洛风险报告 (盈亏以庄家视角，正数为赚；VaR/CVaR 以正数表示亏损)"""
+    n_scenarios: int
+    n_matches: int
+    n_parlays: int = 0
+    seed: Optional[int] = None
+    expected_pnl: float
+    pnl_std: float
+    worst_pnl: float
+    var: Dict[float, float]   # 置信水平 -> VaR
+    cvar: Dict[float, float]  # 置信水平 -> CVaR (尾部平均亏损)
+    bankroll_limit: float
+    breach_probability: float  # 全书亏损超过 bankroll_limit 的概率
+    unpriced_matches: List[str] = []  # 没有外盘报价、按最坏赛果计入的场次
+    elapsed: float = 0.0
+
+class HedgeInstruction(BaseModel):
+    """一条对冲指令：去外盘按锚点赔率买 match_id 的 selection"""
+    match_id: str
+    selection: str
+    hedge_stake: float
+    hedge_odds: float
+    expected_cost: float   # 按去水概率算的期望成本 (让出去的抽水)
+    worst_before: float    # 本场对冲前 / 后的最坏盈亏
+    worst_after: float
+
+class HedgePlan(BaseModel):
+    """全书对冲方案：把每场最坏盈亏都压回红线以内、总成本最低的一组对冲"""
+    limit: float
+    n_matches: int
+    breached_matches: int            # 对冲前击穿红线的场次数
+    instructions: List[HedgeInstruction] = []
+    total_stake: float = 0.0
+    expected_cost: float = 0.0
+    unhedgeable: List[str] = []      # 只靠外盘对冲压不回红线的场次 (各赛果都亏，或缺报价)
+    elapsed: float = 0.0
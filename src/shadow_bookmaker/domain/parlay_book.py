@@ -0,0 +1,52 @@
+from typing import Dict, List, Mapping, Sequence, Tuple
+import numpy as np
+
+# 一条腿 = (match_id, 选项下标 0/1/2 = 主/客/平)
+Leg = Tuple[str, int]
+# 一张串关 = (入账序号, 各腿, 截留本金, 截留负债)
+Parlay = Tuple[int, Tuple[Leg, ...], float, float]
+
+class ParlayBook:
+    """串关联合赛果簿：只存真实下过的串关 (稀疏)，不展开 3^N 的赛果组合。
+
+    定价不读它：账本每一行都按"其余腿全中"记了串关的全额边际盈亏，逐腿风控看的就是这个 (见 RiskEngine)。
+    它保存的是各腿的联合结构：全书蒙特卡洛 (PortfolioSimulator) 靠它在每个场景里把串关按全中/不中只结算一次，
+    全书敞口 / 对冲 / 看板读的联合视图 (GlobalLedger.joint_matrix) 靠它把 N 条腿记的 N 份负债收成锚腿上的一份。
+    各腿的第一条是锚腿 (入账时放在最前面的危险腿)。
+    """
+    def __init__(self):
+        self._parlays: Dict[str, Parlay] = {}
+        self._seq = 0
+
+    def __len__(self) -> int:
+        return len(self._parlays)
+
+    def add(self, ticket_id: str, legs: Sequence[Leg], stake: float, liability: float):
+        self._parlays[ticket_id] = (self._seq, tuple(legs), stake, liability)
+        self._seq += 1
+
+    def clear(self):
+        self._parlays.clear()
+        self._seq = 0
+
+    def joint_correction(self, index: Mapping[str, int], n_rows: int) -> np.ndarray:
+        """(场次 × 主/客/平) 修正量：把每张串关在锚腿以外各腿上记的边际盈亏 (选中 -负债，其余 +本金) 扣回去。
+
+        锚腿不在 index 里 (分片只持有部分场次) 的串关不修正：宁可多算，也不让它在局部视图里凭空消失。
+        """
+        rows, cols, stake, swing = [], [], [], []
+        for _, legs, s, liability in self._parlays.values():
+            if legs[0][0] not in index: continue
+            for m_id, sel in legs[1:]:
+                row = index.get(m_id)
+                if row is None: continue
+                rows.append(row); cols.append(sel); stake.append(s); swing.append(s + liability)
+        correction = np.zeros((n_rows, 3), dtype=np.float64)
+        if rows:
+            rows = np.array(rows, dtype=np.int64)
+            np.add.at(correction, rows, -np.array(stake)[:, None])
+            np.add.at(correction, (rows, np.array(cols, dtype=np.int64)), swing)
+        return correction
+
+    def items(self) -> List[Tuple[str, Tuple[Leg, ...], float, float]]:
+        return [(t_id, legs, stake, liability) for t_id, (_, legs, stake, liability) in self._parlays.items()]
@@ -0,0 +1,126 @@
+import time
+from typing import Dict, List, Mapping, Optional, Sequence
+import numpy as np
+from src.shadow_bookmaker.domain.models import OddsDTO, PortfolioRisk
+from src.shadow_bookmaker.domain.ledger import GlobalLedger
+from src.shadow_bookmaker.domain.devig import PriceTable
+from src.shadow_bookmaker.config import settings
+
+_RESOLUTION = 1 << 16  # 抽样用 16 位均匀整数
+
+class PortfolioSimulator:
+    """全书蒙特卡洛：按外盘去水概率独立抽取每场赛果，整本账 (含串关联合结算) 一次批量结算。
+
+    构造时把账本矩阵、串关簿、概率全部拷贝成私有数组，之后 run() 可以丢进工作线程跑，
+    进单线程继续改账本也互不干扰。没有外盘报价的场次按本场最坏赛果确定性结算 (保守口径)。
+    """
+    def __init__(self, pnl: np.ndarray, probs: np.ndarray, match_ids: Sequence[str], parlays: Sequence[tuple] = (), unpriced: Sequence[str] = ()):
+        self.match_ids = list(match_ids)
+        self.unpriced = list(unpriced)
+        self.pnl = np.ascontiguousarray(pnl, dtype=np.float64)
+        # 单场结算拆成两个阈值 (16 位均匀整数，概率分辨率 1/65536)：u < t0 打出主胜，t0 <= u < t1 客胜，否则平局
+        t0 = np.rint(probs[:, 0] * _RESOLUTION).astype(np.int64)
+        t1 = np.rint((1.0 - probs[:, 2]) * _RESOLUTION).astype(np.int64)  # 无平局时正好等于分辨率上限，永远抽不到平局
+        # pnl = 平局列之和 + [u<t0]·(主-客) + [u<t1]·(客-平)，两次矩阵-向量乘就结算完全部场次；
+        # 必然成立的项 (阈值顶格) 直接并进常数，16 位阈值就不会溢出
+        self._base = float(self.pnl[:, 2].sum())
+        self._terms: List[tuple] = []
+        for t, w in ((t0, self.pnl[:, 0] - self.pnl[:, 1]), (t1, self.pnl[:, 1] - self.pnl[:, 2])):
+            always = t >= _RESOLUTION
+            self._base += float(w[always].sum())
+            self._terms.append((np.minimum(t, _RESOLUTION - 1).astype(np.uint16), np.where(always, 0.0, w).astype(np.float32)))
+
+        # 串关：按腿数分组，组内各腿按 (串关, 第几腿) 拍平成连续列
+        row = {m_id: i for i, m_id in enumerate(self.match_ids)}
+        parlays = sorted(parlays, key=lambda p: len(p[1]))
+        leg_rows = np.array([row[m_id] for _, p_legs, _, _ in parlays for m_id, _ in p_legs], dtype=np.int64)
+        leg_sel = np.array([sel for _, p_legs, _, _ in parlays for _, sel in p_legs], dtype=np.int64)
+        counts = np.array([len(p_legs) for _, p_legs, _, _ in parlays], dtype=np.int64)
+        stake = np.array([p[2] for p in parlays], dtype=np.float64)
+        liability = np.array([p[3] for p in parlays], dtype=np.float64)
+        # 先只对串关涉及的场次解出赛果 (0/1/2)，每条腿再按列号取赛果比对
+        self._leg_cols, self._leg_pos = np.unique(leg_rows, return_inverse=True)
+        self._col_t0 = t0[self._leg_cols].astype(np.uint32)
+        self._col_t1 = t1[self._leg_cols].astype(np.uint32)
+        self._leg_sel = leg_sel.astype(np.uint8)
+        # 账本已按"其余腿全中"给每条腿记了边际盈亏 (命中 -负债，未中 +本金)，一张串关真实只结算一次：
+        #   修正 = (本金 - 腿数·本金) + 命中腿数·(本金+负债) - [全中]·(本金+负债)
+        swing = stake + liability
+        self._base += float((stake - counts * stake).sum())
+        self._leg_swing = np.repeat(swing, counts).astype(np.float32)
+        self._groups: List[tuple] = []  # (列起点, 列终点, 腿数, 该组各串关的 本金+负债)
+        col = 0
+        for k in np.unique(counts):
+            in_group = counts == k
+            self._groups.append((col, col + int(in_group.sum() * k), int(k), swing[in_group].astype(np.float32)))
+            col = self._groups[-1][1]
+        self.n_parlays = len(parlays)
+
+    @classmethod
+    def from_ledger(cls, ledger: GlobalLedger, sharp_market: Mapping[str, OddsDTO]) -> "PortfolioSimulator":
+        match_ids = ledger.match_ids
+        pnl = ledger.matrix.copy()
+        # 去水概率直接从快照定价表按行号取 (普通字典则只对账本里的场次临时建表)
+        prices = PriceTable.coerce(sharp_market, match_ids)
+        rows = np.array([prices.index.get(m_id, -1) for m_id in match_ids], dtype=np.int64)
+        priced = rows >= 0
+        probs = np.zeros((len(match_ids), 3), dtype=np.float64)
+        if priced.any(): probs[priced] = prices.probs[rows[priced]]
+        # 没报价的场次：概率全部压在本场最坏赛果上
+        unpriced_rows = np.flatnonzero(~priced)
+        probs[unpriced_rows, pnl[unpriced_rows].argmin(axis=1)] = 1.0
+        return cls(pnl, probs, match_ids, ledger.parlays.items(), [match_ids[i] for i in unpriced_rows])
+
+    def _parlay_adjustment(self, u: np.ndarray) -> np.ndarray:
+        """把账本里逐腿记的串关边际盈亏修正成每个场景下的真实结算：
+        一张串关碰到几场就按"其余腿全中"被记了几次 (选中 -负债，没选中 +本金)，实际只结算一次 —— 全中 -负债，否则 +本金"""
+        sub = np.take(u, self._leg_cols, axis=1)
+        outcome = (sub >= self._col_t0).view(np.uint8) + (sub >= self._col_t1).view(np.uint8)
+        hit = np.take(outcome, self._leg_pos, axis=1) == self._leg_sel
+        adjustment = hit.view(np.uint8) @ self._leg_swing
+        for start, stop, k, swing in self._groups:
+            # 组内第 j 条腿是步长为 k 的列切片，k 次按位与就得到每张串关是否全中
+            all_hit = hit[:, start:stop:k].copy()
+            for j in range(1, k): all_hit &= hit[:, start + j:stop:k]
+            adjustment -= all_hit.view(np.uint8) @ swing
+        return adjustment
+
+    def sample_pnl(self, n_scenarios: int, seed: Optional[int] = None, chunk_elements: int = None) -> np.ndarray:
+        """抽 n_scenarios 个全书场景，返回每个场景的总盈亏；同一 seed (且同一分块配置) 结果可复现"""
+        bits = np.random.default_rng(seed).bit_generator
+        n_matches = len(self.match_ids)
+        out = np.empty(n_scenarios, dtype=np.float64)
+        if n_matches == 0:
+            out.fill(0.0)
+            return out
+        # 分块抽样：每块 (场景 × 场次) 的均匀数不超过 chunk_elements，内存占用与总场景数无关
+        budget = settings.MC_CHUNK_ELEMENTS if chunk_elements is None else chunk_elements
+        chunk = max(1, budget // (n_matches + len(self._leg_sel)))
+        for start in range(0, n_scenarios, chunk):
+            stop = min(start + chunk, n_scenarios)
+            size = (stop - start) * n_matches
+            # 一个 64 位原始随机数切成 4 个 16 位均匀整数，比逐个生成浮点数快好几倍
+            u = bits.random_raw(-(-size // 4)).view(np.uint16)[:size].reshape(stop - start, n_matches)
+            pnl = self._base
+            for t, w in self._terms: pnl = pnl + (u < t).view(np.uint8) @ w
+            if self.n_parlays: pnl = pnl + self._parlay_adjustment(u)
+            out[start:stop] = pnl
+        return out
+
+    def run(self, n_scenarios: int = None, bankroll_limit: float = None, seed: Optional[int] = None, var_levels: Sequence[float] = (0.95, 0.99)) -> PortfolioRisk:
+        n_scenarios = settings.MC_SCENARIOS if n_scenarios is None else n_scenarios
+        bankroll_limit = settings.MC_BANKROLL_LIMIT if bankroll_limit is None else bankroll_limit
+        started = time.perf_counter()
+        pnl = self.sample_pnl(n_scenarios, seed)
+        var: Dict[float, float] = {}; cvar: Dict[float, float] = {}
+        for level in var_levels:
+            # VaR/CVaR 以正数表示亏损：左尾 (1-level) 分位点，以及分位点以下场景的平均亏损
+            cutoff = float(np.quantile(pnl, 1.0 - level))
+            var[level] = -cutoff
+            cvar[level] = -float(pnl[pnl <= cutoff].mean())
+        return PortfolioRisk(
+            n_scenarios=n_scenarios, n_matches=len(self.match_ids), n_parlays=self.n_parlays, seed=seed,
+            expected_pnl=float(pnl.mean()), pnl_std=float(pnl.std()), worst_pnl=float(pnl.min()),
+            var=var, cvar=cvar, bankroll_limit=bankroll_limit, breach_probability=float((pnl < -bankroll_limit).mean()),
+            unpriced_matches=self.unpriced, elapsed=time.perf_counter() - started,
+        )
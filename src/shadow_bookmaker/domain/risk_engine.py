@@ -1,37 +1,48 @@
 import math
-from typing import Dict
+import numpy as np
+from typing import Dict, List, Mapping
 from src.shadow_bookmaker.domain.models import CustomerTicket, RiskDecision, OddsDTO
-from src.shadow_bookmaker.domain.ledger import GlobalLedger
+from src.shadow_bookmaker.domain.ledger import GlobalLedger, OUTCOMES as _OUTCOMES
+from src.shadow_bookmaker.domain.devig import PriceTable
+from src.shadow_bookmaker.infrastructure.metrics import metrics
+
+# 批量通道里的选项编码：列下标 0/1/2 = 主/客/平 (与账本矩阵列顺序一致)
+_SEL_IDX = {sel: i for i, sel in enumerate(_OUTCOMES)}
 
 class RiskEngine:
-    def __init__(self, ledger: GlobalLedger, max_global_liability: float = 30000.0, min_house_edge: float = -0.05):
+    def __init__(self, ledger: GlobalLedger, max_global_liability: float = 30000.0, min_house_edge: float = -0.05, max_snapshot_age: float = float("inf"), devig_method: str = None):
         self.ledger = ledger
+        # 传进来的盘口是普通字典时临时建表用的去水方法 (编排器每轮快照已经按 settings.DEVIG_METHOD 建好了表)
+        self.devig_method = devig_method
+        # 外盘快照超过该秒数就拒绝定价 (宁可不接也不拿过期价格去算)
+        self.max_snapshot_age = max_snapshot_age
         # ⚠️ 系统红线升级：单场比赛【全局最高承受】 3 万净亏损
         self.max_global_liability = max_global_liability 
         self.min_house_edge = min_house_edge
 
-    def _calculate_true_prob(self, market_odds: OddsDTO, selection: str) -> float:
-        p_home = 1.0 / market_odds.home_odds; p_away = 1.0 / market_odds.away_odds
-        p_draw = 1.0 / (market_odds.draw_odds or 1.0) if market_odds.draw_odds else 0.0
-        margin = p_home + p_away + p_draw
-        if selection == "home": return p_home / margin
-        elif selection == "away": return p_away / margin
-        return p_draw / margin
-        
-    def _get_sharp_odds(self, market_odds: OddsDTO, selection: str) -> float:
-        if selection == "home": return market_odds.home_odds
-        elif selection == "away": return market_odds.away_odds
-        return market_odds.draw_odds or 0.0
+    def _prices(self, sharp_market: Mapping[str, OddsDTO], tickets: List[CustomerTicket]) -> PriceTable:
+        """定价表：快照自带的直接用；普通字典只对这批单子涉及的场次临时去水"""
+        return PriceTable.coerce(sharp_market, (leg.match_id for t in tickets for leg in t.legs), self.devig_method)
+
+    def _multi_breach_reason(self, breached: int) -> str:
+        return f"串关有 {breached} 条腿同时击穿红线，单腿对冲填不平，拒单"
+
+    def _stale_reason(self, snapshot_age: float) -> str:
+        return f"外盘数据已过期 {snapshot_age:.0f} 秒 (上限 {self.max_snapshot_age:.0f} 秒)，暂停定价"
 
-    def evaluate(self, ticket: CustomerTicket, sharp_market: Dict[str, OddsDTO]) -> RiskDecision:
+    @metrics.timed("risk.evaluate")
+    def evaluate(self, ticket: CustomerTicket, sharp_market: Mapping[str, OddsDTO], snapshot_age: float = 0.0) -> RiskDecision:
+        if snapshot_age > self.max_snapshot_age: return self._reject(ticket, 0, 0, self._stale_reason(snapshot_age))
+        prices = self._prices(sharp_market, [ticket])
         combined_true_prob = 1.0
         leg_details = []
 
         for leg in ticket.legs:
-            if leg.match_id not in sharp_market: return self._reject(ticket, 0, 0, f"缺失外盘数据: {leg.match_id}")
-            market = sharp_market[leg.match_id]
-            sharp_odds = self._get_sharp_odds(market, leg.selection)
-            true_prob = self._calculate_true_prob(market, leg.selection)
+            if leg.match_id not in prices: return self._reject(ticket, 0, 0, f"缺失外盘数据: {leg.match_id}")
+            # ⚡ 逐腿定价只是查表：去水概率与锚点赔率在建表时已整列算好
+            col = _SEL_IDX[leg.selection]
+            sharp_odds = prices.sharp_odds(leg.match_id, col)
+            true_prob = prices.prob(leg.match_id, col)
             combined_true_prob *= true_prob
             leg_details.append({"leg": leg, "sharp_odds": sharp_odds, "true_prob": true_prob})
 
@@ -39,32 +50,66 @@ class RiskEngine:
         if house_ev < self.min_house_edge: 
             return self._reject(ticket, house_ev, combined_true_prob, f"毒药单拦截。庄家期望: {house_ev*100:.1f}%")
 
-        # 将风险等效映射到最容易打出的那条“危险腿”上进行账本测算
-        danger_leg_info = max(leg_details, key=lambda x: x["true_prob"])
-        danger_leg = danger_leg_info["leg"]
-        sharp_odds = danger_leg_info["sharp_odds"]
+        if len(ticket.legs) > 1:
+            # 🎯 串关沙盘：每条腿按"其余腿全中"在所在场次记一次边际盈亏，逐场看"这条腿也打出"时的单场盈亏；
+            #    最惨的那条腿就是危险腿，击穿红线时拿它去外盘对冲 (对冲只能填平它自己那一场、那个赛果的窟窿)
+            future_worst_case = None
+            breached = 0
+            for info in leg_details:
+                leg = info["leg"]
+                state = self.ledger.simulate_bet(leg.match_id, leg.selection, ticket.stake, ticket.liability)
+                breached += state[leg.selection] < -self.max_global_liability
+                if future_worst_case is None or state[leg.selection] < future_worst_case:
+                    future_worst_case, danger_leg_info, simulated_state = state[leg.selection], info, state
+            if breached > 1: return self._reject(ticket, house_ev, combined_true_prob, self._multi_breach_reason(breached))
+            danger_leg = danger_leg_info["leg"]
+            sharp_odds = danger_leg_info["sharp_odds"]
+        else:
+            # 将风险等效映射到最容易打出的那条“危险腿”上进行账本测算
+            danger_leg_info = max(leg_details, key=lambda x: x["true_prob"])
+            danger_leg = danger_leg_info["leg"]
+            sharp_odds = danger_leg_info["sharp_odds"]
 
-        # 🎯 沙盘推演：假设全额吃下这笔单，全局盈亏矩阵会怎样？
-        simulated_state = self.ledger.simulate_bet(danger_leg.match_id, danger_leg.selection, ticket.stake, ticket.liability)
-        
-        # 最坏情况：无论真实世界打出主、客、平，我们在矩阵里会面临的最大亏损 (通常是负数)
-        future_worst_case = min(simulated_state.values())
+            # 🎯 沙盘推演：假设全额吃下这笔单，全局盈亏矩阵会怎样？
+            simulated_state = self.ledger.simulate_bet(danger_leg.match_id, danger_leg.selection, ticket.stake, ticket.liability)
+            
+            # 最坏情况：无论真实世界打出主、客、平，我们在矩阵里会面临的最大亏损 (通常是负数)
+            future_worst_case = min(simulated_state.values())
+        hedge_row = [simulated_state[o] for o in _OUTCOMES]
+        return RiskDecision(**self._route(ticket, house_ev, combined_true_prob, future_worst_case, danger_leg.match_id, danger_leg.selection, sharp_odds, hedge_row))
+
+    def _route(self, ticket: CustomerTicket, house_ev: float, prob: float, future_worst_case: float, danger_match_id: str, danger_selection: str, sharp_odds: float, hedge_row: List[float] = None) -> dict:
+        """智能路由：根据沙盘最坏盈亏决定全吃还是泄洪对冲 (标量/批量两条通道共用，保证裁决一字不差)
 
+        hedge_row 是全额吃下后危险腿所在场次的 (主/客/平) 盈亏。对冲只能买危险腿所选的赛果：
+        泄洪量按该赛果超出红线的部分算，而对冲本金会从其余赛果里扣，扣完击穿红线的就不能接。
+        """
+        sel = _SEL_IDX[danger_selection]
+        exposed = future_worst_case if hedge_row is None else hedge_row[sel]
+        others_worst = float("inf") if hedge_row is None else min(v for k, v in enumerate(hedge_row) if k != sel)
         # 情况 1：未击穿全局防爆仓红线
         if future_worst_case >= -self.max_global_liability:
-            return RiskDecision(
+            return self._safe(ticket.ticket_id, house_ev, prob, future_worst_case, ticket.stake, ticket.liability, danger_match_id, danger_selection)
+            
+        # 情况 2：击穿的是本场其他赛果 —— 这张单在那些赛果上是 +本金 (反向减仓)，按本单选项去外盘对冲只会雪上加霜
+        excess_liability = -exposed - self.max_global_liability
+        if excess_liability <= 0:
+            return dict(
                 ticket_id=ticket.ticket_id, action="ACCEPT_B_BOOK",
-                reason=f"全局水位安全。吃下后本场最坏盈亏为 ¥{future_worst_case:.0f} (未破 ¥-{self.max_global_liability} 红线)。全吃入库。",
-                house_ev=house_ev, true_probability=combined_true_prob, b_book_stake=ticket.stake,
+                reason=f"本场其他赛果已击穿红线 (最坏 ¥{future_worst_case:.0f})，此单方向反向减仓 (本选项盈亏 ¥{exposed:.0f})。全吃入库。",
+                house_ev=house_ev, true_probability=prob, b_book_stake=ticket.stake,
                 retained_stake=ticket.stake, retained_liability=ticket.liability,
-                danger_match_id=danger_leg.match_id, danger_selection=danger_leg.selection
+                danger_match_id=danger_match_id, danger_selection=danger_selection
             )
-            
-        # 🚨 情况 2：溢出红线！触发智能泄洪，去外网抛盘对冲！
-        excess_liability = abs(future_worst_case) - self.max_global_liability
-        
+        if sharp_odds <= 1.0:
+            return dict(ticket_id=ticket.ticket_id, action="REJECT", reason="击穿红线且外盘没有该选项的报价，无法对冲", house_ev=house_ev, true_probability=prob)
+
+        # 🚨 情况 3：溢出红线！触发智能泄洪，去外网抛盘对冲！        
         # 精确计算：去大盘抛出多少注码，赢回来的钱能正好填平这个超出的窟窿
         hedge_stake = math.ceil((excess_liability / (sharp_odds - 1.0)) / 50.0) * 50.0
+        if others_worst - hedge_stake < -self.max_global_liability:
+            return dict(ticket_id=ticket.ticket_id, action="REJECT", house_ev=house_ev, true_probability=prob,
+                        reason=f"击穿红线且无法对冲：对冲 ¥{hedge_stake:.0f} 后本场其他赛果将亏到 ¥{others_worst - hedge_stake:.0f}，拒单")
         
         # 数学剥离：剥掉外围抛盘对冲的部分后，真正截留在自己底仓的本金和负债
         retained_stake = ticket.stake - hedge_stake
@@ -72,14 +117,197 @@ class RiskEngine:
 
         action = "ACCEPT_PARTIAL_HEDGE" if retained_stake > 0 else "ACCEPT_A_BOOK_HEDGE"
 
-        return RiskDecision(
+        return dict(
             ticket_id=ticket.ticket_id, action=action,
             reason=f"⚠️ 击穿警告！吃下此单最坏盈亏达 ¥{future_worst_case:.0f}。启动降维对冲以削减敞口。",
-            house_ev=house_ev, true_probability=combined_true_prob, 
+            house_ev=house_ev, true_probability=prob, 
             hedge_stake=hedge_stake, hedge_odds=sharp_odds, b_book_stake=max(0.0, retained_stake),
             retained_stake=retained_stake, retained_liability=retained_liability,
-            danger_match_id=danger_leg.match_id, danger_selection=danger_leg.selection
+            danger_match_id=danger_match_id, danger_selection=danger_selection
         )
 
+    def _safe(self, ticket_id: str, house_ev: float, prob: float, future_worst_case: float, stake: float, liability: float, danger_match_id: str, danger_selection: str) -> dict:
+        """未击穿红线：全额 B-Book 吃下 (批量快速通道直接拿数组里的本金/负债调用，省掉逐张重算总赔率)"""
+        return dict(
+            ticket_id=ticket_id, action="ACCEPT_B_BOOK",
+            reason=f"全局水位安全。吃下后本场最坏盈亏为 ¥{future_worst_case:.0f} (未破 ¥-{self.max_global_liability} 红线)。全吃入库。",
+            house_ev=house_ev, true_probability=prob, b_book_stake=stake,
+            retained_stake=stake, retained_liability=liability,
+            danger_match_id=danger_match_id, danger_selection=danger_selection
+        )
+
+    @metrics.timed("risk.evaluate_batch")
+    def evaluate_batch(self, tickets: List[CustomerTicket], sharp_market: Mapping[str, OddsDTO], snapshot_age: float = 0.0) -> List[RiskDecision]:
+        """批量风控引擎：开赛前洪峰进单专用。
+
+        去水概率直接取定价表的整列，组合概率、庄家期望、危险腿全部在 NumPy 数组上一次算完；
+        账本推演按进单顺序串行生效 —— 前一张被放行的单子 (按截留后的本金/负债) 会推高同场下一张单看到的水位，
+        等价于逐张 evaluate + commit，但全程不碰 GlobalLedger 的真实状态。
+        """
+        n = len(tickets)
+        if n == 0: return []
+        # 单张单子没有先后关系，标量通道就是同一个裁决，还省掉建数组的固定开销 (比较后提交、低峰期的微批大多是这种)
+        if n == 1: return [self.evaluate(tickets[0], sharp_market, snapshot_age)]
+        if snapshot_age > self.max_snapshot_age:
+            reason = self._stale_reason(snapshot_age)
+            return [self._reject(t, 0, 0, reason) for t in tickets]
+
+        # 1️⃣ 定价表：(场次 × 主/客/平) 的锚点赔率与去水概率，无平局盘口的平局概率记 0
+        prices = self._prices(sharp_market, tickets)
+        match_ids, match_idx, odds, true_probs = prices.match_ids, prices.index, prices.odds, prices.probs
+
+        # 2️⃣ 所有单子的腿拍平成 (单据 × 腿) 的填充矩阵
+        n_legs = np.fromiter((len(t.legs) for t in tickets), dtype=np.int64, count=n)
+        max_legs = int(n_legs.max())
+        leg_valid = np.arange(max_legs) < n_legs[:, None]  # 按行展开的顺序正好是逐单逐腿的顺序
+        leg_match = np.full((n, max_legs), -1, dtype=np.int64)
+        leg_sel = np.zeros((n, max_legs), dtype=np.int64)
+        leg_match[leg_valid] = [match_idx.get(leg.match_id, -1) for t in tickets for leg in t.legs]
+        leg_sel[leg_valid] = [_SEL_IDX[leg.selection] for t in tickets for leg in t.legs]
+        stakes = np.fromiter((t.stake for t in tickets), dtype=np.float64, count=n)
+        total_odds = np.fromiter((t.total_odds for t in tickets), dtype=np.float64, count=n)
+        liabilities = (stakes * total_odds) - stakes
+
+        missing = leg_valid & (leg_match < 0)
+        has_missing = missing.any(axis=1)
+        safe_match = np.where(leg_match < 0, 0, leg_match)
+        if len(match_ids):
+            leg_prob = true_probs[safe_match, leg_sel]
+            leg_sharp = odds[safe_match, leg_sel]
+        else:
+            leg_prob = np.zeros((n, max_legs)); leg_sharp = np.zeros((n, max_legs))
+
+        # 组合真实概率：按腿顺序逐个连乘 (与标量通道的乘法顺序一致)
+        combined = np.ones(n, dtype=np.float64)
+        for j in range(max_legs):
+            combined = np.where(leg_valid[:, j], combined * leg_prob[:, j], combined)
+        house_ev = 1.0 - (combined * total_odds)
+        poison = ~has_missing & (house_ev < self.min_house_edge)
+
+        # 危险腿：真实概率最大的那条 (并列取最靠前的，与 max() 行为一致)
+        danger_col = np.argmax(np.where(leg_valid, leg_prob, -np.inf), axis=1) if max_legs else np.zeros(n, dtype=np.int64)
+        rows = np.arange(n)
+        danger_match = leg_match[rows, danger_col]
+        danger_sel = leg_sel[rows, danger_col]
+        danger_sharp = leg_sharp[rows, danger_col]
+
+        # 3️⃣ 串行账本推演：本批次碰到的场次一次性从账本取成一张草稿矩阵，推演全程只改草稿，不碰 GlobalLedger 的真实状态。
+        #    单关只影响自己那一场，只和碰过同一场的串关有先后关系：按 (场次, 纪元 = 之前有几张串关碰过这一场) 分段，
+        #    没被串关隔开的单关整批走向量化快速通道，串关按进单顺序逐张逐腿推演，推演前先把它碰到的场次上排在它前面的单关走完
+        live = ~has_missing & ~poison
+        is_parlay = n_legs > 1
+        worst_cases = np.zeros(n, dtype=np.float64)
+        routed: Dict[int, dict] = {}
+        touched = np.unique(leg_match[leg_valid & live[:, None]])
+        draft = self.ledger.state_rows([match_ids[k] for k in touched.tolist()])
+        slot = np.searchsorted(touched, np.where(leg_match < 0, 0, leg_match))  # (单据 × 腿) -> 草稿行号
+        danger_slot = slot[rows, danger_col]
+        delta_all = np.repeat(stakes[:, None], 3, axis=1)
+        delta_all[rows, danger_sel] = -liabilities
+        # 逐张推演的循环里只碰 Python 标量 (NumPy 标量的逐个下标访问比列表慢一个数量级)
+        ev_l, prob_l, stake_l, liab_l = house_ev.tolist(), combined.tolist(), stakes.tolist(), liabilities.tolist()
+        sel_l, sharp_l, slot_l, leg_sel_l, leg_sharp_l = danger_sel.tolist(), danger_sharp.tolist(), slot.tolist(), leg_sel.tolist(), leg_sharp.tolist()
+
+        def walk(s: int, idx: List[int]):
+            # 逐张推演：放行即生效，按截留部分推高水位，下一张同场单子看到的是吃下本单后的敞口
+            m_id = match_ids[int(touched[s])]
+            state = draft[s].tolist()
+            for i in idx:
+                sel = sel_l[i]
+                hedge_row = [v - liab_l[i] if c == sel else v + stake_l[i] for c, v in enumerate(state)]
+                worst_cases[i] = worst = min(hedge_row)
+                kwargs = self._route(tickets[i], ev_l[i], prob_l[i], worst, m_id, _OUTCOMES[sel], sharp_l[i], hedge_row)
+                if kwargs["action"] != "REJECT":
+                    state = [v - kwargs["retained_liability"] if c == sel else v + kwargs["retained_stake"] for c, v in enumerate(state)]
+                routed[i] = kwargs
+            draft[s] = state
+
+        def run_singles(run: np.ndarray):
+            order = run[np.argsort(danger_slot[run], kind="stable")]
+            g = danger_slot[order]
+            m = len(order)
+            starts = np.flatnonzero(np.diff(g, prepend=-1))
+            ends = np.append(starts[1:], m)
+            gid = np.repeat(np.arange(len(starts)), ends - starts)
+            # 快速通道：假设全部 B-Book 全吃，整段一次 cumsum，减掉前面各组的累计量再垫上本场当前水位，就是每组沿进单顺序的水位路径
+            deltas = delta_all[order]
+            csum = np.cumsum(deltas, axis=0)
+            carry = csum[starts] - deltas[starts]
+            path = draft[g] + (csum - carry[gid])
+            worst = path.min(axis=1)
+            # 每组第一次击穿红线的位置：之前的单子全吃，从它开始对冲会改变截留部分，剩下的只能逐张推演
+            pos = np.arange(m)
+            cut = np.minimum(np.minimum.reduceat(np.where(worst < -self.max_global_liability, pos, m), starts), ends)
+            fast = pos < cut[gid]
+            worst_cases[order[fast]] = worst[fast]
+            moved = cut > starts
+            draft[g[starts[moved]]] = path[cut[moved] - 1]
+            for k in np.flatnonzero(cut < ends).tolist():
+                walk(int(g[starts[k]]), order[cut[k]:ends[k]].tolist())
+
+        def book(s: int, sel: int, stake: float, liability: float):
+            # 与 GlobalLedger.commit_bets 同一算式：选中 -负债，其余 +本金
+            row = draft[s]
+            picked = row[sel]
+            row += stake
+            row[sel] = picked - liability
+
+        def run_parlay(i: int):
+            t = tickets[i]
+            # 逐腿推演 (与标量通道同一算式、同一顺序)：最坏的那条腿决定裁决，也是对冲腿
+            worst = None
+            breached = 0
+            for j in range(len(t.legs)):
+                leg_worst = float(draft[slot_l[i][j], leg_sel_l[i][j]]) - liab_l[i]
+                breached += leg_worst < -self.max_global_liability
+                if worst is None or leg_worst < worst: worst, col = leg_worst, j
+            worst_cases[i] = worst
+            if breached > 1:
+                routed[i] = dict(ticket_id=t.ticket_id, action="REJECT", reason=self._multi_breach_reason(breached), house_ev=ev_l[i], true_probability=prob_l[i])
+                return
+            s_danger, sel_danger = slot_l[i][col], leg_sel_l[i][col]
+            hedge_row = [v - liab_l[i] if c == sel_danger else v + stake_l[i] for c, v in enumerate(draft[s_danger].tolist())]
+            kwargs = self._route(t, ev_l[i], prob_l[i], worst, match_ids[int(leg_match[i, col])], _OUTCOMES[sel_danger], leg_sharp_l[i][col], hedge_row)
+            routed[i] = kwargs
+            if kwargs["action"] == "REJECT": return
+            # 串关本身全额进簿 (每条腿记一次边际盈亏)；对冲是危险腿上的一笔外盘单关，单独记在危险腿所在的场次
+            for j in range(len(t.legs)): book(slot_l[i][j], leg_sel_l[i][j], t.stake, t.liability)
+            if kwargs.get("hedge_stake", 0.0) > 0:
+                book(s_danger, sel_danger, -kwargs["hedge_stake"], -(kwargs["hedge_stake"] * (kwargs["hedge_odds"] - 1.0)))
+
+        epoch = [0] * len(touched)
+        first, parlays = [], []
+        pending: Dict[tuple, List[int]] = {}
+        for i in np.flatnonzero(live).tolist():
+            if is_parlay[i]:
+                parlays.append(i)
+                for s in slot_l[i][:n_legs[i]]: epoch[s] += 1
+            else:
+                s = slot_l[i][0]
+                (first if epoch[s] == 0 else pending.setdefault((s, epoch[s]), [])).append(i)
+        if first: run_singles(np.array(first))
+        epoch = [0] * len(touched)
+        for i in parlays:
+            legs = slot_l[i][:n_legs[i]]
+            for s in legs:
+                if (s, epoch[s]) in pending: walk(s, pending.pop((s, epoch[s])))
+            run_parlay(i)
+            for s in legs: epoch[s] += 1
+        if pending: run_singles(np.array([i for idx in pending.values() for i in idx]))
+
+        # 4️⃣ 裁决一次成型：model_validate 吃现成的字典，比逐字段 model_construct 还快
+        decisions: List[RiskDecision] = []
+        for i, (t, lost, bad, worst, m) in enumerate(zip(tickets, has_missing.tolist(), poison.tolist(), worst_cases.tolist(), danger_match.tolist())):
+            if lost:
+                first_missing = t.legs[int(np.argmax(missing[i]))].match_id
+                decisions.append(self._reject(t, 0, 0, f"缺失外盘数据: {first_missing}"))
+            elif bad:
+                decisions.append(self._reject(t, ev_l[i], prob_l[i], f"毒药单拦截。庄家期望: {ev_l[i]*100:.1f}%"))
+            else:
+                # 没进 routed 的都是快速通道全吃的单子 (最坏盈亏没破红线)
+                kwargs = routed.get(i) or self._safe(t.ticket_id, ev_l[i], prob_l[i], worst, stake_l[i], liab_l[i], match_ids[m], _OUTCOMES[sel_l[i]])
+                decisions.append(RiskDecision.model_validate(kwargs))
+        return decisions
+
     def _reject(self, ticket: CustomerTicket, ev: float, prob: float, reason: str) -> RiskDecision:
-        return RiskDecision(ticket_id=ticket.ticket_id, action="REJECT", reason=reason, house_ev=ev, true_probability=prob)
\ No newline at end of file
+        return RiskDecision.model_validate(dict(ticket_id=ticket.ticket_id, action="REJECT", reason=reason, house_ev=ev, true_probability=prob))
\ No newline at end of file
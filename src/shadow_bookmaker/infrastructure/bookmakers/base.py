@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import List
+from typing import Dict, Iterable, List, Optional
 from src.shadow_bookmaker.domain.models import OddsDTO
 
 class BaseBookmaker(ABC):
@@ -8,4 +8,8 @@ class BaseBookmaker(ABC):
     @abstractmethod
     def name(self) -> str: pass
     @abstractmethod
-    async def fetch_odds(self) -> List[OddsDTO]: pass
\ No newline at end of file
+    async def fetch_odds(self) -> List[OddsDTO]: pass
+    async def aclose(self): pass  # 持有网络连接的数据源在这里释放
+    def watch(self, match_ids: Iterable[str]): pass  # 编排器告知有敞口的场次；分级轮询的源会优先刷新它们
+    def next_poll_in(self) -> Optional[float]: return None  # 分级轮询的源告诉编排器多久后有联赛到点；None = 跟随固定节奏
+    def quote_ttls(self) -> Dict[str, float]: return {}  # 分级轮询的源按各联赛的轮询间隔给出单场报价 TTL；空 = 用行情库的默认 TTL
\ No newline at end of file
@@ -0,0 +1,54 @@
+import math
+import time
+from typing import Callable, List, Optional, Sequence, Tuple
+import numpy as np
+from src.shadow_bookmaker.infrastructure.bookmakers.odds_parser import RawQuote
+
+class MarketSimulator:
+    """合成行情：n 场比赛的真实概率在 logit 空间做带种子的随机游走，按抽水报出三项盘赔率 (容量规划 / 离线压测用)。
+
+    每场有主、客两个相对平局的 logit；时钟每走过一个 tick，全部场次一起走一步高斯游走，偶尔叠加一次跳变 (进球、伤停消息)。
+    状态只在被读取时按经过的 tick 数补走 (k 步合并成一次 √k 倍的抽样)，所以同样的种子 + 同样的读取时刻永远得到同样的盘口。
+    赔率按两位小数报价：小幅游走经常不改变报价，行情库的增量合并与真实盘口一样只看到少数场次在动。
+    """
+    def __init__(self, n_matches: int = 2000, seed: int = 7, volatility: float = 0.02, margin: float = 0.03,
+                 jump_rate: float = 0.002, two_way_share: float = 0.0, tick: float = 60.0,
+                 teams: Optional[Sequence[Tuple[str, str]]] = None, clock: Callable[[], float] = time.time):
+        self.n_matches = len(teams) if teams is not None else n_matches
+        self.volatility, self.margin, self.jump_rate, self.tick, self.clock = volatility, margin, jump_rate, tick, clock
+        self._rng = np.random.default_rng(seed)
+        self.teams: List[Tuple[str, str]] = list(teams) if teams is not None else [(f"Sim Home {i}", f"Sim Away {i}") for i in range(self.n_matches)]
+        self.match_ids: List[str] = [f"{home} vs {away}" for home, away in self.teams]
+        self.index = {m_id: i for i, m_id in enumerate(self.match_ids)}
+        # 主队略占优：主/客 logit 的中心分别在 0.35 / 0.0 (相对平局)，散开后覆盖从一边倒到五五开的各种盘
+        self._logits = np.column_stack([self._rng.normal(0.35, 0.6, self.n_matches), self._rng.normal(0.0, 0.6, self.n_matches)])
+        self.two_way = self._rng.random(self.n_matches) < two_way_share  # 没有平局的两项盘
+        self._step = math.floor(clock() / tick)
+
+    def advance(self, now: float = None) -> int:
+        """补走到 now 所在的 tick，返回走了几步"""
+        step = math.floor((self.clock() if now is None else now) / self.tick)
+        k = step - self._step
+        if k <= 0: return 0
+        self._step = step
+        self._logits += self._rng.normal(0.0, self.volatility * math.sqrt(k), self._logits.shape)
+        jumps = self._rng.random(self.n_matches) < -math.expm1(-self.jump_rate * k)  # k 个 tick 里至少跳一次的概率
+        if jumps.any(): self._logits[jumps] += self._rng.normal(0.0, 0.5, (int(jumps.sum()), 2))
+        return k
+
+    def probs(self) -> np.ndarray:
+        """(场次 × 主/客/平) 真实概率；两项盘的平局为 0"""
+        z = np.column_stack([self._logits, np.where(self.two_way, -np.inf, 0.0)])
+        e = np.exp(z - z.max(axis=1, keepdims=True))
+        return e / e.sum(axis=1, keepdims=True)
+
+    def odds(self) -> np.ndarray:
+        """(场次 × 主/客/平) 报价：真实概率加抽水取倒数、按两位小数报出；两项盘的平局为 0"""
+        self.advance()
+        p = self.probs()
+        with np.errstate(divide="ignore"):
+            return np.where(p > 0, np.maximum(np.round(1.0 / (p * (1.0 + self.margin)), 2), 1.01), 0.0)
+
+    def quotes(self) -> List[RawQuote]:
+        """当前全部场次的 (主队, 客队, match_id, 主胜, 客胜, 平局) 裸元组，直接喂给 OddsBatch"""
+        return [(home, away, m_id, h, a, d) for (home, away), m_id, (h, a, d) in zip(self.teams, self.match_ids, self.odds().tolist())]
@@ -2,6 +2,9 @@ import asyncio
 from typing import List
 from src.shadow_bookmaker.infrastructure.bookmakers.base import BaseBookmaker
 from src.shadow_bookmaker.domain.models import OddsDTO
+from src.shadow_bookmaker.infrastructure.bookmakers.market_sim import MarketSimulator
+from src.shadow_bookmaker.infrastructure.bookmakers.odds_parser import OddsBatch
+from src.shadow_bookmaker.config import settings
 
 class PinnacleMock(BaseBookmaker):
     @property
@@ -32,6 +35,19 @@ class PinnacleMock(BaseBookmaker):
             )
         ]
 
+class SimulatedBookmaker(BaseBookmaker):
+    """合成锚点盘：SIM_MATCHES 场比赛，赔率按带种子的随机游走变动 (容量规划 / 离线压测用，替代只有两场的 PinnacleMock)"""
+    def __init__(self, mapper, simulator: MarketSimulator = None):
+        super().__init__(mapper)
+        self.simulator = simulator or MarketSimulator(settings.SIM_MATCHES, settings.SIM_SEED, settings.SIM_VOLATILITY, jump_rate=settings.SIM_JUMP_RATE)
+
+    @property
+    def name(self) -> str: return "Pinnacle"
+
+    async def fetch_odds(self) -> List[OddsDTO]:
+        # 合成队名本身就是标准名，不过队名清洗；与真实源一样走列式批次，返回轻量视图
+        return OddsBatch(self.name, self.simulator.quotes()).views()
+
 class ScraperMock(BaseBookmaker):
     @property
     def name(self) -> str: return "WildScraper"
@@ -0,0 +1,104 @@
+import math
+from typing import Iterable, Iterator, List, Optional, Tuple
+import numpy as np
+from src.shadow_bookmaker.domain.models import OddsDTO
+
+# (home_team, away_team, match_id, 主胜赔率, 客胜赔率, 平局赔率) —— 解析阶段只产出裸元组，不建任何对象
+RawQuote = Tuple[str, str, str, float, float, float]
+
+def iter_h2h_quotes(data: Iterable[dict], mapper, bookmaker_key: str = "pinnacle") -> Iterator[RawQuote]:
+    """流式遍历 The Odds API 响应，逐条吐出指定庄家的 h2h 报价 (未校验)"""
+    for match in data:
+        home_raw = match.get("home_team", "")
+        away_raw = match.get("away_team", "")
+        if not home_raw or not away_raw: continue
+
+        home_team = away_team = match_id = None
+        for bookie in match.get("bookmakers", []):
+            if bookie["key"] != bookmaker_key: continue
+            for market in bookie.get("markets", []):
+                if market["key"] != "h2h": continue
+                if match_id is None:
+                    # 只有真的有报价才去洗队名，没报价的比赛不花这份钱
+                    home_team = mapper.standardize(home_raw)
+                    away_team = mapper.standardize(away_raw)
+                    match_id = f"{home_team} vs {away_team}"
+                h_odds = a_odds = d_odds = 0.0
+                for outcome in market["outcomes"]:
+                    name = outcome["name"]
+                    if name == home_raw: h_odds = outcome["price"]
+                    elif name == away_raw: a_odds = outcome["price"]
+                    elif name.lower() == "draw": d_odds = outcome["price"]
+                yield home_team, away_team, match_id, h_odds, a_odds, d_odds
+            break  # 每场比赛里同一家庄只出现一次，找到就不用再扫剩下的庄家
+
+class OddsBatch:
+    """列式报价批次：整批一次性校验 (向量化)，之后按下标零拷贝读取；fetched_at 是整批从源头抓到的时间"""
+    __slots__ = ("bookmaker", "match_ids", "home_teams", "away_teams", "home_odds", "away_odds", "draw_odds", "fetched_at")
+
+    def __init__(self, bookmaker: str, quotes: Iterable[RawQuote], fetched_at: Optional[float] = None):
+        self.bookmaker = bookmaker
+        self.fetched_at = fetched_at
+        rows = list(quotes)
+        home_teams, away_teams, match_ids, h, a, d = zip(*rows) if rows else ((), (), (), (), (), ())
+        h = np.asarray(h, dtype=np.float64); a = np.asarray(a, dtype=np.float64); d = np.asarray(d, dtype=np.float64)
+        # 批量校验：主/客赔率必须 > 1.0 (对应 OddsDTO 的 gt=1.0 约束)，平局 <= 1.0 视为未开盘
+        keep = np.flatnonzero((h > 1.0) & (a > 1.0))
+        self.match_ids: List[str] = [match_ids[i] for i in keep]
+        self.home_teams: List[str] = [home_teams[i] for i in keep]
+        self.away_teams: List[str] = [away_teams[i] for i in keep]
+        self.home_odds = h[keep]
+        self.away_odds = a[keep]
+        self.draw_odds = np.where(d[keep] > 1.0, d[keep], np.nan)
+
+    def __len__(self) -> int:
+        return len(self.match_ids)
+
+    def views(self) -> List["OddsView"]:
+        return [OddsView(self, i) for i in range(len(self))]
+
+    def to_dtos(self) -> List[OddsDTO]:
+        return [v.to_dto() for v in self.views()]
+
+class OddsView:
+    """OddsDTO 的惰性只读视图：属性按需从列式批次里取，接口与 OddsDTO 一致"""
+    __slots__ = ("_batch", "_i")
+
+    def __init__(self, batch: OddsBatch, i: int):
+        self._batch = batch
+        self._i = i
+
+    @property
+    def bookmaker(self) -> str: return self._batch.bookmaker
+    @property
+    def match_id(self) -> str: return self._batch.match_ids[self._i]
+    @property
+    def home_team(self) -> str: return self._batch.home_teams[self._i]
+    @property
+    def away_team(self) -> str: return self._batch.away_teams[self._i]
+    @property
+    def home_odds(self) -> float: return float(self._batch.home_odds[self._i])
+    @property
+    def away_odds(self) -> float: return float(self._batch.away_odds[self._i])
+    @property
+    def draw_odds(self) -> Optional[float]:
+        d = float(self._batch.draw_odds[self._i])
+        return None if math.isnan(d) else d
+    @property
+    def fetched_at(self) -> Optional[float]: return self._batch.fetched_at
+
+    def to_dto(self) -> OddsDTO:
+        return OddsDTO.model_construct(bookmaker=self.bookmaker, match_id=self.match_id, home_team=self.home_team, away_team=self.away_team,
+                                       home_odds=self.home_odds, away_odds=self.away_odds, draw_odds=self.draw_odds, fetched_at=self.fetched_at)
+
+    def model_dump(self) -> dict:
+        return self.to_dto().model_dump()
+
+    def __eq__(self, other) -> bool:
+        fields = ("bookmaker", "match_id", "home_team", "away_team", "home_odds", "away_odds", "draw_odds")
+        return all(getattr(self, f) == getattr(other, f, None) for f in fields)
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f"OddsView(match_id={self.match_id!r}, home={self.home_odds}, away={self.away_odds}, draw={self.draw_odds})"
@@ -0,0 +1,247 @@
+import bisect
+import datetime
+import math
+import time
+from typing import Callable, Dict, Iterable, List, Mapping, Optional, Set
+from src.shadow_bookmaker.config import settings
+
+# 分级轮询：(距开赛不超过多少秒, 轮询间隔秒数)，已开赛 2 小时内的场次按"马上开赛"算
+_TIERS = ((3600.0, 30.0), (6 * 3600.0, 120.0), (24 * 3600.0, 600.0), (3 * 86400.0, 1800.0))
+_IDLE_INTERVAL = 3 * 3600.0   # 三天内没有比赛的联赛
+_HOT_FACTOR = 0.5             # 按有敞口的场次分档时间隔再减半
+_LIVE_WINDOW = 2 * 3600.0     # 开赛后多久之内仍视为进行中 (足球连补时约 2 小时)
+_STALE_FACTOR = 2.0           # 刷新失败后，缓存报价超过 2 个计划间隔就不再对外提供
+_HOT_SHARE = 0.9              # 预算吃紧时敞口节奏最多占用的额度比例 (普通节奏至少留 10%)
+_PLAN_HORIZON = 86400.0       # 按未来 24 小时的赛程估算总需求，开赛扎堆的时段向冷清时段借额度
+_PLAN_STEP = 900.0            # 估算时的采样步长
+_REPLAN_EVERY = 60.0          # 拉长倍数最多隔多久重算一次 (敞口场次或联赛清单变了立即重算)
+
+def _next_month_utc(now: float) -> float:
+    """The Odds API 的额度每月 1 日 (UTC) 重置"""
+    d = datetime.datetime.fromtimestamp(now, datetime.timezone.utc)
+    first = datetime.datetime(d.year + (d.month == 12), d.month % 12 + 1, 1, tzinfo=datetime.timezone.utc)
+    return first.timestamp()
+
+class CreditBudget:
+    """额度预算：按响应头里的剩余额度把本月余额均摊到剩余天数 (可再用 daily_cap 封顶)，令牌桶按秒匀速补充。
+
+    还没见过响应头 (不知道余额) 时不限流，第一次响应之后立刻按真实余额收紧。
+    """
+    def __init__(self, daily_cap: int = None, clock: Callable[[], float] = time.time):
+        self.daily_cap = settings.ODDS_API_DAILY_BUDGET if daily_cap is None else daily_cap
+        self.clock = clock
+        self.remaining: Optional[float] = None
+        self.used: Optional[float] = None
+        self.last_cost = 1.0
+        self.spent = 0.0                  # 本进程累计花掉的额度
+        self._refilled_at = clock()
+        self._tokens = self.capacity / 24  # 起步只给 15 分钟的额度：赛程先从免费接口拿，开局不必把每个联赛都刷一遍
+
+    @property
+    def daily_allowance(self) -> float:
+        """今天 (按秒摊开) 能花多少额度；不知道余额时为无穷大"""
+        if self.remaining is None: return float(self.daily_cap) if self.daily_cap > 0 else math.inf
+        now = self.clock()
+        days_left = max((_next_month_utc(now) - now) / 86400.0, 1.0)
+        allowance = self.remaining / days_left
+        return min(allowance, self.daily_cap) if self.daily_cap > 0 else allowance
+
+    @property
+    def rate(self) -> float:
+        """每秒补充的额度"""
+        return self.daily_allowance / 86400.0
+
+    @property
+    def capacity(self) -> float:
+        # 桶容量 = 6 小时的额度 (至少能付一次请求)：开赛扎堆的时段可以透支平均速率，全天的总量由调度按赛程排好
+        return max(self.daily_allowance / 4.0, self.last_cost)
+
+    def _refill(self):
+        now = self.clock()
+        if math.isinf(self.rate): self._tokens = math.inf
+        else: self._tokens = min(self.capacity, (0.0 if math.isinf(self._tokens) else self._tokens) + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+
+    @property
+    def tokens(self) -> float:
+        """桶里现有的额度"""
+        self._refill()
+        return self._tokens
+
+    def try_spend(self, cost: float = None) -> bool:
+        """预扣一次请求的额度；桶里不够就返回 False (本轮跳过，等下一轮)"""
+        cost = self.last_cost if cost is None else cost
+        self._refill()
+        if self.remaining is not None and self.remaining < cost: return False
+        if self._tokens < cost: return False
+        self._tokens -= cost
+        return True
+
+    def observe(self, headers) -> None:
+        """读 x-requests-remaining / x-requests-used / x-requests-last 三个响应头"""
+        def num(key: str) -> Optional[float]:
+            value = headers.get(key)
+            try: return float(value) if value is not None else None
+            except ValueError: return None
+        remaining, used, last = num("x-requests-remaining"), num("x-requests-used"), num("x-requests-last")
+        first = self.remaining is None and remaining is not None
+        if remaining is not None: self.remaining = remaining
+        if used is not None: self.used = used
+        if last is not None:
+            self.last_cost = max(last, 1.0)
+            self.spent += last
+        if first:
+            # 刚知道余额：桶从"无限"收紧到最多 15 分钟的额度，之后按真实速率补充
+            self._tokens = min(self._tokens, self.capacity / 24)
+            self._refilled_at = self.clock()
+
+    def stats(self) -> dict:
+        return {"remaining": self.remaining, "used": self.used, "spent": self.spent, "daily_allowance": self.daily_allowance}
+
+class _League:
+    __slots__ = ("key", "fixtures", "kickoffs", "last_ok", "retry_at", "interval", "polled_every")
+
+    def __init__(self, key: str):
+        self.key = key
+        self.fixtures: Dict[str, float] = {}  # 场次 -> 开赛时间 (unix 秒)
+        self.kickoffs: List[float] = []       # 同上，排好序的开赛时间
+        self.last_ok: Optional[float] = None
+        self.retry_at = 0.0                   # 刷新失败后的退避时刻
+        self.interval = _IDLE_INTERVAL
+        self.polled_every = _IDLE_INTERVAL    # 上次成功刷新时排定的间隔
+
+    def set_fixtures(self, fixtures: Mapping[str, float]):
+        self.fixtures = dict(fixtures)
+        self.kickoffs = sorted(self.fixtures.values())
+
+def _eta(kickoffs: List[float], t: float) -> float:
+    """离 (排好序的) 开赛时间里最近一场还有多少秒；进行中的算 0，都已结束为无穷大"""
+    i = bisect.bisect_right(kickoffs, t - _LIVE_WINDOW)
+    return max(kickoffs[i] - t, 0.0) if i < len(kickoffs) else math.inf
+
+def _tier(eta: float) -> float:
+    return next((every for horizon, every in _TIERS if eta <= horizon), _IDLE_INTERVAL)
+
+class PollScheduler:
+    """按联赛分级轮询：离开赛越近刷得越勤，有敞口的场次所在联赛再加倍；超出额度预算时按比例统一拉长。
+
+    每个联赛有两份需求：按全联赛最近一场开赛分档的普通节奏，和按其中有敞口的场次分档再减半的敞口节奏，
+    实际间隔取两者 (各自按预算拉长后) 的较短者。拉长倍数按未来 24 小时赛程的总需求对比当日额度来定，
+    敞口节奏先分 (最多占 90%)，普通节奏分剩下的。
+    不碰网络：数据源每轮问 due() 哪些联赛该刷了，刷完用 polled() 回报各场开赛时间，有敞口的场次由编排器经 watch() 告知。
+    时钟可注入，离线就能回放一整天的调度。
+    """
+    def __init__(self, leagues: Iterable[str] = (), budget: CreditBudget = None, clock: Callable[[], float] = time.time):
+        self.clock = clock
+        self.budget = budget or CreditBudget(clock=clock)
+        self.leagues: Dict[str, _League] = {}
+        self.watched: Set[str] = set()
+        self.pressure = self.hot_pressure = 1.0   # 预算吃紧时两份节奏各自的拉长倍数 (普通 / 敞口)
+        self._planned_at = -math.inf
+        self.set_leagues(leagues)
+
+    def set_leagues(self, keys: Iterable[str]):
+        keys = list(dict.fromkeys(keys))
+        if keys != list(self.leagues): self._planned_at = -math.inf
+        self.leagues = {k: self.leagues.get(k) or _League(k) for k in keys}
+
+    def watch(self, match_ids: Iterable[str]):
+        watched = set(match_ids)
+        if watched != self.watched: self._planned_at = -math.inf
+        self.watched = watched
+
+    def _hot_kickoffs(self, league: _League) -> List[float]:
+        return sorted(k for m_id, k in league.fixtures.items() if m_id in self.watched)
+
+    @staticmethod
+    def _demands(league: _League, hot_kickoffs: List[float], t: float):
+        """t 时刻的 (普通节奏间隔, 敞口节奏间隔)；没有敞口场次的联赛敞口节奏为无穷大"""
+        return _tier(_eta(league.kickoffs, t)), (_tier(_eta(hot_kickoffs, t)) * _HOT_FACTOR if hot_kickoffs else math.inf)
+
+    def is_hot(self, league: _League) -> bool:
+        return not self.watched.isdisjoint(league.fixtures)
+
+    def _replan(self, now: float):
+        """按未来 24 小时赛程估算两份节奏各要花多少额度，超出当日额度就按比例拉长"""
+        rate = self.budget.rate
+        self._planned_at = now
+        if math.isinf(rate):
+            self.pressure = self.hot_pressure = 1.0
+            return
+        samples = [now + i * _PLAN_STEP for i in range(int(_PLAN_HORIZON / _PLAN_STEP))]
+        cold_need = hot_need = 0.0
+        for lg in self.leagues.values():
+            hot_kickoffs = self._hot_kickoffs(lg)
+            for t in samples:
+                cold, hot = self._demands(lg, hot_kickoffs, t)
+                cold_need += _PLAN_STEP / cold
+                hot_need += _PLAN_STEP / hot
+        allowance = (self.budget.tokens + rate * _PLAN_HORIZON) / self.budget.last_cost  # 这段时间能发多少次请求 (桶里的存量也算上)
+        hot_share = min(hot_need, allowance * _HOT_SHARE)
+        self.hot_pressure = hot_need / hot_share if hot_share > 0 else 1.0
+        self.pressure = max(cold_need / (allowance - hot_share), 1.0) if allowance > hot_share else math.inf
+
+    def _plan(self, now: float):
+        """刷新每个联赛当下的实际间隔 (拉长倍数按需重算)"""
+        if now - self._planned_at >= _REPLAN_EVERY: self._replan(now)
+        for lg in self.leagues.values():
+            cold, hot = self._demands(lg, self._hot_kickoffs(lg), now)
+            lg.interval = min(cold * self.pressure, hot * self.hot_pressure)
+
+    def _due_at(self, league: _League) -> float:
+        return max(league.last_ok + league.interval if league.last_ok is not None else 0.0, league.retry_at)
+
+    def due(self) -> List[str]:
+        """本轮该刷的联赛 (已预扣额度)：有敞口的优先，其次谁欠得久先刷谁；额度不够的留到下一轮"""
+        now = self.clock()
+        self._plan(now)
+        ready = [lg for lg in self.leagues.values() if self._due_at(lg) <= now]
+        ready.sort(key=lambda lg: (not self.is_hot(lg), self._due_at(lg)))
+        picked = []
+        for lg in ready:
+            if not self.budget.try_spend(): break
+            picked.append(lg.key)
+        return picked
+
+    def polled(self, key: str, fixtures: Mapping[str, float] = None, ok: bool = True):
+        """回报一次刷新：成功就记下各场开赛时间 (场次 -> unix 秒)；失败则过半个间隔再重试"""
+        lg = self.leagues.get(key)
+        if lg is None: return
+        now = self.clock()
+        if ok:
+            lg.set_fixtures(fixtures or {})
+            lg.last_ok = now
+            lg.polled_every = lg.interval
+        else:
+            lg.retry_at = now + lg.interval / 2
+
+    def learn_fixtures(self, key: str, fixtures: Mapping[str, float]):
+        """从免费的赛程接口更新开赛时间 (不花额度，不算一次报价刷新)"""
+        lg = self.leagues.get(key)
+        if lg is not None: lg.set_fixtures(fixtures)
+
+    def fresh(self, key: str) -> bool:
+        """该联赛的缓存报价是否还能对外提供：只是额度紧排不上队的照常提供 (最多 6 小时)；
+        刷新失败过的，超过 2 个间隔 (按刷新时排定的与现在的较长者) 就下架"""
+        lg = self.leagues.get(key)
+        if lg is None or lg.last_ok is None: return False
+        age = self.clock() - lg.last_ok
+        if lg.retry_at <= lg.last_ok: return age <= _IDLE_INTERVAL * _STALE_FACTOR
+        return age <= min(max(lg.interval, lg.polled_every), _IDLE_INTERVAL) * _STALE_FACTOR
+
+    def quote_ttls(self) -> Dict[str, float]:
+        """场次 -> 报价 TTL：与 fresh() 同口径，按联赛排定的间隔留 2 个间隔 (最多 6 小时)，不让行情库在下次刷新前就把报价下架"""
+        return {m_id: min(max(lg.interval, lg.polled_every), _IDLE_INTERVAL) * _STALE_FACTOR
+                for lg in self.leagues.values() if lg.last_ok is not None for m_id in lg.fixtures}
+
+    def next_poll_in(self) -> Optional[float]:
+        if not self.leagues: return None
+        now = self.clock()
+        self._plan(now)
+        return max(min(self._due_at(lg) for lg in self.leagues.values()) - now, 0.0)
+
+    def stats(self) -> List[dict]:
+        now = self.clock()
+        return [{"league": lg.key, "hot": self.is_hot(lg), "kickoff_in": _eta(lg.kickoffs, now), "interval": lg.interval,
+                 "next_poll_in": max(self._due_at(lg) - now, 0.0), "age": None if lg.last_ok is None else now - lg.last_ok}
+                for lg in self.leagues.values()]
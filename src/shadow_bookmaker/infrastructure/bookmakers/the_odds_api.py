@@ -1,62 +1,124 @@
-from typing import List
+import asyncio
+import datetime
+import time
+from typing import Callable, Dict, Iterable, List, Optional
 from src.shadow_bookmaker.infrastructure.bookmakers.base import BaseBookmaker
+from src.shadow_bookmaker.infrastructure.bookmakers.poll_scheduler import PollScheduler
 from src.shadow_bookmaker.infrastructure.network import AsyncNetworkEngine
+from src.shadow_bookmaker.infrastructure.bookmakers.odds_parser import OddsBatch, iter_h2h_quotes
 from src.shadow_bookmaker.domain.models import OddsDTO
+from src.shadow_bookmaker.infrastructure.metrics import metrics
 from src.shadow_bookmaker.config import settings
 
+_SPORTS_EVERY = 6 * 3600.0   # 联赛清单多久重新发现一次 (/v4/sports 不耗额度)
+_EVENTS_EVERY = 3600.0       # 赛程 (开赛时间) 多久补一次 (/v4/sports/{key}/events 不耗额度)
+
+def _kickoff(event: dict) -> Optional[float]:
+    try: return datetime.datetime.fromisoformat(event["commence_time"].replace("Z", "+00:00")).timestamp()
+    except (KeyError, AttributeError, ValueError): return None
+
 class TheOddsAPIBookmaker(BaseBookmaker):
-    def __init__(self, mapper):
+    """平博 (经 The Odds API)：按联赛拆开请求，由 PollScheduler 决定每轮刷哪些联赛，没轮到的联赛沿用缓存报价"""
+    def __init__(self, mapper, clock: Callable[[], float] = time.time):
         super().__init__(mapper)
         self.network = AsyncNetworkEngine()
+        self.base_url = settings.ODDS_API_BASE_URL.rstrip("/")
+        self.scheduler = PollScheduler(clock=clock)
+        self._quotes: Dict[str, list] = {}          # 联赛 -> 上次成功抓到的报价视图
+        self._parsed: Dict[str, tuple] = {}         # 联赛 -> (ETag, 按它解析好的 OddsBatch)：304 或同一 ETag 直接复用，不再解析
+        self._events_at: Dict[str, float] = {}      # 联赛 -> 上次补赛程的时间
+        self._sports_at = float("-inf")
 
     @property
     def name(self) -> str: return "Pinnacle"
-    
-    async def fetch_odds(self) -> List[OddsDTO]:
-        if not settings.ODDS_API_KEY:
-            return []
-            
-        # 🎯 发射指令：抓取全球即将开赛的足球赛事 (soccer_upcoming)，且只盯防平博 (pinnacle)
-        url = "https://api.the-odds-api.com/v4/sports/soccer_upcoming/odds"
-        params = {
-            "apiKey": settings.ODDS_API_KEY,
-            "regions": "eu",
-            "markets": "h2h", 
-            "bookmakers": "pinnacle"
-        }
-        
+
+    async def aclose(self):
+        await self.network.aclose()
+
+    def watch(self, match_ids: Iterable[str]):
+        self.scheduler.watch(match_ids)
+
+    def next_poll_in(self) -> Optional[float]:
+        return self.scheduler.next_poll_in() if settings.ODDS_API_KEY else None
+
+    def quote_ttls(self) -> Dict[str, float]:
+        return self.scheduler.quote_ttls() if settings.ODDS_API_KEY else {}
+
+    def _fixtures(self, events: Iterable[dict]) -> Dict[str, float]:
+        """场次 -> 开赛时间 (unix 秒)，场次 id 与解析器的口径一致 (洗过队名的 "主队 vs 客队")"""
+        fixtures = {}
+        for event in events:
+            kickoff = _kickoff(event)
+            if kickoff is None or not event.get("home_team") or not event.get("away_team"): continue
+            fixtures[f"{self.mapper.standardize(event['home_team'])} vs {self.mapper.standardize(event['away_team'])}"] = kickoff
+        return fixtures
+
+    async def _get(self, path: str, **params):
+        return await self.network.fetch(f"{self.base_url}{path}", params={"apiKey": settings.ODDS_API_KEY, **params})
+
+    async def _discover(self):
+        """联赛清单：配置了 ODDS_API_SPORTS 就照单用；否则定期从 /v4/sports 拉在售的足球联赛 (不含冠军盘)"""
+        if settings.ODDS_API_SPORTS:
+            self.scheduler.set_leagues(k.strip() for k in settings.ODDS_API_SPORTS.split(",") if k.strip())
+            return
+        now = self.scheduler.clock()
+        if now - self._sports_at < _SPORTS_EVERY: return
         try:
-            data = await self.network.fetch_json(url, params=params)
+            sports, _ = await self._get("/v4/sports")
         except Exception as e:
-            print(f"📡 API 抓取拦截 (请检查网络或余额): {e}")
+            print(f"📡 联赛清单拉取失败，沿用上一份: {e}")
+            return
+        self._sports_at = now
+        keys = [s["key"] for s in sports if s.get("group") == "Soccer" and s.get("active") and not s.get("has_outrights")]
+        self.scheduler.set_leagues(keys)
+        for key in list(self._quotes):
+            if key not in self.scheduler.leagues:
+                del self._quotes[key]
+                self._parsed.pop(key, None)
+
+    async def _learn_events(self, key: str):
+        try:
+            events, _ = await self._get(f"/v4/sports/{key}/events")
+        except Exception:
+            return  # 赛程只是调度参考，拿不到就按已知开赛时间走
+        self._events_at[key] = self.scheduler.clock()
+        self.scheduler.learn_fixtures(key, self._fixtures(events))
+
+    async def _poll(self, key: str):
+        # 🎯 只盯防平博 (pinnacle) 的胜平负盘，一个联赛一次请求 (1 个额度)
+        data, headers = await self._get(f"/v4/sports/{key}/odds", regions="eu", markets="h2h", bookmakers="pinnacle")
+        self.scheduler.budget.observe(headers)
+        # 整批打上本次抓取的时间：没轮到的联赛沿用缓存时带着的是当初的抓取时间，行情库的 TTL 与快照年龄照样能判它过期
+        now, etag = self.scheduler.clock(), headers.get("ETag")
+        parsed = self._parsed.get(key)
+        if etag and parsed and parsed[0] == etag:
+            batch = parsed[1]
+            batch.fetched_at = now  # 源头确认没变：沿用上次的批次，只刷新抓取时间
+        else:
+            # ⚡ 流式解析 + 整批一次校验，返回列式批次上的轻量视图 (接口同 OddsDTO)
+            with metrics.span("odds.parse"):
+                batch = OddsBatch(self.name, iter_h2h_quotes(data, self.mapper, "pinnacle"), fetched_at=now)
+            if etag: self._parsed[key] = (etag, batch)
+            else: self._parsed.pop(key, None)
+        self._quotes[key] = batch.views()
+        self.scheduler.polled(key, self._fixtures(data))
+
+    async def fetch_odds(self) -> List[OddsDTO]:
+        if not settings.ODDS_API_KEY:
             return []
 
-        results = []
-        for match in data:
-            home_raw = match.get("home_team", "")
-            away_raw = match.get("away_team", "")
-            if not home_raw or not away_raw: continue
-            
-            # 利用你的映射字典做双保险清洗
-            home_team = self.mapper.standardize(home_raw)
-            away_team = self.mapper.standardize(away_raw)
-            match_id = f"{home_team} vs {away_team}"
-
-            for bookie in match.get("bookmakers", []):
-                if bookie["key"] == "pinnacle":
-                    for market in bookie.get("markets", []):
-                        if market["key"] == "h2h":
-                            h_odds = a_odds = d_odds = 0.0
-                            for outcome in market["outcomes"]:
-                                if outcome["name"] == home_raw: h_odds = outcome["price"]
-                                elif outcome["name"] == away_raw: a_odds = outcome["price"]
-                                elif outcome["name"].lower() == "draw": d_odds = outcome["price"]
-                                
-                            if h_odds > 1.0 and a_odds > 1.0:
-                                results.append(OddsDTO(
-                                    bookmaker=self.name, match_id=match_id,
-                                    home_team=home_team, away_team=away_team,
-                                    home_odds=h_odds, away_odds=a_odds, 
-                                    draw_odds=d_odds if d_odds > 1.0 else None
-                                ))
-        return results
\ No newline at end of file
+        await self._discover()
+        now = self.scheduler.clock()
+        # 赛程过期、且报价也没在这段时间里刷过的联赛，先用免费的赛程接口补开赛时间，好让调度分档
+        stale = [key for key, lg in self.scheduler.leagues.items()
+                 if now - self._events_at.get(key, float("-inf")) >= _EVENTS_EVERY and (lg.last_ok is None or now - lg.last_ok >= _EVENTS_EVERY)]
+        if stale: await asyncio.gather(*(self._learn_events(key) for key in stale))
+
+        due = self.scheduler.due()
+        results = await asyncio.gather(*(self._poll(key) for key in due), return_exceptions=True)
+        for key, result in zip(due, results):
+            if isinstance(result, Exception):
+                print(f"📡 API 抓取拦截 [{key}] (请检查网络或余额): {result}")
+                self.scheduler.polled(key, ok=False)
+        # 只对外提供还新鲜的联赛：长期刷不到的缓存报价宁可不报，也不拿来定价
+        return [q for key, quotes in self._quotes.items() if self.scheduler.fresh(key) for q in quotes]
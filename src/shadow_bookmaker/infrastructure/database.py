@@ -1,18 +1,143 @@
 import sqlite3
 import os
-from typing import Dict, List
+import json
+import queue
+import atexit
+import asyncio
+import threading
+import time
+import zlib
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from src.shadow_bookmaker.config import settings
+from src.shadow_bookmaker.infrastructure.metrics import metrics
 
 # 将数据库文件建在根目录下的 data 文件夹中
 DB_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../../data/shadow_vault.db"))
 
+# ⚙️ WAL 模式调优：读写互不阻塞；NORMAL 级别只在检查点 fsync，单次提交不再等磁盘
+_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA busy_timeout=5000",
+)
+
+_UPSERT_LEDGER = """
+    INSERT INTO ledger_pnl (match_id, home, draw, away)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT(match_id) DO UPDATE SET
+    home=excluded.home, draw=excluded.draw, away=excluded.away
+"""
+
+_INSERT_PARLAY = """
+    INSERT INTO parlay_book (ticket_id, stake, liability, legs) VALUES (?, ?, ?, ?)
+"""
+
+_INSERT_EVENT = """
+    INSERT INTO ledger_events (ts, kind, ticket_id, match_id, selection, stake, liability) VALUES (?, 'bet', ?, ?, ?, ?, ?)
+"""
+
+# 快照里盈亏矩阵的列顺序 (与 GlobalLedger 一致)
+_OUTCOMES = ("home", "away", "draw")
+
+def _fold(states: Dict[str, Dict[str, float]], events: Iterable[tuple]):
+    """把 (kind, match_id, selection, stake, liability) 事件按顺序叠加到水位上 (与 GlobalLedger.stage_bets 同一算式、同一顺序)"""
+    for kind, match_id, selection, stake, liability in events:
+        if kind == "reset":
+            states.clear()
+            continue
+        state = states.get(match_id) or {o: 0.0 for o in _OUTCOMES}
+        states[match_id] = {o: (v - liability if o == selection else v + stake) for o, v in state.items()}
+
+def _pack(states: Dict[str, Dict[str, float]]) -> Tuple[str, bytes]:
+    """紧凑快照：场次列表 JSON + (场次 × 主/客/平) float64 矩阵 zlib 压缩"""
+    pnl = np.array([[st[o] for o in _OUTCOMES] for st in states.values()], dtype=np.float64)
+    return json.dumps(list(states)), zlib.compress(pnl.tobytes())
+
+def _unpack(match_ids: str, blob: bytes) -> Dict[str, Dict[str, float]]:
+    pnl = np.frombuffer(zlib.decompress(blob), dtype=np.float64).reshape(-1, 3)
+    return {m_id: dict(zip(_OUTCOMES, map(float, row))) for m_id, row in zip(json.loads(match_ids), pnl)}
+
+_INSERT_TICKET = """
+    INSERT INTO order_book (ticket_id, ticket_type, stake, action, retained_liability, hedge_stake, danger_match_id, danger_selection)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+_UPSERT_SUMMARY = """
+    INSERT INTO order_summary (danger_match_id, action, tickets, turnover, retained_liability, hedge_volume)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT(danger_match_id, action) DO UPDATE SET
+        tickets = tickets + excluded.tickets, turnover = turnover + excluded.turnover,
+        retained_liability = retained_liability + excluded.retained_liability, hedge_volume = hedge_volume + excluded.hedge_volume
+"""
+
+def _summarize(tickets: List[tuple]) -> List[tuple]:
+    """同批订单先在内存里按 (场次, 动作) 合并，每组只 UPSERT 一次汇总表 (字段顺序同 _INSERT_TICKET)"""
+    groups: Dict[Tuple[str, str], List[float]] = {}
+    for _, _, stake, action, retained_liability, hedge_stake, danger_match_id, _ in tickets:
+        g = groups.setdefault((danger_match_id or "", action or ""), [0, 0.0, 0.0, 0.0])
+        g[0] += 1; g[1] += stake or 0.0; g[2] += retained_liability or 0.0; g[3] += hedge_stake or 0.0
+    return [(*key, *g) for key, g in groups.items()]
+
+class _Write:
+    """写队列里的一个原子写入单元：内部所有语句要么全部生效，要么全部回滚"""
+    __slots__ = ("statements", "done", "durable", "error")
+    def __init__(self, statements: List[Tuple[str, Any, bool]], wait: bool = False, durable: bool = False):
+        self.statements = statements  # (sql, 参数, 是否 executemany)
+        self.done = threading.Event() if wait else None
+        self.durable = durable
+        self.error: Optional[BaseException] = None
+
+class _Snapshot:
+    """写队列里的快照请求：写线程把 (最新快照 + 其后的事件) 折叠成一份新快照"""
+    __slots__ = ("done",)
+    def __init__(self, wait: bool = False):
+        self.done = threading.Event() if wait else None
+
+class _Barrier:
+    """写队列里的栅栏：写线程处理到这里时，之前的所有写入都已提交 (durable=True 时已强制 fsync)
+
+    report=True 的栅栏来自 flush()，顺带领走此前无人等待的写入留下的错误；读路径的栅栏只等排空，不碰错误。
+    """
+    __slots__ = ("event", "durable", "report", "error")
+    def __init__(self, durable: bool, report: bool = True):
+        self.event = threading.Event()
+        self.durable = durable
+        self.report = report
+        self.error: Optional[BaseException] = None
+
 class DatabaseManager:
-    def __init__(self):
-        os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+    def __init__(self, db_path: str = DB_PATH, flush_interval: Optional[float] = None, max_batch: Optional[int] = None):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        # 写后队列：攒够一批或等满 flush_interval 秒就合并成一个事务提交
+        self.flush_interval = settings.DB_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        self.max_batch = settings.DB_WRITE_BATCH if max_batch is None else max_batch
         self._init_db()
 
+        # 📖 常驻读连接 (Streamlit 多线程共享，用锁串行化)
+        self._read_conn = self._connect()
+        self._read_lock = threading.Lock()
+
+        # ✍️ 后台写线程独占写连接
+        self._queue: "queue.Queue" = queue.Queue()
+        self._error: Optional[BaseException] = None  # 无人等待的写入留下的错误，只由写线程 (或关闭后的 flush) 交给下一个 flush 的栅栏
+        self._closed = False
+        self._unsnapshotted = 0  # 本进程写入、还没被快照覆盖的事件数 (攒够 LEDGER_SNAPSHOT_EVERY 条就排一次快照)
+        self._writer = threading.Thread(target=self._writer_loop, name="sqlite-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        for pragma in _PRAGMAS: conn.execute(pragma)
+        return conn
+
     def _init_db(self):
         """初始化两张核心金融表：大账本表(ledger_pnl) 和 历史订单流水表(order_book)"""
-        with sqlite3.connect(DB_PATH) as conn:
+        with sqlite3.connect(self.db_path) as conn:
             # 1. 全局水池表 (记录当前敞口水位)
             conn.execute("""
                 CREATE TABLE IF NOT EXISTS ledger_pnl (
@@ -36,40 +161,345 @@ class DatabaseManager:
                     timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
                 )
             """)
-            
-    def load_ledger(self) -> Dict[str, Dict[str, float]]:
-        """系统重启时，瞬间从硬盘拉取水池现状"""
-        with sqlite3.connect(DB_PATH) as conn:
-            conn.row_factory = sqlite3.Row
-            rows = conn.execute("SELECT * FROM ledger_pnl").fetchall()
-            return {r["match_id"]: {"home": r["home"], "draw": r["draw"], "away": r["away"]} for r in rows}
-
-    def save_ledger_state(self, match_id: str, state: Dict[str, float]):
-        """水池发生变动，利用 UPSERT 语法强制落盘保存"""
-        with sqlite3.connect(DB_PATH) as conn:
+            # 订单簿按时间/场次/动作查询都走索引 (二级索引自带 rowid，过滤后按 rowid 倒序翻页无需排序)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_order_book_timestamp ON order_book(timestamp)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_order_book_match ON order_book(danger_match_id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_order_book_action ON order_book(action)")
+            # 订单汇总表 (场次 × 动作)：与订单流水在同一个写入单元里增量累加，聚合查询只扫这张小表
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS order_summary (
+                    danger_match_id TEXT NOT NULL,
+                    action TEXT NOT NULL,
+                    tickets INTEGER NOT NULL,
+                    turnover REAL NOT NULL,
+                    retained_liability REAL NOT NULL,
+                    hedge_volume REAL NOT NULL,
+                    PRIMARY KEY (danger_match_id, action)
+                )
+            """)
+            # 老库迁移：汇总表是新建的就从现有订单一次性回填
+            if conn.execute("SELECT NOT EXISTS (SELECT 1 FROM order_summary) AND EXISTS (SELECT 1 FROM order_book)").fetchone()[0]:
+                conn.execute("""
+                    INSERT INTO order_summary
+                    SELECT COALESCE(danger_match_id, ''), COALESCE(action, ''), COUNT(*), TOTAL(stake), TOTAL(retained_liability), TOTAL(hedge_stake)
+                    FROM order_book GROUP BY 1, 2
+                """)
+            # 3. 串关联合赛果簿 (恢复联合敞口用；legs 为 JSON [[match_id, selection], ...])
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS parlay_book (
+                    ticket_id TEXT PRIMARY KEY,
+                    stake REAL,
+                    liability REAL,
+                    legs TEXT
+                )
+            """)
+            # 清库归档：reset 时把订单与串关簿原样搬进来，按那条 reset 事件的 seq 分组，订单历史不随清库丢失
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS order_book_archive (
+                    reset_seq INTEGER NOT NULL,
+                    seq INTEGER NOT NULL,
+                    ticket_id TEXT,
+                    ticket_type TEXT,
+                    stake REAL,
+                    action TEXT,
+                    retained_liability REAL,
+                    hedge_stake REAL,
+                    danger_match_id TEXT,
+                    danger_selection TEXT,
+                    timestamp DATETIME,
+                    PRIMARY KEY (reset_seq, seq)
+                )
+            """)
             conn.execute("""
-                INSERT INTO ledger_pnl (match_id, home, draw, away)
-                VALUES (?, ?, ?, ?)
-                ON CONFLICT(match_id) DO UPDATE SET
-                home=excluded.home, draw=excluded.draw, away=excluded.away
-            """, (match_id, state["home"], state["draw"], state["away"]))
-
-    def save_ticket(self, ticket_id: str, ticket_type: str, stake: float, action: str, retained_liability: float, hedge_stake: float, danger_match_id: str, danger_selection: str):
-        """留痕审计：将通过风控的单据永久存档为交易流水"""
-        with sqlite3.connect(DB_PATH) as conn:
+                CREATE TABLE IF NOT EXISTS parlay_book_archive (
+                    reset_seq INTEGER NOT NULL,
+                    ticket_id TEXT,
+                    stake REAL,
+                    liability REAL,
+                    legs TEXT
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_parlay_book_archive_reset ON parlay_book_archive(reset_seq)")
+            # 4. 账本事件流水 (只追加)：每笔边际记账一条 bet，清库留一条 reset；ledger_pnl 只是它折叠出来的当前值
             conn.execute("""
-                INSERT INTO order_book (ticket_id, ticket_type, stake, action, retained_liability, hedge_stake, danger_match_id, danger_selection)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """, (ticket_id, ticket_type, stake, action, retained_liability, hedge_stake, danger_match_id, danger_selection))
-            
-    def get_order_book(self) -> List[dict]:
-        with sqlite3.connect(DB_PATH) as conn:
-            conn.row_factory = sqlite3.Row
-            rows = conn.execute("SELECT * FROM order_book ORDER BY timestamp DESC LIMIT 100").fetchall()
-            return [dict(r) for r in rows]
-            
+                CREATE TABLE IF NOT EXISTS ledger_events (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    ts REAL NOT NULL,
+                    kind TEXT NOT NULL,
+                    ticket_id TEXT,
+                    match_id TEXT,
+                    selection TEXT,
+                    stake REAL,
+                    liability REAL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_ledger_events_ts ON ledger_events(ts)")
+            # 5. 账本快照：折叠到 last_seq 为止的全书水位 (压缩矩阵)，冷启动和历史回溯都从最近的快照往后重放
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS ledger_snapshots (
+                    last_seq INTEGER PRIMARY KEY,
+                    ts REAL NOT NULL,
+                    match_ids TEXT NOT NULL,
+                    pnl BLOB NOT NULL
+                )
+            """)
+            # 老库迁移：还没有任何事件和快照时，把 ledger_pnl 现值存成 0 号基线快照
+            if conn.execute("SELECT NOT EXISTS (SELECT 1 FROM ledger_snapshots) AND NOT EXISTS (SELECT 1 FROM ledger_events)").fetchone()[0]:
+                legacy = {r[0]: {"home": r[1], "away": r[2], "draw": r[3]} for r in conn.execute("SELECT match_id, home, away, draw FROM ledger_pnl")}
+                if legacy: conn.execute("INSERT INTO ledger_snapshots VALUES (0, ?, ?, ?)", (time.time(), *_pack(legacy)))
+
+    # ------------------------------------------------------------------
+    # 后台组提交 (group commit)
+    # ------------------------------------------------------------------
+    def _writer_loop(self):
+        conn = self._connect()
+        while True:
+            item = self._queue.get()
+            if item is None: break
+            batch = [item]
+            # 攒批：第一条写入到达后最多再等 flush_interval 秒，保证落盘延迟有上界
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.max_batch and not self._has_waiter(batch[-1]):
+                timeout = deadline - time.monotonic()
+                if timeout <= 0: break
+                try: nxt = self._queue.get(timeout=timeout)
+                except queue.Empty: break
+                if nxt is None:
+                    self._queue.put(None)  # 留给外层循环收尾
+                    break
+                batch.append(nxt)  # 遇到有人在等的条目，循环条件会让本批立即提交
+            self._commit_batch(conn, batch)
+        conn.close()
+
+    @staticmethod
+    def _has_waiter(item) -> bool:
+        return isinstance(item, _Barrier) or item.done is not None
+
+    @metrics.timed("db.commit_batch")
+    def _commit_batch(self, conn: sqlite3.Connection, batch: list):
+        writes = [op for op in batch if isinstance(op, _Write)]
+        barriers = [op for op in batch if isinstance(op, _Barrier)]
+        snapshots = [op for op in batch if isinstance(op, _Snapshot)]
+        durable = any(op.durable for op in writes + barriers)
+        try:
+            if durable: conn.execute("PRAGMA synchronous=FULL")
+            if writes:
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    for w in writes:
+                        # 每个写入单元包一层保存点：坏单只回滚自己，不连累同批次的其他调用方
+                        conn.execute("SAVEPOINT w")
+                        try:
+                            for sql, params, many in w.statements:
+                                if many: conn.executemany(sql, params)
+                                else: conn.execute(sql, params)
+                            conn.execute("RELEASE w")
+                        except sqlite3.Error as e:
+                            conn.execute("ROLLBACK TO w"); conn.execute("RELEASE w")
+                            w.error = e
+                    conn.execute("COMMIT")
+                except BaseException as e:
+                    conn.execute("ROLLBACK")
+                    for w in writes: w.error = w.error or e
+            if durable: conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+        except Exception as e:
+            for w in writes: w.error = w.error or e
+        finally:
+            if durable: conn.execute("PRAGMA synchronous=NORMAL")
+            for w in writes:
+                if w.done is not None: w.done.set()
+                elif w.error is not None:
+                    # 无人等待的写入出错：打印并记下，交给下一个 flush() 的栅栏抛给调用方
+                    print(f"💾 SQLite 后台落盘失败 (该写入已回滚): {w.error}")
+                    self._error = w.error
+            if snapshots:
+                # 快照排在本批写入之后、栅栏放行之前：flush() 返回时快照已经落库
+                try: self._write_snapshot(conn)
+                except sqlite3.Error as e: print(f"💾 账本快照失败 (下次再试): {e}")
+                for snap in snapshots:
+                    if snap.done is not None: snap.done.set()
+            for b in barriers:
+                if b.report and self._error is not None: b.error, self._error = self._error, None
+                b.event.set()
+
+    def _write_snapshot(self, conn: sqlite3.Connection):
+        """最新快照 + 其后全部事件折叠成新快照；整个过程占住写锁，别的进程插不进事件来"""
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            states, base_seq = self._latest_snapshot(conn)
+            events = conn.execute("SELECT seq, ts, kind, match_id, selection, stake, liability FROM ledger_events WHERE seq > ? ORDER BY seq", (base_seq,)).fetchall()
+            if events:
+                _fold(states, (e[2:] for e in events))
+                conn.execute("INSERT INTO ledger_snapshots VALUES (?, ?, ?, ?)", (events[-1][0], events[-1][1], *_pack(states)))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def _latest_snapshot(conn: sqlite3.Connection, before_ts: float = None) -> Tuple[Dict[str, Dict[str, float]], int]:
+        """(快照水位, 快照覆盖到的事件序号)；before_ts 限定只取该时刻及之前的快照，没有则从空账开始"""
+        if before_ts is None: row = conn.execute("SELECT last_seq, match_ids, pnl FROM ledger_snapshots ORDER BY last_seq DESC LIMIT 1").fetchone()
+        else: row = conn.execute("SELECT last_seq, match_ids, pnl FROM ledger_snapshots WHERE ts <= ? ORDER BY last_seq DESC LIMIT 1", (before_ts,)).fetchone()
+        return (_unpack(row[1], row[2]), row[0]) if row else ({}, 0)
+
+    def execute_atomic(self, statements: List[Tuple[str, Any, bool]], durable: bool = False):
+        """同步原子写：所有语句在同一事务里提交后才返回，失败则整体回滚并抛出异常"""
+        if self._closed: raise RuntimeError("DatabaseManager 已关闭")
+        write = _Write(statements, wait=True, durable=durable)
+        self._queue.put(write)
+        write.done.wait()
+        if write.error is not None: raise write.error
+
+    def flush(self, durable: bool = True, timeout: Optional[float] = None):
+        """阻塞到此前提交的所有写入都已落盘；后台批次出过错则在这里抛给调用方"""
+        if self._closed:
+            err, self._error = self._error, None  # 写线程已退出，没有别人会动它
+        else:
+            err = self._drain(durable, report=True, timeout=timeout)
+        if err is not None: raise err
+
+    def _drain(self, durable: bool, report: bool, timeout: Optional[float] = None) -> Optional[BaseException]:
+        """排一个栅栏并等写线程处理到它；report=True 时领走栅栏带回的后台写入错误"""
+        barrier = _Barrier(durable, report)
+        self._queue.put(barrier)
+        if not barrier.event.wait(timeout): raise TimeoutError("SQLite 写队列落盘超时")
+        return barrier.error
+
+    async def aflush(self, durable: bool = True):
+        """flush() 的异步版本，不阻塞事件循环"""
+        await asyncio.to_thread(self.flush, durable)
+
+    def close(self):
+        if self._closed: return
+        self._closed = True
+        self._queue.put(None)
+        self._writer.join()
+        with self._read_lock: self._read_conn.close()
+
+    def _read(self, sql: str, params: tuple = ()) -> List[sqlite3.Row]:
+        # 先排空写队列 (不强制 fsync)，保证读到自己刚写的数据；后台写入的错误留给写路径的 flush()，读方不领也不清
+        if not self._closed: self._drain(durable=False, report=False)
+        with self._read_lock:
+            cur = self._read_conn.execute(sql, params)
+            cur.row_factory = sqlite3.Row
+            return cur.fetchall()
+
+    # ------------------------------------------------------------------
+    # 业务读写接口
+    # ------------------------------------------------------------------
+    def load_ledger(self) -> Dict[str, Dict[str, float]]:
+        """系统重启时，瞬间从硬盘拉取水池现状：最近一份快照 + 只重放它之后的事件尾巴"""
+        states, tail = self._replay()
+        self._unsnapshotted = tail
+        if tail >= settings.LEDGER_SNAPSHOT_EVERY: self._queue.put(_Snapshot())  # 尾巴太长，后台顺手压一份新快照
+        return states
+
+    def ledger_as_of(self, ts: float) -> Dict[str, Dict[str, float]]:
+        """历史回溯：重建 ts 时刻 (unix 秒) 的全书水位，用于对账与争议处理"""
+        return self._replay(ts)[0]
+
+    def _replay(self, as_of: float = None) -> Tuple[Dict[str, Dict[str, float]], int]:
+        if not self._closed: self._drain(durable=False, report=False)
+        with self._read_lock:
+            conn = self._read_conn
+            conn.execute("BEGIN")  # 快照和事件尾巴在同一个读事务里取，中间插进来的写入两边都看不到
+            try:
+                states, base_seq = self._latest_snapshot(conn, as_of)
+                if as_of is None: events = conn.execute("SELECT kind, match_id, selection, stake, liability FROM ledger_events WHERE seq > ? ORDER BY seq", (base_seq,)).fetchall()
+                else: events = conn.execute("SELECT kind, match_id, selection, stake, liability FROM ledger_events WHERE seq > ? AND ts <= ? ORDER BY seq", (base_seq, as_of)).fetchall()
+            finally:
+                conn.execute("COMMIT")
+        _fold(states, events)
+        return states, len(events)
+
+    def snapshot_ledger(self):
+        """立即压一份账本快照 (阻塞到快照落库)"""
+        snap = _Snapshot(wait=True)
+        self._queue.put(snap)
+        snap.done.wait()
+
+    @metrics.timed("db.save_decisions")
+    def save_decisions(self, ledger_states: Dict[str, Dict[str, float]], tickets: List[tuple], durable: bool = False, parlays: List[tuple] = (), bets: List[tuple] = ()):
+        """批量确权：N 张单据的流水 (+ 汇总表) + 每笔边际记账一条事件 + 每个被触碰场次的一条 UPSERT (+ 串关簿)，在同一事务里原子提交
+
+        tickets 每行为 (ticket_id, ticket_type, stake, action, retained_liability, hedge_stake, danger_match_id, danger_selection)；parlays 每行为 (ticket_id, legs, stake, liability)；
+        bets 每行为 (match_id, selection, stake, liability, ticket_id)，按记账顺序追加进事件流水。
+        """
+        now = time.time()
+        self.execute_atomic([
+            (_INSERT_TICKET, tickets, True),
+            (_UPSERT_SUMMARY, _summarize(tickets), True),
+            (_INSERT_EVENT, [(now, ticket_id, m_id, sel, stake, liability) for m_id, sel, stake, liability, ticket_id in bets], True),
+            (_UPSERT_LEDGER, [(m_id, st["home"], st["draw"], st["away"]) for m_id, st in ledger_states.items()], True),
+            (_INSERT_PARLAY, [(t_id, stake, liability, json.dumps([list(leg) for leg in legs])) for t_id, legs, stake, liability in parlays], True),
+        ], durable=durable)
+        self._unsnapshotted += len(bets)
+        if self._unsnapshotted >= settings.LEDGER_SNAPSHOT_EVERY:
+            self._unsnapshotted = 0
+            self._queue.put(_Snapshot())
+
+    def load_parlays(self) -> List[Tuple[str, List[Tuple[str, str]], float, float]]:
+        rows = self._read("SELECT * FROM parlay_book ORDER BY rowid")
+        return [(r["ticket_id"], [tuple(leg) for leg in json.loads(r["legs"])], r["stake"], r["liability"]) for r in rows]
+
+    def parlays_as_of(self, ts: float) -> List[Tuple[str, List[Tuple[str, str]], float, float]]:
+        """ts 时刻 (unix 秒) 还在账上的串关：当时最近一次 reset 之后、ts 之前记过账的
+
+        那一段之后又清过库的，串关已经归档在下一条 reset 名下，从归档表里取"""
+        rows = self._read("""
+            WITH opened AS (SELECT COALESCE((SELECT MAX(seq) FROM ledger_events WHERE kind = 'reset' AND ts <= :ts), 0) AS seq),
+                 closed AS (SELECT MIN(seq) AS seq FROM ledger_events WHERE kind = 'reset' AND seq > (SELECT seq FROM opened)),
+                 book AS (
+                     SELECT rowid AS ord, ticket_id, stake, liability, legs FROM parlay_book_archive WHERE reset_seq = (SELECT seq FROM closed)
+                     UNION ALL
+                     SELECT rowid AS ord, ticket_id, stake, liability, legs FROM parlay_book WHERE (SELECT seq FROM closed) IS NULL)
+            SELECT * FROM book WHERE ticket_id IN (
+                SELECT ticket_id FROM ledger_events WHERE kind = 'bet' AND ts <= :ts AND seq > (SELECT seq FROM opened))
+            ORDER BY ord
+        """, {"ts": ts})
+        return [(r["ticket_id"], [tuple(leg) for leg in json.loads(r["legs"])], r["stake"], r["liability"]) for r in rows]
+
+    def get_order_book(self, limit: int = 100, before: Optional[int] = None, match_id: Optional[str] = None, action: Optional[str] = None) -> List[dict]:
+        """最新在前的一页订单 (keyset 分页)：before 传上一页最后一行的 seq 取下一页，翻到多深都只走索引
+
+        每行多带一个 seq (rowid，按入库顺序递增)；match_id / action 可选过滤。
+        """
+        where, params = [], []
+        if before is not None: where.append("rowid < ?"); params.append(before)
+        if match_id is not None: where.append("danger_match_id = ?"); params.append(match_id)
+        if action is not None: where.append("action = ?"); params.append(action)
+        sql = "SELECT rowid AS seq, * FROM order_book" + (" WHERE " + " AND ".join(where) if where else "") + " ORDER BY rowid DESC LIMIT ?"
+        return [dict(r) for r in self._read(sql, (*params, limit))]
+
+    def archived_orders(self, reset_seq: Optional[int] = None) -> List[dict]:
+        """清库归档的订单 (按入库顺序)：reset_seq 为归档它们的那条 reset 事件，缺省返回全部归档"""
+        if reset_seq is None: rows = self._read("SELECT * FROM order_book_archive ORDER BY reset_seq, seq")
+        else: rows = self._read("SELECT * FROM order_book_archive WHERE reset_seq = ? ORDER BY seq", (reset_seq,))
+        return [dict(r) for r in rows]
+
+    def order_summary(self, by: str = "match") -> List[dict]:
+        """按场次 (by="match") 或按动作 (by="action") 汇总：单数、流水、截留负债、对冲量 (读汇总表，不扫订单簿)"""
+        key = {"match": "danger_match_id", "action": "action"}[by]
+        rows = self._read(f"""
+            SELECT {key}, SUM(tickets) AS tickets, SUM(turnover) AS turnover,
+                   SUM(retained_liability) AS retained_liability, SUM(hedge_volume) AS hedge_volume
+            FROM order_summary GROUP BY {key} ORDER BY turnover DESC
+        """)
+        return [dict(r) for r in rows]
+
     def clear_all(self):
-        """次日清算删库指令"""
-        with sqlite3.connect(DB_PATH) as conn:
-            conn.execute("DELETE FROM ledger_pnl")
-            conn.execute("DELETE FROM order_book")
\ No newline at end of file
+        """次日清算指令 (同步等待落盘)：只清当前水位，事件流水里追加一条 reset，订单与串关簿归档在这条 reset 名下；
+        reset、归档与清空在同一个事务里，不会出现流水已清、水位还在的半截状态"""
+        reset_seq = "(SELECT MAX(seq) FROM ledger_events WHERE kind = 'reset')"  # 同一事务里刚插入的那条
+        self.execute_atomic([
+            ("INSERT INTO ledger_events (ts, kind) VALUES (?, 'reset')", (time.time(),), False),
+            (f"""INSERT INTO order_book_archive
+                SELECT {reset_seq}, rowid, ticket_id, ticket_type, stake, action, retained_liability, hedge_stake, danger_match_id, danger_selection, timestamp
+                FROM order_book ORDER BY rowid""", (), False),
+            (f"INSERT INTO parlay_book_archive SELECT {reset_seq}, ticket_id, stake, liability, legs FROM parlay_book ORDER BY rowid", (), False),
+            ("DELETE FROM ledger_pnl", (), False),
+            ("DELETE FROM order_book", (), False),
+            ("DELETE FROM order_summary", (), False),  # 汇总表是当前订单簿的派生值，跟着清；归档的订单随时可以重新汇总
+            ("DELETE FROM parlay_book", (), False),
+        ], durable=True)
@@ -0,0 +1,192 @@
+import asyncio
+import contextlib
+import functools
+import threading
+from time import perf_counter_ns
+from typing import Callable, Dict, List, Optional, Tuple
+from src.shadow_bookmaker.config import settings
+
+# 对数-线性分桶 (HDR 直方图同款)：64 ns 以内每纳秒一个桶，往上每个 2 的幂区间切 32 个子桶，
+# 相对误差 < 1/32 ≈ 3%；覆盖 1 ns ~ 292 年，一共 1888 个桶，记录一次只是一次位运算 + 列表自增
+_SUB_BITS = 5
+_LINEAR = 2 << _SUB_BITS
+_BUCKETS = (64 - _SUB_BITS) << _SUB_BITS
+
+def _bucket_of(ns: int) -> int:
+    if ns < _LINEAR: return ns if ns > 0 else 0
+    shift = ns.bit_length() - _SUB_BITS - 1
+    return (shift << _SUB_BITS) + (ns >> shift)
+
+def _bucket_bounds(idx: int) -> Tuple[int, int]:
+    """桶 idx 覆盖的闭区间 [lo, hi] (纳秒)"""
+    if idx < _LINEAR: return idx, idx
+    shift = (idx >> _SUB_BITS) - 1
+    mantissa = idx - (shift << _SUB_BITS)
+    return mantissa << shift, ((mantissa + 1) << shift) - 1
+
+# Prometheus 导出用的粗桶边界 (秒)：1 µs ~ 10 s
+_PROM_BOUNDS = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4,
+                1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+_QUANTILES = (0.5, 0.9, 0.99)
+
+class LatencyHistogram:
+    """单个环节的耗时直方图 (纳秒)。
+
+    记录路径只动两个字段 (桶计数 + 总耗时)：次数与最大值都在读的时候从桶里算，最大值同样只精确到桶。
+    计数不加锁：写线程与事件循环偶发撞车丢一次计数，换来记录路径零锁。
+    """
+    __slots__ = ("counts", "total_ns")
+
+    def __init__(self):
+        self.counts: List[int] = [0] * _BUCKETS
+        self.total_ns = 0
+
+    def record(self, ns: int):
+        """ns 必须 >= 0；_bucket_of 手工内联，热路径上省一次函数调用"""
+        shift = ns.bit_length() - _SUB_BITS - 1
+        if shift < 1: self.counts[ns] += 1
+        else: self.counts[(shift << _SUB_BITS) + (ns >> shift)] += 1
+        self.total_ns += ns
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    @property
+    def max_ns(self) -> int:
+        for idx in range(_BUCKETS - 1, -1, -1):
+            if self.counts[idx]: return _bucket_bounds(idx)[1]
+        return 0
+
+    def quantile(self, q: float) -> float:
+        """q 分位耗时 (秒)：取命中桶的上沿 (与 HDR 的 highest equivalent value 一致)"""
+        rank, seen = max(1, int(q * self.count + 0.5)), 0
+        for idx, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank: return _bucket_bounds(idx)[1] / 1e9
+        return 0.0
+
+    def clear(self):
+        self.counts[:] = [0] * _BUCKETS
+        self.total_ns = 0
+
+    def to_dict(self) -> dict:
+        """稀疏导出 (只带非零桶)，供跨进程汇总"""
+        return {"buckets": {i: c for i, c in enumerate(self.counts) if c}, "total_ns": self.total_ns}
+
+    def merge(self, part: dict):
+        for idx, c in part["buckets"].items(): self.counts[int(idx)] += c
+        self.total_ns += part["total_ns"]
+
+class _Span:
+    __slots__ = ("record", "t0")
+
+    def __init__(self, record: Callable[[int], None]):
+        self.record = record
+
+    def __enter__(self):
+        self.t0 = perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.record(perf_counter_ns() - self.t0)
+
+_NULL_SPAN = contextlib.nullcontext()
+
+class Metrics:
+    """进程内的分环节耗时登记处：span / timed 打点，HDR 直方图存分布，导出 Prometheus 文本或 JSON 摘要。
+
+    关掉 (METRICS_ENABLED=False) 时 timed 直接返回原函数、span 返回共享的空上下文，热路径上不留任何开销。
+    """
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._hists: Dict[str, LatencyHistogram] = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, stage: str) -> LatencyHistogram:
+        hist = self._hists.get(stage)
+        if hist is None:
+            with self._lock: hist = self._hists.setdefault(stage, LatencyHistogram())
+        return hist
+
+    def record(self, stage: str, ns: int):
+        if self.enabled: (self._hists.get(stage) or self.histogram(stage)).record(ns)
+
+    def span(self, stage: str):
+        """with metrics.span("db.commit"): ... —— 给一段代码计时"""
+        if not self.enabled: return _NULL_SPAN
+        hist = self._hists.get(stage) or self.histogram(stage)
+        return _Span(hist.record)
+
+    def timed(self, stage: str) -> Callable:
+        """装饰器版 span，同步 / 异步函数都能挂；装饰时就定好开关，关掉的话原函数原样返回"""
+        def decorate(fn: Callable) -> Callable:
+            if not self.enabled: return fn
+            hist = self.histogram(stage)
+            if asyncio.iscoroutinefunction(fn):
+                @functools.wraps(fn)
+                async def timed_async(*args, **kwargs):
+                    t0 = perf_counter_ns()
+                    try: return await fn(*args, **kwargs)
+                    finally: hist.record(perf_counter_ns() - t0)
+                return timed_async
+            @functools.wraps(fn)
+            def timed_sync(*args, **kwargs):
+                t0 = perf_counter_ns()
+                try: return fn(*args, **kwargs)
+                finally: hist.record(perf_counter_ns() - t0)
+            return timed_sync
+        return decorate
+
+    def reset(self):
+        """原地清零 (装饰器手里攥着直方图对象，不能换新的)"""
+        for hist in list(self._hists.values()): hist.clear()
+
+    # ---------------- 导出 ----------------
+    def snapshot(self) -> Dict[str, dict]:
+        return {stage: hist.to_dict() for stage, hist in list(self._hists.items()) if any(hist.counts)}
+
+    @staticmethod
+    def combine(*snapshots: Dict[str, dict]) -> Dict[str, LatencyHistogram]:
+        """把若干份 snapshot (本进程 + 各分片进程) 按环节合并成直方图"""
+        merged: Dict[str, LatencyHistogram] = {}
+        for snap in snapshots:
+            for stage, part in snap.items(): merged.setdefault(stage, LatencyHistogram()).merge(part)
+        return merged
+
+    def summary(self, snapshot: Optional[Dict[str, dict]] = None) -> List[dict]:
+        """每个环节一行：次数、均值、p50/p90/p99、最大值 (秒)，按累计耗时倒序"""
+        hists = self.combine(self.snapshot() if snapshot is None else snapshot)
+        rows = []
+        for stage, h in hists.items():
+            count = h.count
+            rows.append({"stage": stage, "count": count, "total": h.total_ns / 1e9, "mean": h.total_ns / count / 1e9,
+                         **{f"p{int(q * 100)}": h.quantile(q) for q in _QUANTILES}, "max": h.max_ns / 1e9})
+        return sorted(rows, key=lambda r: -r["total"])
+
+    def prometheus(self, snapshot: Optional[Dict[str, dict]] = None) -> str:
+        """Prometheus 文本格式 (0.0.4)：shadow_stage_seconds 直方图 + 按 HDR 桶算出的分位数 gauge"""
+        hists = self.combine(self.snapshot() if snapshot is None else snapshot)
+        lines = ["# HELP shadow_stage_seconds Per-stage latency.", "# TYPE shadow_stage_seconds histogram"]
+        edges = [(_bucket_of(int(b * 1e9)), b) for b in _PROM_BOUNDS]
+        for stage, h in sorted(hists.items()):
+            label = stage.replace("\\", "\\\\").replace('"', '\\"')
+            count, cum, idx = h.count, 0, 0
+            for edge, bound in edges:
+                cum += sum(h.counts[idx:edge + 1])
+                idx = edge + 1
+                lines.append(f'shadow_stage_seconds_bucket{{stage="{label}",le="{bound:g}"}} {cum}')
+            lines.append(f'shadow_stage_seconds_bucket{{stage="{label}",le="+Inf"}} {count}')
+            lines.append(f'shadow_stage_seconds_sum{{stage="{label}"}} {h.total_ns / 1e9:.9f}')
+            lines.append(f'shadow_stage_seconds_count{{stage="{label}"}} {count}')
+        lines += ["# HELP shadow_stage_quantile_seconds Per-stage latency quantiles from the HDR histogram.",
+                  "# TYPE shadow_stage_quantile_seconds gauge"]
+        for stage, h in sorted(hists.items()):
+            label = stage.replace("\\", "\\\\").replace('"', '\\"')
+            for q in _QUANTILES + (1.0,):
+                value = h.max_ns / 1e9 if q == 1.0 else h.quantile(q)
+                lines.append(f'shadow_stage_quantile_seconds{{stage="{label}",quantile="{q:g}"}} {value:.9f}')
+        return "\n".join(lines) + "\n"
+
+# 进程级单例：各模块 from ... import metrics 后直接打点
+metrics = Metrics(settings.METRICS_ENABLED)
@@ -1,12 +1,87 @@
+import asyncio
+import importlib.util
+from typing import Any, Dict, Optional, Tuple
 import httpx
 from tenacity import retry, wait_exponential, stop_after_attempt
 from src.shadow_bookmaker.config import settings
+from src.shadow_bookmaker.infrastructure.metrics import metrics
+
+# 凭据不进条件请求缓存的指纹：换 key 不丢缓存，常驻内存的缓存键里也不留明文 key
+_CREDENTIAL_PARAMS = frozenset({"apiKey"})
+_VALIDATOR_HEADERS = ("if-none-match", "if-modified-since")
 
 class AsyncNetworkEngine:
-    @retry(wait=wait_exponential(multiplier=1, min=2, max=10), stop=stop_after_attempt(3))
+    """共享连接池的异步网络引擎：一个引擎一个 httpx.AsyncClient，TCP/TLS 握手只付一次"""
+    def __init__(self, max_connections: Optional[int] = None, http2: Optional[bool] = None, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.max_connections = settings.HTTP_MAX_CONNECTIONS if max_connections is None else max_connections
+        self.http2 = settings.HTTP2 if http2 is None else http2
+        if self.http2 and importlib.util.find_spec("h2") is None:
+            print("📡 未安装 h2 (pip install httpx[http2])，HTTP/2 已降级为 HTTP/1.1")
+            self.http2 = False
+        self.transport = transport  # 离线联调 / 压测时注入 httpx.ASGITransport，请求直接打进进程内的桩服务
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # 条件请求缓存：请求指纹 -> (ETag, Last-Modified, 上次解析好的 JSON)
+        self._validators: Dict[Tuple, Tuple[Optional[str], Optional[str], object]] = {}
+
+    def _get_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        # 连接池绑定在创建它的事件循环上；换了循环 (例如 Streamlit 每次新建 loop) 就重建
+        if self._client is None or self._client.is_closed or self._loop is not loop:
+            self._client = httpx.AsyncClient(
+                timeout=settings.REQUEST_TIMEOUT, http2=self.http2, transport=self.transport,
+                limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections),
+            )
+            self._loop = loop
+        return self._client
+
+    async def start(self):
+        self._get_client()
+
+    async def aclose(self):
+        if self._client is not None and not self._client.is_closed and self._loop is asyncio.get_running_loop():
+            await self._client.aclose()
+        self._client = None
+        self._loop = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
     # ⚡ 增加 params 参数支持，用于把 API Key 传给外网
     async def fetch_json(self, url: str, headers: dict = None, params: dict = None) -> dict:
-        async with httpx.AsyncClient(timeout=settings.REQUEST_TIMEOUT) as client:
-            response = await client.get(url, headers=headers, params=params)
-            response.raise_for_status()
-            return response.json()
\ No newline at end of file
+        return (await self.fetch(url, headers, params))[0]
+
+    @retry(wait=wait_exponential(multiplier=1, min=2, max=10), stop=stop_after_attempt(3))
+    async def fetch(self, url: str, headers: dict = None, params: dict = None) -> Tuple[Any, httpx.Headers]:
+        """GET 并解析 JSON，连同响应头一起返回 (额度余量之类的信息在响应头里)"""
+        key = (url, tuple(sorted((k, v) for k, v in (params or {}).items() if k not in _CREDENTIAL_PARAMS)))
+        headers = dict(headers or {})
+        cached = self._validators.get(key)
+        if cached:
+            etag, last_modified, _ = cached
+            if etag: headers["If-None-Match"] = etag
+            if last_modified: headers["If-Modified-Since"] = last_modified
+
+        with metrics.span("network.http_get"):
+            response = await self._get_client().get(url, headers=headers, params=params)
+        if response.status_code == 304:
+            # 🛡️ 外盘没变，连下载带解析全部跳过，直接复用上次的结果 (304 没带 ETag 就补上缓存里的，调用方按它认批次)
+            if cached:
+                reply = response.headers.copy()
+                if cached[0] and "ETag" not in reply: reply["ETag"] = cached[0]
+                return cached[2], reply
+            # 手里没有可复用的结果 (调用方自带了校验头，或缓存刚被别的请求换掉)：去掉校验头无条件重抓一次
+            headers = {k: v for k, v in headers.items() if k.lower() not in _VALIDATOR_HEADERS}
+            with metrics.span("network.http_get"):
+                response = await self._get_client().get(url, headers=headers, params=params)
+        response.raise_for_status()
+        with metrics.span("network.json_decode"): data = response.json()
+
+        etag, last_modified = response.headers.get("ETag"), response.headers.get("Last-Modified")
+        if etag or last_modified: self._validators[key] = (etag, last_modified, data)
+        else: self._validators.pop(key, None)
+        return data, response.headers
@@ -0,0 +1,234 @@
+import atexit
+import itertools
+import json
+import os
+import shutil
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from src.shadow_bookmaker.domain.models import MarketChange, OddsDTO
+from src.shadow_bookmaker.config import settings
+
+# 与 SQLite 账本放在同一个 data 目录下
+HISTORY_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "..", "data", "odds_history"))
+
+_SCALE = 10_000  # 赔率按 1/10000 定点存成整数 (小数点后 4 位，外盘报价远用不到)
+_DAY_MS = 86_400_000
+_COMPACT_EVERY = 3600.0  # 封存时顺手整理老段，最多每小时一次
+_EMPTY = (np.empty(0, dtype=np.int64), np.empty((0, 3), dtype=np.int64))
+
+class _Segment:
+    """一个封存的只读段：各列是独立的 .npy，np.load(mmap_mode="r") 直接映射，不读进内存。
+
+    段内按 (键号, 时间) 排序；每个键存一行基准值 (t0 / o0)，逐笔只存与上一笔的差：
+    时间差 uint32 毫秒，赔率差 int16 (放不下才升到 int32)，解码就是对该键那一小段做 cumsum。
+    """
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f: meta = json.load(f)
+        self.start, self.end, self.bucket = meta["start"], meta["end"], meta["bucket"]
+        self.keys, self.offsets, self.t0, self.dt, self.o0, self.do = (np.load(os.path.join(path, f"{c}.npy"), mmap_mode="r") for c in ("keys", "offsets", "t0", "dt", "o0", "do"))
+        self.index = {int(k): i for i, k in enumerate(self.keys)}  # 全局键号 -> 段内位置
+
+    @property
+    def rows(self) -> int:
+        return len(self.dt)
+
+    @property
+    def day(self) -> int:
+        return self.start // _DAY_MS
+
+    def series(self, key: int) -> Tuple[np.ndarray, np.ndarray]:
+        """某个全局键号在本段的 (毫秒时间戳, 定点赔率 n×3)"""
+        i = self.index.get(key)
+        if i is None: return _EMPTY
+        s, e = int(self.offsets[i]), int(self.offsets[i + 1])
+        return self.t0[i] + np.cumsum(self.dt[s:e], dtype=np.int64), self.o0[i] + np.cumsum(self.do[s:e], axis=0, dtype=np.int64)
+
+    def decode_all(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """整段解码 (合并/降采样用)：(每行全局键号, 毫秒时间戳, 定点赔率)"""
+        counts = np.diff(self.offsets)
+        first = np.asarray(self.offsets[:-1])
+        # 每个键第一行的差值是 0，所以整列 cumsum 减去该键第一行处的累计值就是键内累计
+        dt = np.cumsum(self.dt, dtype=np.int64)
+        do = np.cumsum(self.do, axis=0, dtype=np.int64)
+        ts = np.repeat(np.asarray(self.t0), counts) + dt - np.repeat(dt[first], counts)
+        odds = np.repeat(np.asarray(self.o0, dtype=np.int64), counts, axis=0) + do - np.repeat(do[first], counts, axis=0)
+        return np.repeat(np.asarray(self.keys, dtype=np.int64), counts), ts, odds
+
+def _write_segment(root: str, key_ids: np.ndarray, ts: np.ndarray, odds: np.ndarray, bucket: int = 0) -> str:
+    """把 (全局键号, 毫秒时间戳, 定点赔率) 编码成一个段目录；先写临时目录再改名，读方永远看不到半截段"""
+    order = np.lexsort((ts, key_ids))
+    key_ids, ts, odds = key_ids[order], ts[order], odds[order]
+    keys, first = np.unique(key_ids, return_index=True)
+    dt = np.diff(ts, prepend=ts[:1]); dt[first] = 0
+    do = np.diff(odds, axis=0, prepend=odds[:1]); do[first] = 0
+    do = do.astype(np.int16) if np.abs(do).max() <= np.iinfo(np.int16).max else do.astype(np.int32)
+    name = f"{int(ts.min()):013d}-{int(ts.max()):013d}" + (f"-b{bucket}" if bucket else "")
+    tmp = os.path.join(root, f".{name}.tmp")
+    os.makedirs(tmp, exist_ok=True)
+    columns = (("keys", keys.astype(np.int32)), ("offsets", np.append(first, len(ts)).astype(np.int64)), ("t0", ts[first]),
+               ("dt", dt.astype(np.uint32)), ("o0", odds[first].astype(np.int32)), ("do", do))
+    for col, arr in columns: np.save(os.path.join(tmp, f"{col}.npy"), arr)
+    with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({"start": int(ts.min()), "end": int(ts.max()), "bucket": bucket}, f)
+    path, n = os.path.join(root, name), 0
+    while os.path.exists(path):  # 同一时间范围的段 (极少见) 加序号区分，不覆盖
+        n += 1
+        path = os.path.join(root, f"{name}.{n}")
+    os.rename(tmp, path)
+    return path
+
+class OddsHistory:
+    """赔率时间序列库：只追加地记录每一次报价变动，按 (场次, 庄家) 做区间与 as-of 查询。
+
+    写入端挂在 MarketStore 的变动事件上 (没变的报价本来就不发事件)，每次只往内存头部追加几个整数；
+    头部攒够 ODDS_HISTORY_SEGMENT_ROWS 行或超过 ODDS_HISTORY_SEGMENT_SECONDS 秒封存成一个列式段。
+    (场次, 庄家, 主队, 客队) 只在 keys.jsonl 里记一次，段里只存键号。
+    往日的段按 UTC 自然日合并成一段；过了 ODDS_HISTORY_DOWNSAMPLE_AFTER_DAYS 的再降采样 (每个桶只留最后一笔)，
+    过了保留期整段删除，磁盘占用有上界。报价下架记一笔全 0，as-of 落在下架之后返回 None。
+    """
+    def __init__(self, root: str = HISTORY_DIR):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.RLock()  # 进单线程追加/封存，API 工作线程查询
+        # 全局键表：行号即键号，只追加
+        self._keys: List[tuple] = []
+        self._key_ids: Dict[Tuple[str, str], int] = {}
+        self._keys_path = os.path.join(root, "keys.jsonl")
+        if os.path.exists(self._keys_path):
+            with open(self._keys_path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip(): self._add_key(tuple(json.loads(line)))
+        self._persisted_keys = len(self._keys)
+        self._segments: List[_Segment] = []
+        for name in sorted(os.listdir(root)):
+            path = os.path.join(root, name)
+            if name.startswith("."): shutil.rmtree(path, ignore_errors=True)  # 上次没写完的临时段
+            elif os.path.isdir(path): self._segments.append(_Segment(path))
+        self._segments.sort(key=lambda s: s.start)
+        # 内存头部：逐笔 (键号, 毫秒时间戳, 主, 客, 平)
+        self._head: List[Tuple[int, int, int, int, int]] = []
+        self._head_since = 0.0
+        self._compacted_at = 0.0
+        atexit.register(self.flush)
+
+    def _add_key(self, key: tuple) -> int:
+        k = self._key_ids[key[:2]] = len(self._keys)
+        self._keys.append(key)
+        return k
+
+    # ------------------------------------------------------------------
+    # 写入
+    # ------------------------------------------------------------------
+    def record(self, changes: List[MarketChange], now: float = None):
+        """MarketStore 订阅回调：added/moved 记新价，removed 记一笔下架"""
+        now = time.time() if now is None else now
+        for c in changes:
+            self.append(c.new if c.new is not None else c.old, now, removed=c.kind == "removed")
+
+    def append(self, odds: OddsDTO, ts: float, removed: bool = False):
+        with self._lock:
+            k = self._key_ids.get((odds.match_id, odds.bookmaker))
+            if k is None: k = self._add_key((odds.match_id, odds.bookmaker, odds.home_team, odds.away_team))
+            if not self._head: self._head_since = ts
+            if removed: self._head.append((k, int(ts * 1000), 0, 0, 0))
+            else: self._head.append((k, int(ts * 1000), round(odds.home_odds * _SCALE), round(odds.away_odds * _SCALE), round((odds.draw_odds or 0.0) * _SCALE)))
+            if len(self._head) >= settings.ODDS_HISTORY_SEGMENT_ROWS or ts - self._head_since >= settings.ODDS_HISTORY_SEGMENT_SECONDS: self.flush()
+
+    def flush(self):
+        """把内存头部封存成一个段 (新键先落进 keys.jsonl)，并按需整理老段"""
+        with self._lock:
+            if self._head:
+                if self._persisted_keys < len(self._keys):
+                    with open(self._keys_path, "a", encoding="utf-8") as f:
+                        f.writelines(json.dumps(list(k), ensure_ascii=False) + "\n" for k in self._keys[self._persisted_keys:])
+                    self._persisted_keys = len(self._keys)
+                rows = np.array(self._head, dtype=np.int64)
+                self._segments.append(_Segment(_write_segment(self.root, rows[:, 0], rows[:, 1], rows[:, 2:])))
+                self._segments.sort(key=lambda s: s.start)
+                self._head = []
+            if time.time() - self._compacted_at >= _COMPACT_EVERY: self.compact()
+
+    def compact(self, now: float = None):
+        """往日的段按天合并、过了降采样年龄的降采样、过了保留期的删除"""
+        now = time.time() if now is None else now
+        with self._lock:
+            self._compacted_at = time.time()
+            self._compact(now)
+
+    def _compact(self, now: float):
+        now_ms = int(now * 1000)
+        expired = [s for s in self._segments if s.end < now_ms - settings.ODDS_HISTORY_RETENTION_DAYS * _DAY_MS]
+        bucket = int(settings.ODDS_HISTORY_DOWNSAMPLE_SECONDS * 1000)
+        days: Dict[int, List[_Segment]] = {}
+        for s in self._segments:
+            if s not in expired and s.day < now_ms // _DAY_MS: days.setdefault(s.day, []).append(s)
+        merged, replaced = [], []
+        for day, group in days.items():
+            # 往日：多段合成一段；过了降采样年龄且还有原始精度的段：合并时每个 (键, 桶) 只留最后一笔
+            downsample = (day + 1) * _DAY_MS < now_ms - settings.ODDS_HISTORY_DOWNSAMPLE_AFTER_DAYS * _DAY_MS and any(not s.bucket for s in group)
+            if len(group) < 2 and not downsample: continue
+            parts = [s.decode_all() for s in group]
+            key_ids, ts, odds = (np.concatenate([p[i] for p in parts]) for i in range(3))
+            if downsample:
+                order = np.lexsort((ts, ts // bucket, key_ids))
+                key_ids, ts, odds = key_ids[order], ts[order], odds[order]
+                slot = np.stack([key_ids, ts // bucket], axis=1)
+                last = np.append(np.any(slot[1:] != slot[:-1], axis=1), True)
+                key_ids, ts, odds = key_ids[last], ts[last], odds[last]
+            merged.append(_Segment(_write_segment(self.root, key_ids, ts, odds, bucket=bucket if downsample or any(s.bucket for s in group) else 0)))
+            replaced += group
+        if not (expired or replaced): return
+        for s in expired + replaced: shutil.rmtree(s.path, ignore_errors=True)
+        dropped = set(map(id, expired + replaced))
+        self._segments = sorted([s for s in self._segments if id(s) not in dropped] + merged, key=lambda s: s.start)
+
+    # ------------------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------------------
+    def _head_series(self, key: int) -> Tuple[np.ndarray, np.ndarray]:
+        rows = np.array([r[1:] for r in self._head if r[0] == key], dtype=np.int64).reshape(-1, 4)
+        return rows[:, 0], rows[:, 1:]
+
+    def range(self, match_id: str, bookmaker: str, start: float = None, end: float = None) -> pd.DataFrame:
+        """[start, end] 区间内的逐笔报价 (主/客/平；无平局为 NaN，下架为全 0)，索引为 unix 秒"""
+        lo = -np.inf if start is None else start * 1000; hi = np.inf if end is None else end * 1000
+        with self._lock:
+            key = self._key_ids.get((match_id, bookmaker))
+            parts = [] if key is None else [s.series(key) for s in self._segments if s.end >= lo and s.start <= hi] + [self._head_series(key)]
+        ts, odds = (np.concatenate([p[0] for p in parts]), np.concatenate([p[1] for p in parts])) if parts else _EMPTY
+        keep = (ts >= lo) & (ts <= hi)
+        ts, odds = ts[keep], odds[keep]
+        order = np.argsort(ts, kind="stable")
+        frame = pd.DataFrame(odds[order] / _SCALE, index=pd.Index(ts[order] / 1000.0, name="ts"), columns=["home", "away", "draw"])
+        frame["draw"] = frame["draw"].where((frame["draw"] > 0) | (frame["home"] == 0))
+        return frame
+
+    def as_of(self, match_id: str, bookmaker: str, ts: float) -> Optional[OddsDTO]:
+        """ts 时刻 (unix 秒) 生效的报价：从内存头部和最新的段往前找，第一笔 <= ts 的就是答案"""
+        t = ts * 1000
+        with self._lock:
+            key = self._key_ids.get((match_id, bookmaker))
+            if key is None: return None
+            names = self._keys[key]
+            hit = None
+            # 惰性：只解码到第一段命中为止
+            candidates = itertools.chain([self._head_series(key)], (s.series(key) for s in reversed(self._segments) if s.start <= t and key in s.index))
+            for series_ts, odds in candidates:
+                i = int(np.searchsorted(series_ts, t, side="right")) - 1
+                if i >= 0:
+                    hit = odds[i]
+                    break
+        if hit is None: return None
+        home, away, draw = (int(v) for v in hit)
+        if home == 0: return None  # 当时已下架
+        return OddsDTO.model_construct(bookmaker=bookmaker, match_id=match_id, home_team=names[2], away_team=names[3],
+                                       home_odds=home / _SCALE, away_odds=away / _SCALE, draw_odds=draw / _SCALE if draw else None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"segments": len(self._segments), "rows": sum(s.rows for s in self._segments), "head_rows": len(self._head), "keys": len(self._keys),
+                    "bytes": sum(os.path.getsize(os.path.join(s.path, f)) for s in self._segments for f in os.listdir(s.path))}
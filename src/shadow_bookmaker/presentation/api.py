@@ -0,0 +1,212 @@
+"""无界面进单服务 (ASGI)：风控大脑常驻在这个进程里，Streamlit 控制台与压测脚本都只是它的 HTTP 客户端。
+
+独立启动: python -m src.shadow_bookmaker.presentation.api   (监听 settings.INTAKE_HOST:INTAKE_PORT)
+"""
+import asyncio
+import contextlib
+import math
+import threading
+from typing import Optional
+import uvicorn
+from pydantic import ValidationError
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse
+from starlette.routing import Route
+from src.shadow_bookmaker.application.orchestrator import BrokerOrchestrator
+from src.shadow_bookmaker.application.sharding import ShardRouter
+from src.shadow_bookmaker.application.intake_service import TicketIntake, IntakeOverloaded
+from src.shadow_bookmaker.domain.models import CustomerTicket, RiskDecision
+from src.shadow_bookmaker.infrastructure.metrics import metrics
+from src.shadow_bookmaker.config import settings
+
+def _age(seconds: float) -> Optional[float]:
+    return None if math.isinf(seconds) else seconds  # JSON 里没有 Infinity，从未抓到过盘口记为 null
+
+def _overloaded(e: IntakeOverloaded) -> JSONResponse:
+    # 🚦 背压：明确告诉客户端现在排不进去，而不是让请求无限挂起
+    return JSONResponse({"error": str(e)}, status_code=503, headers={"Retry-After": "1"})
+
+def _invalid(e: ValidationError) -> JSONResponse:
+    return JSONResponse({"error": "工单不合法", "detail": e.errors(include_url=False, include_context=False)}, status_code=422)
+
+def _bad_request(message: str) -> JSONResponse:
+    return JSONResponse({"error": message}, status_code=400)
+
+async def _json_object(request: Request) -> dict:
+    """请求体解析成 JSON 对象；不是合法 JSON (JSONDecodeError 也是 ValueError) 或不是对象都抛 ValueError，由路由转成 400"""
+    body = await request.json()
+    if not isinstance(body, dict): raise ValueError("请求体必须是 JSON 对象")
+    return body
+
+def _timestamp(value: Optional[str]) -> Optional[float]:
+    """查询参数里的 unix 秒 (缺省为 None)；不是数字抛 ValueError，由路由转成 400"""
+    return float(value) if value else None
+
+def create_app(orchestrator: BrokerOrchestrator = None) -> Starlette:
+    if orchestrator is None:
+        # 🧩 配了 SHARD_COUNT 就起分片部署：本进程只做抓盘和路由，风控与账本在各分片进程里
+        orchestrator = ShardRouter() if settings.SHARD_COUNT > 0 else BrokerOrchestrator()
+    intake = TicketIntake(orchestrator)
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app):
+        await orchestrator.start()
+        await intake.start()
+        try: yield
+        finally:
+            await intake.stop()
+            await orchestrator.aclose()
+            await orchestrator.db.aflush()
+            orchestrator.odds_history.flush()
+
+    async def health(request: Request):
+        return JSONResponse({"ok": intake.running})
+
+    async def stats(request: Request):
+        return JSONResponse({**intake.stats, "queue_depth": intake.queue_depth, "max_queue": intake.max_queue, "inflight_batches": intake.inflight,
+                             "lock_wait": await orchestrator.lock_stats(), "snapshot_age": _age(orchestrator.snapshot_age), "live_feed": bool(settings.ODDS_API_KEY)})
+
+    async def stage_metrics(request: Request):
+        # 默认 Prometheus 文本格式给采集端抓；?format=json 返回每个环节的次数/均值/分位数给控制台
+        snapshot = await orchestrator.metrics_snapshot()
+        if request.query_params.get("format") == "json":
+            return JSONResponse({"enabled": metrics.enabled, "stages": metrics.summary(snapshot)})
+        return PlainTextResponse(metrics.prometheus(snapshot), media_type="text/plain; version=0.0.4")
+
+    async def market(request: Request):
+        live = await orchestrator.get_live_market(force_refresh=request.query_params.get("force") == "1")
+        return JSONResponse({"snapshot_age": _age(orchestrator.snapshot_age), "odds": {m_id: o.model_dump() for m_id, o in live.items()}})
+
+    async def market_history(request: Request):
+        """盘口走势：?match_id=&bookmaker=(缺省为锚点庄家)&start=&end= (unix 秒)"""
+        q = request.query_params
+        if not q.get("match_id"): return _bad_request("缺少 match_id")
+        try: start, end = _timestamp(q.get("start")), _timestamp(q.get("end"))
+        except ValueError: return _bad_request("start / end 必须是 unix 秒")
+        bookmaker = q.get("bookmaker") or orchestrator.market.sharp_bookmaker
+        frame = await asyncio.to_thread(orchestrator.odds_history.range, q["match_id"], bookmaker, start, end)
+        return JSONResponse({"bookmaker": bookmaker, "ts": frame.index.tolist(), **{c: frame[c].astype(object).where(frame[c].notna(), None).tolist() for c in frame.columns}})
+
+    async def market_as_of(request: Request):
+        """某一时刻生效的报价：?match_id=&ts=&bookmaker=(缺省为锚点庄家)；当时没有报价返回 null"""
+        q = request.query_params
+        if not q.get("match_id") or not q.get("ts"): return _bad_request("需要 match_id 与 ts (unix 秒)")
+        try: ts = float(q["ts"])
+        except ValueError: return _bad_request("ts 必须是 unix 秒")
+        bookmaker = q.get("bookmaker") or orchestrator.market.sharp_bookmaker
+        odds = await asyncio.to_thread(orchestrator.odds_history.as_of, q["match_id"], bookmaker, ts)
+        return JSONResponse({"odds": odds.model_dump() if odds else None})
+
+    async def submit_ticket(request: Request):
+        try: body = await _json_object(request)
+        except ValueError: return _bad_request("请求体必须是 JSON 对象")
+        try: ticket = CustomerTicket.model_validate(body)
+        except ValidationError as e: return _invalid(e)
+        try: decision = await intake.submit(ticket, commit=request.query_params.get("commit") == "1")
+        except IntakeOverloaded as e: return _overloaded(e)
+        return JSONResponse(decision.model_dump())
+
+    async def submit_batch(request: Request):
+        try: body = await _json_object(request)
+        except ValueError: return _bad_request("请求体必须是 JSON 对象")
+        if not isinstance(body.get("tickets"), list): return _bad_request("缺少 tickets 列表")
+        try: tickets = [CustomerTicket.model_validate(t) for t in body["tickets"]]
+        except ValidationError as e: return _invalid(e)
+        try: decisions = await intake.submit_many(tickets, commit=bool(body.get("commit")))
+        except IntakeOverloaded as e: return _overloaded(e)
+        return JSONResponse({"decisions": [d.model_dump() for d in decisions]})
+
+    async def commit_decision(request: Request):
+        """人工签字确权：前台先预览裁决，确认后再把 (裁决, 工单) 提交回来；
+        服务端锁住相关场次按当前账本重算，条款没变才入账，变了就把最新裁决退回去 (409) 让前台重新确认"""
+        try: body = await _json_object(request)
+        except ValueError: return _bad_request("请求体必须是 JSON 对象")
+        if "decision" not in body or "ticket" not in body: return _bad_request("需要 decision 与 ticket")
+        try:
+            decision = RiskDecision.model_validate(body["decision"])
+            ticket = CustomerTicket.model_validate(body["ticket"])
+        except ValidationError as e: return _invalid(e)
+        committed, fresh = await orchestrator.confirm_decision(decision, ticket, durable=body.get("durable", True))
+        stale = not committed and decision.action != "REJECT"
+        return JSONResponse({"committed": committed, "decision": fresh.model_dump()}, status_code=409 if stale else 200)
+
+    async def exposure(request: Request):
+        # ?as_of=<unix 秒>：按账本事件流水回溯当时的全书盈亏 (对账/争议)，不带则是当前账本
+        try: as_of = _timestamp(request.query_params.get("as_of"))
+        except ValueError: return _bad_request("as_of 必须是 unix 秒")
+        frame = await (orchestrator.exposure_as_of(as_of) if as_of is not None else orchestrator.exposure_frame())
+        # 全书总敞口：各场最坏盈亏里的亏损部分之和 (与 GlobalLedger.total_exposure 同口径)
+        return JSONResponse({"match_ids": list(frame.index), "pnl": frame.to_numpy().tolist(), "total_exposure": float(-frame.min(axis=1).clip(upper=0.0).sum())})
+
+    async def orders(request: Request):
+        # keyset 分页：?before=<上一页最后一行的 seq>，next_before 为空表示已经翻到底
+        q = request.query_params
+        try: limit, before = int(q.get("limit", 100)), int(q["before"]) if q.get("before") else None
+        except ValueError: return _bad_request("limit / before 必须是整数")
+        limit = max(1, min(limit, 1000))  # 0 或负数会变成空页 / LIMIT -1 (不限行数)
+        rows = await asyncio.to_thread(orchestrator.db.get_order_book, limit, before, q.get("match_id") or None, q.get("action") or None)
+        return JSONResponse({"orders": rows, "next_before": rows[-1]["seq"] if len(rows) == limit else None})
+
+    async def order_summary(request: Request):
+        by = request.query_params.get("by", "match")
+        if by not in ("match", "action"): return _bad_request("by 只能是 match 或 action")
+        return JSONResponse({"summary": await asyncio.to_thread(orchestrator.db.order_summary, by)})
+
+    async def portfolio_risk(request: Request):
+        try: body = await _json_object(request)
+        except ValueError: return _bad_request("请求体必须是 JSON 对象")
+        risk = await orchestrator.simulate_portfolio_risk(body.get("n_scenarios"), body.get("bankroll_limit"), body.get("seed"))
+        return JSONResponse(risk.model_dump())
+
+    async def hedge_plan(request: Request):
+        limit = request.query_params.get("limit")
+        try: limit = float(limit) if limit else None
+        except ValueError: return _bad_request("limit 必须是数字")
+        plan = await orchestrator.plan_hedges(limit)
+        return JSONResponse(plan.model_dump())
+
+    async def wipe(request: Request):
+        await orchestrator.awipe_all_data()
+        return JSONResponse({"wiped": True})
+
+    async def set_odds_api_key(request: Request):
+        try: api_key = (await _json_object(request)).get("api_key", "")
+        except ValueError: return _bad_request("请求体必须是 JSON 对象")
+        if api_key and api_key != settings.ODDS_API_KEY:
+            from src.shadow_bookmaker.infrastructure.bookmakers.the_odds_api import TheOddsAPIBookmaker
+            settings.ODDS_API_KEY = api_key
+            await orchestrator.pinnacle.aclose()
+            orchestrator.pinnacle = TheOddsAPIBookmaker(orchestrator.mapper)
+            await orchestrator.get_live_market(force_refresh=True)
+        return JSONResponse({"live_feed": bool(settings.ODDS_API_KEY)})
+
+    app = Starlette(lifespan=lifespan, routes=[
+        Route("/health", health), Route("/stats", stats), Route("/metrics", stage_metrics), Route("/market", market),
+        Route("/market/history", market_history), Route("/market/as_of", market_as_of),
+        Route("/tickets", submit_ticket, methods=["POST"]), Route("/tickets/batch", submit_batch, methods=["POST"]),
+        Route("/decisions/commit", commit_decision, methods=["POST"]),
+        Route("/exposure", exposure), Route("/orders", orders), Route("/orders/summary", order_summary), Route("/risk/portfolio", portfolio_risk, methods=["POST"]),
+        Route("/risk/hedges", hedge_plan),
+        Route("/admin/wipe", wipe, methods=["POST"]), Route("/admin/odds-api-key", set_odds_api_key, methods=["POST"]),
+    ])
+    app.state.orchestrator = orchestrator
+    app.state.intake = intake
+    return app
+
+def serve_in_background(host: str = "127.0.0.1", port: int = 0, orchestrator: BrokerOrchestrator = None) -> str:
+    """在后台守护线程里拉起进单服务 (独立事件循环)，返回其 base URL；port=0 表示随机空闲端口"""
+    server = uvicorn.Server(uvicorn.Config(create_app(orchestrator), host=host, port=port, log_level="warning", lifespan="on"))
+    thread = threading.Thread(target=server.run, name="intake-service", daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive(): raise RuntimeError("进单服务启动失败")
+        thread.join(0.05)
+    bound_port = server.servers[0].sockets[0].getsockname()[1]
+    return f"http://{host}:{bound_port}"
+
+def main():
+    uvicorn.run(create_app(), host=settings.INTAKE_HOST, port=settings.INTAKE_PORT, log_level="info")
+
+if __name__ == "__main__":
+    main()
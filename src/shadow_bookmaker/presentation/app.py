@@ -1,22 +1,25 @@
-import sys, os, asyncio, uuid
+import sys, os, uuid, datetime
 import streamlit as st
 import pandas as pd
+from pydantic import ValidationError
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..")))
-from src.shadow_bookmaker.application.orchestrator import BrokerOrchestrator
-from src.shadow_bookmaker.domain.models import CustomerTicket, TicketLeg
+from src.shadow_bookmaker.presentation.api import serve_in_background
+from src.shadow_bookmaker.presentation.intake_client import IntakeClient, IntakeOverloadedError
+from src.shadow_bookmaker.domain.models import CustomerTicket, TicketLeg, MAX_PARLAY_LEGS
 from src.shadow_bookmaker.config import settings
 
 st.set_page_config(page_title="Shadow Broker | 现实接轨版", layout="wide")
 
 @st.cache_resource
-def get_orchestrator(): return BrokerOrchestrator()
-orchestrator = get_orchestrator()
+def get_client() -> IntakeClient:
+    # 控制台只是进单服务的客户端：配置了 INTAKE_URL 就连独立服务，否则在本进程后台线程里拉起一个
+    return IntakeClient(settings.INTAKE_URL or serve_in_background())
+client = get_client()
 
 def fetch_live_matches(force=False):
-    try: loop = asyncio.get_running_loop()
-    except RuntimeError: loop = asyncio.new_event_loop(); asyncio.set_event_loop(loop)
-    return loop.run_until_complete(orchestrator.get_live_market(force))
+    live_market, st.session_state.snapshot_age = client.market(force)
+    return live_market
 
 def render_decision(decision, ticket):
     st.markdown("### ⚡ 智能路由指令")
@@ -29,12 +32,27 @@ def render_decision(decision, ticket):
 
     if decision.action != "REJECT":
         if st.button("✅ 签字确权 (固化入 SQLite)", type="primary"):
-            orchestrator.commit_decision(decision, ticket)
+            committed, fresh = client.commit(decision, ticket, durable=True)
+            if not committed:
+                # 预览之后同场有别的单子入账，条款变了：换成最新裁决，请操盘手重新确认
+                st.session_state.last_decision = fresh
+                st.warning("⚠️ 盘面已变，裁决已按最新水位重算，请重新确认。")
+                return
             st.toast("入库成功！资金水池已锁定硬盘。", icon="💾")
             if "last_decision" in st.session_state: del st.session_state.last_decision
             if "last_ticket" in st.session_state: del st.session_state.last_ticket
             st.rerun()
 
+@st.fragment(run_every=5)
+def render_latency_panel():
+    # ⏱️ 各环节耗时直方图 (每 5 秒自刷新，不触发整页重跑)：慢单到底慢在抓盘、解析、风控还是落盘
+    frame = client.metrics()
+    if frame.empty:
+        st.caption("暂无打点数据 (METRICS_ENABLED 关闭或尚未进单)")
+        return
+    ms = (frame[["mean", "p50", "p99", "max"]] * 1000).round(2)
+    st.dataframe(ms.assign(count=frame["count"]), use_container_width=True)
+
 def main():
     with st.sidebar:
         st.header("⚙️ 引擎总控台")
@@ -42,9 +60,7 @@ def main():
         api_key = st.text_input("🔑 The Odds API Key", value=settings.ODDS_API_KEY, type="password")
         if api_key and api_key != settings.ODDS_API_KEY: 
             settings.ODDS_API_KEY = api_key
-            from src.shadow_bookmaker.infrastructure.bookmakers.the_odds_api import TheOddsAPIBookmaker
-            orchestrator.pinnacle = TheOddsAPIBookmaker(orchestrator.mapper)
-            fetch_live_matches(force=True)
+            client.set_odds_api_key(api_key)
             
         st.markdown("*[点击免费获取 API Key](https://the-odds-api.com/)*")
         
@@ -52,13 +68,18 @@ def main():
             fetch_live_matches(force=True)
             st.toast("大盘水位已强行握手同步！", icon="📡")
 
+        with st.expander("⏱️ 环节耗时 (毫秒)"):
+            render_latency_panel()
+
     st.title("🌍 影子做市商 | 全球真实盘口直连版")
 
-    if not settings.ODDS_API_KEY:
+    if not client.stats()["live_feed"]:
         st.warning("⚠️ 引擎处于脱机模拟状态。请在左侧侧边栏输入 API Key 以启动全球雷达监听！")
 
     with st.spinner("📡 正在穿透国际网络，拉取 Pinnacle 全球最新滚球/早盘数据..."):
         live_market = fetch_live_matches()
+    snapshot_age = st.session_state.snapshot_age
+    if snapshot_age != float("inf"): st.sidebar.caption(f"🕒 大盘快照年龄: {snapshot_age:.0f} 秒 (超过 {settings.MARKET_SOFT_TTL:.0f} 秒后台刷新，超过 {settings.MARKET_MAX_AGE:.0f} 秒暂停定价)")
 
     if not live_market:
         st.error("🚨 无法获取真实比赛数据（可能是网络波动或额度耗尽），目前使用模拟兜底数据。")
@@ -72,7 +93,7 @@ def main():
         c1, c2 = st.columns([1, 1.5])
         with c1:
             st.subheader("📥 截获真实散户工单")
-            ticket_type = st.radio("单据类型", ["单关", "二串一"], horizontal=True)
+            ticket_type = st.radio("单据类型", ["单关", "串关"], horizontal=True)
             stake = st.number_input("下注金额 (¥)", 1000, 50000, 10000, 1000)
             
             if ticket_type == "单关":
@@ -83,38 +104,48 @@ def main():
                 if live_market and match_id in live_market:
                     real_odds = live_market[match_id]
                     st.caption(f"*(上帝底牌监控：主 {real_odds.home_odds} | 平 {real_odds.draw_odds} | 客 {real_odds.away_odds})*")
+                    # 📈 盘口走势：锚点庄家对这场的每一次变价
+                    with st.expander("📈 锚点盘口走势"):
+                        line = client.odds_history(match_id)
+                        if len(line) > 1:
+                            line.index = pd.to_datetime(line.index, unit="s")
+                            st.line_chart(line.ffill(), height=220)
+                        else:
+                            st.caption("这场还没有变过价。")
                 
                 odds = st.number_input("客户填写的赔率", 1.01, 20.0, 2.00, 0.05)
                 submit = st.button("🚀 呼叫大脑执行实盘风控", use_container_width=True)
                 if submit:
                     ticket = CustomerTicket(ticket_id=f"T-{uuid.uuid4().hex[:5].upper()}", ticket_type="single", stake=stake, legs=[TicketLeg(match_id=match_id, selection=sel, customer_odds=odds)])
             else:
-                if len(match_list) < 2:
+                max_legs = min(MAX_PARLAY_LEGS, len(match_list))
+                if max_legs < 2:
                     st.error("真实比赛场次不足2场，无法组成串关。")
                     submit = False
                 else:
-                    l1_m = st.selectbox("赛事 1", match_list, index=0, key="p_m1")
-                    if live_market and l1_m in live_market: st.caption(f"*(底牌：主 {live_market[l1_m].home_odds} | 平 {live_market[l1_m].draw_odds} | 客 {live_market[l1_m].away_odds})*")
-                    l1_s = st.selectbox("选项 1", ["home", "away", "draw"], key="p_s1")
-                    l1_o = st.number_input("赔率 1", 1.01, 20.0, 2.05, 0.05, key="p_o1")
-                    
-                    st.markdown("---")
-                    
-                    l2_m = st.selectbox("赛事 2", match_list, index=1, key="p_m2")
-                    if live_market and l2_m in live_market: st.caption(f"*(底牌：主 {live_market[l2_m].home_odds} | 平 {live_market[l2_m].draw_odds} | 客 {live_market[l2_m].away_odds})*")
-                    l2_s = st.selectbox("选项 2", ["home", "away", "draw"], key="p_s2")
-                    l2_o = st.number_input("赔率 2", 1.01, 20.0, 1.80, 0.05, key="p_o2")
+                    n_legs = st.number_input("串关腿数 (N 串 1)", 2, max_legs, 2, 1)
+                    legs = []
+                    for k in range(n_legs):
+                        if k: st.markdown("---")
+                        leg_m = st.selectbox(f"赛事 {k + 1}", match_list, index=k, key=f"p_m{k}")
+                        if live_market and leg_m in live_market: st.caption(f"*(底牌：主 {live_market[leg_m].home_odds} | 平 {live_market[leg_m].draw_odds} | 客 {live_market[leg_m].away_odds})*")
+                        leg_s = st.selectbox(f"选项 {k + 1}", ["home", "away", "draw"], key=f"p_s{k}")
+                        leg_o = st.number_input(f"赔率 {k + 1}", 1.01, 20.0, 1.90, 0.05, key=f"p_o{k}")
+                        legs.append(TicketLeg(match_id=leg_m, selection=leg_s, customer_odds=leg_o))
                     submit = st.button("🚀 核动力实盘断腿测算", use_container_width=True)
                     if submit:
-                        ticket = CustomerTicket(ticket_id=f"PLY-{uuid.uuid4().hex[:5].upper()}", ticket_type="parlay_2", stake=stake, legs=[
-                            TicketLeg(match_id=l1_m, selection=l1_s, customer_odds=l1_o), TicketLeg(match_id=l2_m, selection=l2_s, customer_odds=l2_o)
-                        ])
+                        try:
+                            ticket = CustomerTicket(ticket_id=f"PLY-{uuid.uuid4().hex[:5].upper()}", ticket_type=f"parlay_{n_legs}", stake=stake, legs=legs)
+                        except ValidationError as e:
+                            st.error(f"串关不合法：{e.errors()[0]['msg']}")
+                            submit = False
 
             if submit:
-                try: loop = asyncio.get_running_loop()
-                except RuntimeError: loop = asyncio.new_event_loop(); asyncio.set_event_loop(loop)
-                st.session_state.last_decision = loop.run_until_complete(orchestrator.evaluate_incoming_tickets([ticket]))[0]
-                st.session_state.last_ticket = ticket
+                try:
+                    st.session_state.last_decision = client.evaluate(ticket)
+                    st.session_state.last_ticket = ticket
+                except IntakeOverloadedError as e:
+                    st.error(f"🚦 进单服务繁忙，请稍后重试：{e}")
                 
         with c2:
             st.subheader("📊 实战裁决结果")
@@ -123,35 +154,125 @@ def main():
 
     with main_tabs[1]:
         st.subheader("🌐 全局净头寸大屏 (真实比赛敞口)")
-        exposures = orchestrator.ledger.get_all_exposures()
-        if exposures:
-            df_data = []
-            for m_id, state in exposures.items():
-                wcs = min(state.values())
-                df_data.append({
-                    "赛事": m_id.split("vs")[0].strip() + " vs...",
-                    "主队赢(你盈亏)": state["home"], "平局(你盈亏)": state["draw"], "客队赢(你盈亏)": state["away"], "🚨 极限亏损": wcs
-                })
-            df = pd.DataFrame(df_data)
+        exposure, total_exposure = client.exposure()
+        if len(exposure):
+            # 向量化出表：最坏盈亏整列一次算完
+            df = pd.DataFrame({
+                "赛事": exposure.index.str.split("vs").str[0].str.strip() + " vs...",
+                "主队赢(你盈亏)": exposure["home"].to_numpy(), "平局(你盈亏)": exposure["draw"].to_numpy(), "客队赢(你盈亏)": exposure["away"].to_numpy(),
+                "🚨 极限亏损": exposure.to_numpy().min(axis=1),
+            })
+            st.metric("📉 全书最坏总敞口", f"¥{total_exposure:,.0f}")
             def color_pnl(val):
                 if isinstance(val, (int, float)):
                     if val < 0: return 'color: #ff4b4b; font-weight: bold'
                     if val > 0: return 'color: #00fa9a; font-weight: bold'
                 return ''
             st.dataframe(df.style.map(color_pnl, subset=["主队赢(你盈亏)", "平局(你盈亏)", "客队赢(你盈亏)", "🚨 极限亏损"]).format(precision=0), use_container_width=True)
+
+            # 🎲 全书蒙特卡洛：按外盘去水概率抽全部场次的赛果，看整本账而不是单场最坏
+            st.markdown("#### 🎲 全书蒙特卡洛风险")
+            mc1, mc2, mc3 = st.columns(3)
+            n_scenarios = mc1.number_input("场景数", 10_000, 5_000_000, settings.MC_SCENARIOS, 100_000)
+            bankroll = mc2.number_input("资金红线 (¥)", 10_000.0, 10_000_000.0, settings.MC_BANKROLL_LIMIT, 10_000.0)
+            seed = mc3.number_input("随机种子", 0, 2**31 - 1, 42, 1)
+            if st.button("🎲 运行全书模拟"):
+                with st.spinner("工作线程抽样中 (不阻塞进单)..."):
+                    st.session_state.portfolio_risk = client.simulate_portfolio_risk(int(n_scenarios), float(bankroll), int(seed))
+            risk = st.session_state.get("portfolio_risk")
+            if risk is not None:
+                r1, r2, r3, r4 = st.columns(4)
+                r1.metric("期望盈亏", f"¥{risk.expected_pnl:,.0f}", f"σ ¥{risk.pnl_std:,.0f}", delta_color="off")
+                r2.metric("VaR 99%", f"¥{risk.var[0.99]:,.0f}", f"95%: ¥{risk.var[0.95]:,.0f}", delta_color="off")
+                r3.metric("CVaR 99%", f"¥{risk.cvar[0.99]:,.0f}", f"95%: ¥{risk.cvar[0.95]:,.0f}", delta_color="off")
+                r4.metric("击穿资金红线概率", f"{risk.breach_probability * 100:.3f}%", f"红线 ¥{risk.bankroll_limit:,.0f}", delta_color="off")
+                st.caption(f"{risk.n_scenarios:,} 个场景 × {risk.n_matches} 场 ({risk.n_parlays} 张串关)，耗时 {risk.elapsed:.2f} 秒，种子 {risk.seed}")
+                if risk.unpriced_matches: st.warning(f"以下场次没有外盘报价，按最坏赛果计入：{', '.join(risk.unpriced_matches)}")
+
+            # 🛡️ 全书对冲建议：看累计敞口，一次解出把每场都压回红线的最低成本对冲
+            st.markdown("#### 🛡️ 全书对冲建议")
+            hedge_limit = st.number_input("单场红线 (¥，0 = 按风控设置)", 0.0, 10_000_000.0, 0.0, 5_000.0)
+            if st.button("🛡️ 计算对冲方案"):
+                st.session_state.hedge_plan = client.plan_hedges(float(hedge_limit) or None)
+            plan = st.session_state.get("hedge_plan")
+            if plan is not None:
+                p1, p2, p3 = st.columns(3)
+                p1.metric("击穿红线场次", f"{plan.breached_matches} / {plan.n_matches}", f"红线 ¥{plan.limit:,.0f}", delta_color="off")
+                p2.metric("对冲总注码", f"¥{plan.total_stake:,.0f}", f"{len(plan.instructions)} 条指令", delta_color="off")
+                p3.metric("期望对冲成本", f"¥{plan.expected_cost:,.0f}", f"求解 {plan.elapsed * 1000:.1f} ms", delta_color="off")
+                if plan.instructions:
+                    hedges = pd.DataFrame([i.model_dump() for i in plan.instructions]).rename(columns={
+                        "match_id": "比赛", "selection": "买入赛果", "hedge_stake": "对冲注码", "hedge_odds": "外盘赔率",
+                        "expected_cost": "期望成本", "worst_before": "对冲前最坏", "worst_after": "对冲后最坏"})
+                    st.dataframe(hedges.style.format(precision=2, subset=["外盘赔率"]).format(precision=0, subset=["对冲注码", "期望成本", "对冲前最坏", "对冲后最坏"]), use_container_width=True)
+                else: st.success("全部场次都在红线以内，无需对冲。")
+                if plan.unhedgeable: st.warning(f"以下场次只靠外盘对冲压不回红线 (各赛果都亏或缺报价)：{', '.join(plan.unhedgeable)}")
         else:
             st.info("数据水池为空。")
 
+        # 🕰️ 历史回溯：按账本事件流水重建任意时刻的全书敞口 (对账 / 争议处理)
+        with st.expander("🕰️ 历史敞口回溯"):
+            h1, h2 = st.columns(2)
+            day = h1.date_input("日期", datetime.date.today())
+            moment = h2.time_input("时间", datetime.time(23, 59, 59), step=60)
+            if st.button("🕰️ 重建该时刻账本"):
+                as_of = datetime.datetime.combine(day, moment).timestamp()
+                past, past_total = client.exposure(as_of=as_of)
+                st.metric("📉 当时全书最坏总敞口", f"¥{past_total:,.0f}")
+                if len(past): st.dataframe(past.assign(worst=past.to_numpy().min(axis=1)).style.format(precision=0), use_container_width=True)
+                else: st.info("该时刻账本为空。")
+
         if st.button("💣 强制核销全系统数据 (次日清盘)", type="secondary"):
-            orchestrator.wipe_all_data()
+            client.wipe_all_data()
             if "last_decision" in st.session_state: del st.session_state.last_decision
+            st.session_state.pop("portfolio_risk", None)
+            st.session_state.pop("hedge_plan", None)
+            st.session_state.pop("order_filters", None)  # 订单簿翻页游标随之作废
             st.rerun()
 
     with main_tabs[2]:
         st.subheader("🧾 历史订单簿")
-        history = orchestrator.db.get_order_book()
+        # 📈 SQL 汇总 (读增量维护的汇总表，百万级订单也是毫秒级)
+        s1, s2 = st.columns(2)
+        with s1:
+            st.markdown("#### 按场次")
+            by_match = client.order_summary("match")
+            if by_match: st.dataframe(pd.DataFrame(by_match).style.format(precision=0, subset=["turnover", "retained_liability", "hedge_volume"]), use_container_width=True)
+        with s2:
+            st.markdown("#### 按裁决动作")
+            by_action = client.order_summary("action")
+            if by_action: st.dataframe(pd.DataFrame(by_action).style.format(precision=0, subset=["turnover", "retained_liability", "hedge_volume"]), use_container_width=True)
+
+        # 📜 keyset 分页：游标栈记住每一页的起点，翻到多深都只走索引
+        f1, f2, f3 = st.columns([2, 2, 1])
+        match_filter = f1.selectbox("场次", ["(全部)"] + [r["danger_match_id"] for r in by_match])
+        action_filter = f2.selectbox("动作", ["(全部)"] + [r["action"] for r in by_action])
+        page_size = f3.selectbox("每页", [50, 100, 500], index=1)
+        filters = (match_filter, action_filter, page_size)
+        if st.session_state.get("order_filters") != filters:
+            st.session_state.order_filters = filters
+            st.session_state.order_cursors = [None]
+        cursors = st.session_state.order_cursors
+        history, next_before = client.orders(page_size, cursors[-1], None if match_filter == "(全部)" else match_filter, None if action_filter == "(全部)" else action_filter)
         if history:
             st.dataframe(pd.DataFrame(history), use_container_width=True)
+        p1, p2, p3 = st.columns([1, 1, 4])
+        if p1.button("⬅️ 上一页", disabled=len(cursors) == 1):
+            cursors.pop()
+            st.rerun()
+        if p2.button("下一页 ➡️", disabled=next_before is None):
+            cursors.append(next_before)
+            st.rerun()
+        p3.caption(f"第 {len(cursors)} 页")
+
+        # 🕰️ 接单时的锚点价：按订单时间戳回查当时 Pinnacle 对危险腿所在场次的报价
+        if history:
+            picked = st.selectbox("查看本页某张单接单时的锚点价", [r["ticket_id"] for r in history])
+            row = next(r for r in history if r["ticket_id"] == picked)
+            accepted_at = pd.Timestamp(row["timestamp"], tz="UTC").timestamp()
+            then = client.price_as_of(row["danger_match_id"], accepted_at)
+            if then is None: st.caption("接单时刻没有这场的锚点报价记录。")
+            else: st.caption(f"{row['danger_match_id']} @ {row['timestamp']} UTC：主 {then.home_odds} | 平 {then.draw_odds} | 客 {then.away_odds}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
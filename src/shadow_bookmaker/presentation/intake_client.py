@@ -0,0 +1,92 @@
+from typing import Dict, List, Optional, Tuple
+import httpx
+import numpy as np
+import pandas as pd
+from src.shadow_bookmaker.domain.models import CustomerTicket, OddsDTO, PortfolioRisk, HedgePlan, RiskDecision
+
+class IntakeOverloadedError(RuntimeError):
+    """进单服务返回 503 (队列已满)"""
+
+class IntakeClient:
+    """进单服务的同步 HTTP 客户端 (Streamlit 控制台用)：所有风控与账本操作都经由服务进程完成"""
+    def __init__(self, base_url: str, timeout: float = 30.0):
+        self.base_url = base_url
+        self._http = httpx.Client(base_url=base_url, timeout=timeout)
+
+    def _call(self, method: str, path: str, **kwargs) -> dict:
+        resp = self._http.request(method, path, **kwargs)
+        if resp.status_code == 503: raise IntakeOverloadedError(resp.json().get("error", "进单服务繁忙"))
+        resp.raise_for_status()
+        return resp.json()
+
+    def stats(self) -> dict:
+        return self._call("GET", "/stats")
+
+    def metrics(self) -> pd.DataFrame:
+        """分环节耗时 (秒)：每个环节一行，含次数、均值、p50/p90/p99、最大值，按累计耗时倒序"""
+        stages = self._call("GET", "/metrics", params={"format": "json"})["stages"]
+        return pd.DataFrame(stages, columns=["stage", "count", "total", "mean", "p50", "p90", "p99", "max"]).set_index("stage")
+
+    def market(self, force: bool = False) -> Tuple[Dict[str, OddsDTO], float]:
+        """(match_id -> 锚点报价, 快照年龄秒数)"""
+        data = self._call("GET", "/market", params={"force": "1"} if force else None)
+        age = data["snapshot_age"]
+        return {m_id: OddsDTO.model_construct(**o) for m_id, o in data["odds"].items()}, float("inf") if age is None else age
+
+    def odds_history(self, match_id: str, bookmaker: str = None, start: float = None, end: float = None) -> pd.DataFrame:
+        """盘口走势 (索引为 unix 秒，列为主/客/平)；bookmaker 缺省为风控锚点庄家"""
+        params = {k: v for k, v in (("match_id", match_id), ("bookmaker", bookmaker), ("start", start), ("end", end)) if v is not None}
+        data = self._call("GET", "/market/history", params=params)
+        return pd.DataFrame({c: np.asarray(data[c], dtype=np.float64) for c in ("home", "away", "draw")}, index=pd.Index(data["ts"], name="ts", dtype=np.float64))
+
+    def price_as_of(self, match_id: str, ts: float, bookmaker: str = None) -> Optional[OddsDTO]:
+        """ts 时刻 (unix 秒) 生效的报价 (如接单那一刻的锚点价)"""
+        params = {"match_id": match_id, "ts": ts, **({"bookmaker": bookmaker} if bookmaker else {})}
+        odds = self._call("GET", "/market/as_of", params=params)["odds"]
+        return OddsDTO.model_construct(**odds) if odds else None
+
+    def evaluate(self, ticket: CustomerTicket, commit: bool = False) -> RiskDecision:
+        return RiskDecision.model_validate(self._call("POST", "/tickets", params={"commit": "1"} if commit else None, json=ticket.model_dump()))
+
+    def evaluate_many(self, tickets: List[CustomerTicket], commit: bool = False) -> List[RiskDecision]:
+        data = self._call("POST", "/tickets/batch", json={"tickets": [t.model_dump() for t in tickets], "commit": commit})
+        return [RiskDecision.model_validate(d) for d in data["decisions"]]
+
+    def commit(self, decision: RiskDecision, ticket: CustomerTicket, durable: bool = True) -> Tuple[bool, RiskDecision]:
+        """(是否入账, 服务端按当前账本重算的裁决)；预览之后盘面变了会返回 False 和新裁决"""
+        resp = self._http.post("/decisions/commit", json={"decision": decision.model_dump(), "ticket": ticket.model_dump(), "durable": durable})
+        if resp.status_code != 409: resp.raise_for_status()  # 409 = 条款已变，照常带回新裁决
+        data = resp.json()
+        return data["committed"], RiskDecision.model_validate(data["decision"])
+
+    def exposure(self, as_of: float = None) -> Tuple[pd.DataFrame, float]:
+        """(场次 × 主/客/平 盈亏表, 全书最坏总敞口)；as_of 给 unix 秒则回溯该时刻的账本"""
+        data = self._call("GET", "/exposure", params=None if as_of is None else {"as_of": as_of})
+        pnl = np.asarray(data["pnl"], dtype=np.float64).reshape(-1, 3)
+        return pd.DataFrame(pnl, index=pd.Index(data["match_ids"], name="match_id"), columns=["home", "away", "draw"]), data["total_exposure"]
+
+    def orders(self, limit: int = 100, before: Optional[int] = None, match_id: Optional[str] = None, action: Optional[str] = None) -> Tuple[List[dict], Optional[int]]:
+        """(一页订单 (最新在前), 下一页的 before 游标；None 表示没有更多)"""
+        params = {k: v for k, v in (("limit", limit), ("before", before), ("match_id", match_id), ("action", action)) if v is not None}
+        data = self._call("GET", "/orders", params=params)
+        return data["orders"], data["next_before"]
+
+    def order_summary(self, by: str = "match") -> List[dict]:
+        """按场次 / 按动作的单数、流水、截留负债、对冲量汇总"""
+        return self._call("GET", "/orders/summary", params={"by": by})["summary"]
+
+    def simulate_portfolio_risk(self, n_scenarios: int = None, bankroll_limit: float = None, seed: Optional[int] = None) -> PortfolioRisk:
+        return PortfolioRisk.model_validate(self._call("POST", "/risk/portfolio", json={"n_scenarios": n_scenarios, "bankroll_limit": bankroll_limit, "seed": seed}))
+
+    def plan_hedges(self, limit: float = None) -> HedgePlan:
+        """全书对冲方案 (缺省按服务端风控的单场红线)"""
+        return HedgePlan.model_validate(self._call("GET", "/risk/hedges", params={"limit": limit} if limit is not None else None))
+
+    def wipe_all_data(self):
+        self._call("POST", "/admin/wipe")
+
+    def set_odds_api_key(self, api_key: str) -> bool:
+        return self._call("POST", "/admin/odds-api-key", json={"api_key": api_key})["live_feed"]
+
+    def close(self):
+        self._http.close()
@@ -0,0 +1,51 @@
+"""进单服务的参数校验：缺参数、参数不是数字、请求体不是 JSON 对象都回 400，不让 KeyError / ValueError 变成 500"""
+import pytest
+from starlette.testclient import TestClient
+from src.shadow_bookmaker.application.orchestrator import BrokerOrchestrator
+from src.shadow_bookmaker.domain.ledger import GlobalLedger
+from src.shadow_bookmaker.domain.risk_engine import RiskEngine
+from src.shadow_bookmaker.presentation.api import create_app
+from tests.test_parlays import MARKET, single
+from tests.test_risk_engine import sequential
+
+@pytest.fixture
+def client(tmp_path):
+    # 不进 lifespan：参数校验在碰编排器之前就返回，用不着启动抓盘与进单服务
+    orchestrator = BrokerOrchestrator(db_path=str(tmp_path / "vault.db"))
+    client = TestClient(create_app(orchestrator), raise_server_exceptions=False)
+    client.orchestrator = orchestrator
+    yield client
+    orchestrator.db.close()
+
+@pytest.mark.parametrize("url", [
+    "/market/history", "/market/history?match_id=", "/market/history?match_id=M1&start=yesterday",
+    "/market/as_of", "/market/as_of?match_id=M1", "/market/as_of?ts=1700000000", "/market/as_of?match_id=M1&ts=now",
+    "/orders/summary?by=team", "/orders?limit=ten", "/orders?before=abc", "/exposure?as_of=yesterday", "/risk/hedges?limit=abc",
+])
+def test_bad_query_params_are_400(client, url):
+    response = client.get(url)
+    assert response.status_code == 400 and response.json()["error"]
+
+def test_as_of_without_history_is_null(client):
+    response = client.get("/market/as_of?match_id=M1&ts=1700000000")
+    assert response.status_code == 200 and response.json() == {"odds": None}
+
+@pytest.mark.parametrize("limit", ["0", "-5"])
+def test_orders_limit_is_clamped(client, limit):
+    tickets = [single(f"S{i}", "M1", "home", stake=1000) for i in range(3)]
+    client.orchestrator.commit_decisions(list(zip(sequential(RiskEngine(GlobalLedger.from_rows({})), tickets, MARKET), tickets)))
+    page = client.get(f"/orders?limit={limit}").json()
+    assert [o["ticket_id"] for o in page["orders"]] == ["S2"] and page["next_before"] == page["orders"][0]["seq"]
+
+@pytest.mark.parametrize("path, body", [
+    ("/tickets", "{not json"), ("/tickets/batch", "{not json"), ("/tickets/batch", "[]"), ("/tickets/batch", "{}"),
+    ("/tickets/batch", '{"tickets": 3}'), ("/decisions/commit", "{not json"), ("/decisions/commit", '{"ticket": {}}'),
+    ("/risk/portfolio", "{not json"), ("/admin/odds-api-key", "{not json"),
+])
+def test_malformed_bodies_are_400(client, path, body):
+    response = client.post(path, content=body, headers={"Content-Type": "application/json"})
+    assert response.status_code == 400 and response.json()["error"]
+
+def test_invalid_ticket_in_batch_is_422(client):
+    response = client.post("/tickets/batch", json={"tickets": [{"ticket_id": "T1"}]})
+    assert response.status_code == 422 and response.json()["detail"]
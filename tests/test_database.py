@@ -0,0 +1,61 @@
+"""SQLite 落盘：账本只经事件流水写入，清库是一个原子单元，订单与串关簿归档不删"""
+import sqlite3
+import time
+import pytest
+from src.shadow_bookmaker.domain.ledger import GlobalLedger
+from src.shadow_bookmaker.infrastructure.database import DatabaseManager, _Write
+
+TICKETS = [("T1", "single", 1000.0, "ACCEPT_B_BOOK", 1500.0, 0.0, "M1", "home"),
+           ("T2", "single", 2000.0, "ACCEPT_B_BOOK", 2400.0, 0.0, "M2", "draw")]
+BETS = [("M1", "home", 1000.0, 1500.0, "T1"), ("M2", "draw", 2000.0, 2400.0, "T2")]
+
+@pytest.fixture
+def db(tmp_path):
+    db = DatabaseManager(str(tmp_path / "vault.db"))
+    GlobalLedger(db).commit_bets(BETS, TICKETS)
+    yield db
+    db.close()
+
+def test_clear_all_resets_current_state_and_keeps_history(db):
+    before = time.time()
+    time.sleep(0.01)
+    db.clear_all()
+    assert db.load_ledger() == {} and db.get_order_book() == [] and db.order_summary() == [] and db.load_parlays() == []
+    # 订单归档在这条 reset 名下
+    reset_seq = db._read("SELECT MAX(seq) FROM ledger_events WHERE kind = 'reset'")[0][0]
+    archived = db.archived_orders(reset_seq)
+    assert [(o["reset_seq"], o["ticket_id"], o["stake"]) for o in archived] == [(reset_seq, "T1", 1000.0), (reset_seq, "T2", 2000.0)]
+    # 事件流水只追加了一条 reset：清库前的水位仍可回溯
+    assert db.ledger_as_of(before) == {"M1": {"home": -1500.0, "away": 1000.0, "draw": 1000.0},
+                                       "M2": {"home": 2000.0, "away": 2000.0, "draw": -2400.0}}
+
+def test_clear_all_is_all_or_nothing(db):
+    # 归档串关簿那一步必然失败：前面的 reset 与订单归档都要一起回滚
+    conn = sqlite3.connect(db.db_path)
+    conn.execute("DROP TABLE parlay_book")
+    conn.close()
+    with pytest.raises(sqlite3.Error): db.clear_all()
+    assert set(db.load_ledger()) == {"M1", "M2"}
+    assert len(db.get_order_book()) == 2 and len(db.order_summary()) == 2 and db.archived_orders() == []
+    db.flush()  # 出错的是有人等待的同步写入，错误已经抛给了 clear_all，不会留给下一次 flush
+
+def test_background_write_error_goes_to_the_next_flush_not_to_readers(db):
+    # 无人等待的后台写入失败：读方照常读、不清错误，下一次 flush() 才抛出，抛过一次就清掉
+    db._queue.put(_Write([("INSERT INTO no_such_table VALUES (1)", (), False)]))
+    assert len(db.get_order_book()) == 2 and set(db.load_ledger()) == {"M1", "M2"}
+    with pytest.raises(sqlite3.OperationalError, match="no_such_table"): db.flush()
+    db.flush()
+
+def test_parlays_as_of_reads_the_archive_after_a_reset(db):
+    parlay = ("P1", [("M1", "home"), ("M3", "away")], 1000.0, 3000.0)
+    GlobalLedger(db).commit_bets([("M1", "home", 1000.0, 3000.0, "P1"), ("M3", "away", 1000.0, 3000.0, "P1")],
+                                 [("P1", "parlay", 1000.0, "ACCEPT_B_BOOK", 3000.0, 0.0, "M1", "home")], parlays=[parlay])
+    booked = time.time()
+    time.sleep(0.01)
+    db.clear_all()
+    # 同一个单号在清库后的新一天又用了一次：回溯清库前取归档里的那张，回溯现在取新的那张
+    again = ("P1", [("M2", "draw"), ("M3", "home")], 2000.0, 5000.0)
+    GlobalLedger(db).commit_bets([("M2", "draw", 2000.0, 5000.0, "P1"), ("M3", "home", 2000.0, 5000.0, "P1")],
+                                 [("P1", "parlay", 2000.0, "ACCEPT_B_BOOK", 5000.0, 0.0, "M2", "draw")], parlays=[again])
+    assert db.parlays_as_of(booked) == [parlay]
+    assert db.parlays_as_of(time.time()) == [again]
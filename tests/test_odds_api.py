@@ -0,0 +1,129 @@
+"""TheOddsAPIBookmaker 对着进程内的 The Odds API 桩服务 (benchmarks/odds_api_stub.py) 跑：分级轮询、条件请求与行情库的报价时效"""
+import asyncio
+import httpx
+import pytest
+from benchmarks.odds_api_stub import StubOddsAPI
+from src.shadow_bookmaker.application.market_store import MarketStore
+from src.shadow_bookmaker.config import settings
+from src.shadow_bookmaker.domain.devig import PriceTable
+from src.shadow_bookmaker.domain.ledger import GlobalLedger
+from src.shadow_bookmaker.domain.models import CustomerTicket, TicketLeg
+from src.shadow_bookmaker.domain.risk_engine import RiskEngine
+from src.shadow_bookmaker.infrastructure.bookmakers.the_odds_api import TheOddsAPIBookmaker
+from src.shadow_bookmaker.infrastructure.network import AsyncNetworkEngine
+
+class Clock:
+    def __init__(self, t: float): self.t = t
+    def __call__(self) -> float: return self.t
+
+class Identity:
+    """队名原样当标准名：桩服务的队名本来就是干净的"""
+    def standardize(self, name: str) -> str: return name
+
+@pytest.fixture
+def odds_api(monkeypatch):
+    clock = Clock(1_700_000_000.0)
+    stub = StubOddsAPI(n_leagues=2, matches_per_league=4, quota=10**6, clock=clock)
+    # 联赛 0 二十分钟后开赛 (30 秒一刷)，联赛 1 两天半后才开赛 (半小时一刷)
+    near, far = stub.fixtures.values()
+    for e in near: e["commence_time"] = clock.t + 1200
+    for e in far: e["commence_time"] = clock.t + 2.5 * 86400
+    monkeypatch.setattr(settings, "ODDS_API_KEY", stub.api_key)
+    monkeypatch.setattr(settings, "ODDS_API_SPORTS", "")
+    monkeypatch.setattr(settings, "ODDS_API_DAILY_BUDGET", 0)
+    book = TheOddsAPIBookmaker(Identity(), clock=clock)
+    book.network = AsyncNetworkEngine(transport=httpx.ASGITransport(stub.app()))
+    store = MarketStore(book.name, default_ttl=600.0)
+
+    def poll():
+        async def run():
+            try:
+                quotes = await book.fetch_odds()
+                store.set_ttls(book.quote_ttls())  # 与编排器一致：先按联赛轮询间隔更新单场 TTL 再合并
+                store.apply(quotes, now=clock.t)
+            finally: await book.aclose()
+        asyncio.run(run())
+
+    ids = lambda league: {f"{e['home_team']} vs {e['away_team']}" for e in league}
+    return clock, stub, book, store, poll, ids(near), ids(far)
+
+def test_cached_league_keeps_its_fetch_time_and_expires(odds_api, monkeypatch):
+    clock, stub, book, store, poll, near, far = odds_api
+    t0 = clock.t
+    poll()
+    assert stub.calls["odds"] == 2 and set(store.sharp) == near | far
+    assert store.last_quoted[book.name] == t0
+
+    # 10 分钟后只有临场联赛到点；远期联赛沿用缓存，报价还带着 t0，但 TTL 按它半小时的轮询间隔放长，撑到下次刷新
+    clock.t += 700
+    poll()
+    assert stub.calls["odds"] == 3
+    assert set(store.sharp) == near | far
+    assert {store.updated_at[(m_id, book.name)] for m_id in near} == {clock.t}
+    assert {store.updated_at[(m_id, book.name)] for m_id in far} == {t0}
+
+    # 不到刷新点的一轮：全部沿用缓存，行情库既不续命，也不推进快照的抓取时间
+    t1 = clock.t
+    clock.t += 10
+    poll()
+    assert stub.calls["odds"] == 3
+    assert store.last_quoted[book.name] == t1 and {store.updated_at[(m_id, book.name)] for m_id in near} == {t1}
+
+    # 远期联赛到点却一直刷不到：超过 2 个轮询间隔，沿用缓存的报价就下架
+    far_league = list(stub.fixtures)[1]
+    poll_league = book._poll
+    async def failing(key):
+        if key == far_league: raise RuntimeError("timeout")
+        await poll_league(key)
+    monkeypatch.setattr(book, "_poll", failing)
+    clock.t = t0 + 1900
+    poll()
+    assert far <= set(store.sharp)
+    clock.t = t0 + 3700
+    poll()
+    assert set(store.sharp) == near
+
+    # 风控拿不到远期联赛的锚点报价，拒绝定价
+    m_id = sorted(far)[0]
+    ticket = CustomerTicket(ticket_id="T1", ticket_type="single", stake=1000, legs=[TicketLeg(match_id=m_id, selection="home", customer_odds=1.5)])
+    decision = RiskEngine(GlobalLedger.from_rows({})).evaluate(ticket, PriceTable(store.sharp))
+    assert decision.action == "REJECT" and "缺失外盘数据" in decision.reason
+
+def test_unchanged_league_reuses_the_parsed_batch(odds_api):
+    clock, stub, book, store, poll, near, far = odds_api
+    stub.market.volatility = stub.market.jump_rate = 0.0  # 盘口钉住不动，桩服务的 ETag 不变
+    poll()
+    league = next(iter(stub.fixtures))
+    etag, batch = book._parsed[league]
+
+    clock.t += 700
+    poll()
+    # 304：沿用上次解析好的批次，只刷新抓取时间，行情库照样给临场联赛续命
+    assert stub.calls["not_modified"] == 1 and book._parsed[league] == (etag, batch)
+    assert batch.fetched_at == clock.t and set(store.sharp) == near | far
+    assert {store.updated_at[(m_id, book.name)] for m_id in near} == {clock.t}
+
+def fetch(engine: AsyncNetworkEngine, url: str, **kwargs):
+    async def run():
+        try: return await engine.fetch(url, **kwargs)
+        finally: await engine.aclose()
+    return asyncio.run(run())
+
+def test_conditional_requests_against_the_stub():
+    stub = StubOddsAPI(n_leagues=1, matches_per_league=3, volatility=0.0)
+    stub.market.jump_rate = 0.0
+    url = f"http://stub/v4/sports/{next(iter(stub.fixtures))}/odds"
+    engine = AsyncNetworkEngine(transport=httpx.ASGITransport(stub.app()))
+    data, headers = fetch(engine, url, params={"apiKey": stub.api_key, "regions": "eu"})
+    assert len(data) == 3 and headers["ETag"]
+
+    # 换了 key 也命中同一条缓存 (凭据不进指纹)：带上 If-None-Match，304 直接复用上次的结果
+    stub.api_key = "rotated"
+    again, reply = fetch(engine, url, params={"apiKey": "rotated", "regions": "eu"})
+    assert again is data and reply["ETag"] == headers["ETag"] and stub.calls["not_modified"] == 1
+    assert [dict(params) for _, params in engine._validators] == [{"regions": "eu"}]
+
+    # 调用方自带校验头、引擎手里却没有缓存：304 拿不出结果，去掉校验头无条件重抓
+    fresh = AsyncNetworkEngine(transport=httpx.ASGITransport(stub.app()))
+    refetched, _ = fetch(fresh, url, headers={"If-None-Match": headers["ETag"]}, params={"apiKey": "rotated", "regions": "eu"})
+    assert refetched == data and stub.calls["not_modified"] == 2 and stub.calls["odds"] == 4
@@ -0,0 +1,104 @@
+"""串关：同腿 (相关) 串关在逐腿风控里叠加敞口，在全书蒙特卡洛与敞口联合视图里只结算一次"""
+import asyncio
+import itertools
+import time
+import numpy as np
+from src.shadow_bookmaker.application.orchestrator import BrokerOrchestrator
+from src.shadow_bookmaker.application.risk_desk import ledger_entries
+from src.shadow_bookmaker.domain.hedge_optimizer import HedgeOptimizer
+from src.shadow_bookmaker.domain.ledger import GlobalLedger
+from src.shadow_bookmaker.domain.models import CustomerTicket, OddsDTO, TicketLeg
+from src.shadow_bookmaker.domain.portfolio_sim import PortfolioSimulator
+from src.shadow_bookmaker.domain.risk_engine import RiskEngine
+from tests.test_risk_engine import sequential
+
+def single(ticket_id: str, m_id: str, sel: str, stake: float = 4000) -> CustomerTicket:
+    return CustomerTicket(ticket_id=ticket_id, ticket_type="single", stake=stake, legs=[TicketLeg(match_id=m_id, selection=sel, customer_odds=2.0)])
+
+MARKET = {m_id: OddsDTO(bookmaker="Pinnacle", match_id=m_id, home_team=f"H-{m_id}", away_team=f"A-{m_id}", home_odds=2.1, away_odds=2.1, draw_odds=3.6)
+          for m_id in ("M1", "M2", "M3")}
+
+def parlay(ticket_id: str, *legs) -> CustomerTicket:
+    # 每条腿 2.0，两串一 5000 本金 -> 负债 15000
+    return CustomerTicket(ticket_id=ticket_id, ticket_type=f"parlay_{len(legs)}", stake=5000,
+                          legs=[TicketLeg(match_id=m_id, selection=sel, customer_odds=2.0) for m_id, sel in legs])
+
+def test_correlated_parlays_stack_on_every_shared_leg():
+    tickets = [parlay(f"P{i}", ("M1", "home"), ("M2", "away")) for i in range(3)] + [parlay("P3", ("M1", "home"), ("M3", "draw"))]
+    engine = RiskEngine(GlobalLedger.from_rows({}))
+    got = sequential(engine, tickets, MARKET)
+    # 前两张同腿串关把 M1 主胜、M2 客胜各压到 -30000 (正好顶到红线)；第三张两条腿同时击穿，单腿对冲救不了
+    assert [d.action for d in got[:3]] == ["ACCEPT_B_BOOK", "ACCEPT_B_BOOK", "REJECT"]
+    assert "2 条腿同时击穿" in got[2].reason
+    # 只和它们共用 M1 主胜一条腿的串关，也看得到前面两张的敞口：只有 M1 这条腿击穿，拿它去外盘对冲
+    assert got[3].action in ("ACCEPT_PARTIAL_HEDGE", "ACCEPT_A_BOOK_HEDGE")
+    assert (got[3].danger_match_id, got[3].danger_selection) == ("M1", "home")
+    assert engine.ledger.get_state("M1")["home"] >= -30000.0 and len(engine.ledger.parlays) == 3
+    # 批量通道在同一批里看到同样的叠加
+    assert RiskEngine(GlobalLedger.from_rows({})).evaluate_batch(tickets, MARKET) == got
+
+def test_portfolio_settles_correlated_parlays_once():
+    ledger = GlobalLedger.from_rows({})
+    sequential(RiskEngine(ledger), [parlay(f"P{i}", ("M1", "home"), ("M2", "away")) for i in range(2)], MARKET)
+    # 逐腿边际记账：两张串关在两场各记了一次全额负债
+    assert ledger.get_state("M1")["home"] == ledger.get_state("M2")["away"] == -30000.0
+    # 赛果钉死为 M1 主胜、M2 客胜：两张串关全中，各只赔一次负债 (逐腿账本里记了两次)
+    probs = np.array([[1.0, 0.0, 0.0], [0.0, 1.0, 0.0]])
+    sim = PortfolioSimulator(ledger.matrix.copy(), probs, ledger.match_ids, ledger.parlays.items())
+    assert np.allclose(sim.sample_pnl(1000, seed=1), -30000.0)
+    # 任一条腿没打出：两张串关都输，庄家收两份本金
+    sim = PortfolioSimulator(ledger.matrix.copy(), np.array([[0.0, 0.0, 1.0], [0.0, 1.0, 0.0]]), ledger.match_ids, ledger.parlays.items())
+    assert np.allclose(sim.sample_pnl(1000, seed=1), 10000.0)
+
+def mixed_book() -> GlobalLedger:
+    ledger = GlobalLedger.from_rows({})
+    tickets = [parlay("P0", ("M1", "home"), ("M2", "away")), parlay("P1", ("M1", "home"), ("M2", "away")),
+               single("S0", "M2", "draw"), single("S1", "M3", "home"), parlay("P2", ("M2", "draw"), ("M3", "away"), ("M1", "draw"))]
+    tickets[-1].stake = 1000
+    decisions = sequential(RiskEngine(ledger), tickets, MARKET)
+    assert all(d.action != "REJECT" for d in decisions)
+    return ledger
+
+def test_joint_view_counts_each_parlay_once():
+    ledger = mixed_book()
+    marginal = -np.minimum(ledger.matrix.min(axis=1), 0.0).sum()
+    # 逐腿视图里两张两串一的 15000 负债在 M1、M2 各算了一次；联合视图只留在锚腿 (危险腿，这里是 M1 主胜) 上
+    assert ledger.total_exposure() < marginal
+    assert [m_id for m_id, worst in ledger.top_exposures(3) if worst <= -30000.0] == ["M1"]
+    assert ledger.to_frame().loc["M1", "home"] == ledger.joint_matrix()[0, 0]
+
+    # 逐个联合赛果核对：联合视图的合计从不高于真实结算，三条腿全中时相等 (串关只赔一次)
+    joint = ledger.joint_matrix()
+    for outcome in itertools.product(range(3), repeat=3):
+        probs = np.eye(3)[list(outcome)]
+        true = PortfolioSimulator(ledger.matrix.copy(), probs, ledger.match_ids, ledger.parlays.items()).sample_pnl(1, seed=0)[0]
+        assert joint[np.arange(3), outcome].sum() <= true + 1e-6
+    probs = np.eye(3)[[0, 1, 0]]  # M1 主胜、M2 客胜：P0、P1 全中
+    true = PortfolioSimulator(ledger.matrix.copy(), probs, ledger.match_ids, ledger.parlays.items()).sample_pnl(1, seed=0)[0]
+    assert np.isclose(joint[[0, 1, 2], [0, 1, 0]].sum(), true)
+
+def test_danger_leg_is_booked_as_the_anchor():
+    d = RiskEngine(GlobalLedger.from_rows({"M2": (0.0, -20000.0, 0.0)})).evaluate(parlay("P", ("M1", "home"), ("M2", "away")), MARKET)
+    _, _, parlays = ledger_entries([(d, parlay("P", ("M1", "home"), ("M2", "away")))])
+    assert d.danger_match_id == "M2" and parlays[0][1][0] == ("M2", "away")
+
+def test_exposure_as_of_rebuilds_the_joint_view(tmp_path):
+    async def run():
+        orchestrator = BrokerOrchestrator(db_path=str(tmp_path / "vault.db"))
+        try:
+            tickets = [parlay("P0", ("M1", "home"), ("M2", "away")), single("S0", "M3", "home")]
+            decisions = sequential(RiskEngine(GlobalLedger.from_rows({})), tickets, MARKET)
+            orchestrator.commit_decisions(list(zip(decisions, tickets)))
+            live = (await orchestrator.exposure_frame()).sort_index()
+            rebuilt = (await orchestrator.exposure_as_of(time.time() + 1)).sort_index()
+            assert rebuilt.equals(live) and live.to_numpy().min() == -15000.0 and (live.loc["M2"] == 0.0).all()
+        finally:
+            orchestrator.db.close()
+    asyncio.run(run())
+
+def test_hedges_cover_each_parlay_once():
+    ledger = mixed_book()
+    plan = HedgeOptimizer.from_ledger(ledger, MARKET).run(limit=20000.0)
+    # 两张两串一在 M1、M2 上各挂 -30000，但只要 M1 主胜打不出就都不用赔：只对冲锚腿
+    assert {ins.match_id for ins in plan.instructions} == {"M1"}
+    assert plan.breached_matches == 1 and all(ins.worst_after >= -20000.0 - 0.05 for ins in plan.instructions)
@@ -0,0 +1,34 @@
+"""全书蒙特卡洛：同一本账 + 同一个种子，风险报告逐字段可复现"""
+from benchmarks.fixtures import make_ledger, make_market
+from src.shadow_bookmaker.domain.ledger import GlobalLedger
+from src.shadow_bookmaker.domain.portfolio_sim import PortfolioSimulator
+
+def make_book():
+    market = make_market(40)
+    base = make_ledger(market)
+    rows = dict(zip(base.match_ids, base.matrix.tolist()))
+    rows["UNPRICED"] = [-9000.0, 4000.0, 2500.0]  # 没有外盘报价：按最坏赛果计入
+    # 串关簿条目的腿是 (场次, 赛果下标)；二串一与三串一混着来，有几张共用同一场
+    parlays = [(f"P{i}", [(f"M{i}", 0), (f"M{i + 1}", 1), (f"M{i + 7}", 2)][: 2 + i % 2], 1000.0, 4000.0 + 500.0 * i) for i in range(12)]
+    return market, GlobalLedger.from_rows(rows, parlays)
+
+def report(sim: PortfolioSimulator, seed):
+    return sim.run(20000, bankroll_limit=50000.0, seed=seed).model_dump(exclude={"elapsed"})
+
+def test_same_seed_and_ledger_give_identical_risk():
+    market, ledger = make_book()
+    first = report(PortfolioSimulator.from_ledger(ledger, market), seed=42)
+    assert first["n_parlays"] == 12 and first["unpriced_matches"] == ["UNPRICED"]
+    # 另起一本同样的账、重新建模拟器，报告逐字段一致
+    again_market, again_ledger = make_book()
+    assert report(PortfolioSimulator.from_ledger(again_ledger, again_market), seed=42) == first
+    assert report(PortfolioSimulator.from_ledger(ledger, market), seed=7) != first
+
+def test_simulator_is_isolated_from_later_bookings():
+    market, ledger = make_book()
+    sim = PortfolioSimulator.from_ledger(ledger, market)
+    before = report(sim, seed=3)
+    # 拍完快照后账本继续进单 (含串关)：已经建好的模拟器不受影响
+    ledger.apply_states(ledger.stage_bets([("M0", "home", 5000.0, 20000.0, "T1")]), [("P99", [("M0", "home"), ("M1", "home")], 5000.0, 20000.0)])
+    assert report(sim, seed=3) == before
+    assert report(PortfolioSimulator.from_ledger(ledger, market), seed=3) != before
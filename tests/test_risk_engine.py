@@ -0,0 +1,67 @@
+"""RiskEngine：批量通道与"逐张 evaluate + 确权"的标量通道逐字段一致"""
+import random
+import pytest
+from src.shadow_bookmaker.application.risk_desk import ledger_entries
+from src.shadow_bookmaker.domain.ledger import GlobalLedger, OUTCOMES
+from src.shadow_bookmaker.domain.models import CustomerTicket, OddsDTO, TicketLeg
+from src.shadow_bookmaker.domain.risk_engine import RiskEngine
+
+def make_book(seed: int, n_matches: int = 8, n_tickets: int = 600):
+    """小盘口 + 扎堆的大额单子：大量单子击穿红线，对冲、拒单、两项盘、缺盘口都会走到"""
+    rng = random.Random(seed)
+    market = {}
+    for k in range(n_matches):
+        draw = rng.choice([None, round(rng.uniform(2.5, 4.5), 2)])
+        market[f"M{k}"] = OddsDTO(bookmaker="Pinnacle", match_id=f"M{k}", home_team=f"H{k}", away_team=f"A{k}",
+                                  home_odds=round(rng.uniform(1.3, 5), 2), away_odds=round(rng.uniform(1.3, 5), 2), draw_odds=draw)
+    tickets = []
+    for i in range(n_tickets):
+        n_legs = rng.choice([1, 1, 1, 2, 3, 5])
+        legs = [TicketLeg(match_id=m_id, selection=rng.choice(OUTCOMES), customer_odds=round(rng.uniform(1.2, 6 if n_legs == 1 else 2.2), 2))
+                for m_id in rng.sample(list(market) + ["MISSING"], n_legs)]
+        tickets.append(CustomerTicket(ticket_id=f"T{i}", ticket_type="single" if n_legs == 1 else f"parlay_{n_legs}",
+                                      stake=rng.choice([1000, 5000, 20000, 50000] if n_legs == 1 else [1000, 2000, 5000]), legs=legs))
+    return market, tickets
+
+def make_ledger() -> GlobalLedger:
+    return GlobalLedger.from_rows({"M0": (-20000.0, 3000.0, 5000.0)}, parlays=[("OLD", [("M0", 0), ("M1", 1)], 3000.0, 9000.0)])
+
+def book(ledger: GlobalLedger, decision, ticket):
+    """按线上确权的同一份记账翻译 (ledger_entries) 把放行单记进草稿账本"""
+    bets, _, parlays = ledger_entries([(decision, ticket)])
+    ledger.apply_states(ledger.stage_bets(bets), parlays)
+
+def sequential(engine: RiskEngine, tickets, market):
+    decisions = []
+    for t in tickets:
+        decisions.append(engine.evaluate(t, market))
+        book(engine.ledger, decisions[-1], t)
+    return decisions
+
+@pytest.mark.parametrize("seed", range(6))
+def test_batch_matches_sequential_scalar(seed):
+    market, tickets = make_book(seed)
+    expected = sequential(RiskEngine(make_ledger()), tickets, market)
+    engine = RiskEngine(make_ledger())
+    before = engine.ledger.matrix.copy()
+    got = engine.evaluate_batch(tickets, market)
+    assert got == expected
+    # 批量通道只推演，不动真实账本
+    assert (engine.ledger.matrix == before).all() and len(engine.ledger.parlays) == 1
+    # 每条通道都走到了：全吃、部分对冲、全额对冲、拒单
+    assert {d.action for d in got} == {"ACCEPT_B_BOOK", "ACCEPT_PARTIAL_HEDGE", "ACCEPT_A_BOOK_HEDGE", "REJECT"}
+
+def test_batch_singles_on_one_match_move_the_ledger_in_order():
+    market, _ = make_book(0)
+    tickets = [CustomerTicket(ticket_id=f"S{i}", ticket_type="single", stake=20000, legs=[TicketLeg(match_id="M3", selection="home", customer_odds=2.0)])
+               for i in range(4)]
+    got = RiskEngine(GlobalLedger.from_rows({})).evaluate_batch(tickets, market)
+    assert got == sequential(RiskEngine(GlobalLedger.from_rows({})), tickets, market)
+    # 第一张全吃 (-20000)，第二张起同场累计击穿 3 万红线，必须泄洪对冲
+    assert got[0].action == "ACCEPT_B_BOOK" and all(d.action != "ACCEPT_B_BOOK" for d in got[1:])
+
+def test_batch_rejects_everything_on_stale_snapshot():
+    market, tickets = make_book(1, n_tickets=5)
+    engine = RiskEngine(GlobalLedger.from_rows({}), max_snapshot_age=30.0)
+    assert [d.action for d in engine.evaluate_batch(tickets, market, snapshot_age=31.0)] == ["REJECT"] * 5
+    assert engine.evaluate_batch([], market) == []
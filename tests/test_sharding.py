@@ -0,0 +1,50 @@
+"""分片部署：同步确权 / 清库入口转交分片进程，结果与单进程编排器一致"""
+import asyncio
+import pytest
+from src.shadow_bookmaker.application.orchestrator import BrokerOrchestrator
+from src.shadow_bookmaker.application.sharding import ShardRouter, shard_of
+from src.shadow_bookmaker.domain.models import CustomerTicket, TicketLeg
+
+def ticket(ticket_id: str, market, match_ids, sel: str = "home", stake: float = 5000) -> CustomerTicket:
+    legs = [TicketLeg(match_id=m_id, selection=sel, customer_odds=round(getattr(market[m_id], f"{sel}_odds") * 0.97, 2)) for m_id in match_ids]
+    return CustomerTicket(ticket_id=ticket_id, ticket_type="single" if len(legs) == 1 else f"parlay_{len(legs)}", stake=stake, legs=legs)
+
+async def scenario(tmp_path):
+    ref = BrokerOrchestrator(db_path=str(tmp_path / "ref.db"))
+    router = ShardRouter(4, db_path=str(tmp_path / "shard.db"))
+    await ref.start(False)
+    await router.start(False)
+    try:
+        market = await ref.get_live_market()
+        ids = list(market)
+        a, b = ids[:2]
+        assert shard_of(a, 4) != shard_of(b, 4)  # 两场分在不同分片，串关要走两阶段
+        tickets = [ticket(f"S{i}", market, [m_id]) for i, m_id in enumerate([a, b, a, b])]
+        tickets.insert(2, ticket("P0", market, [a, b], stake=2000))
+        pairs = list(zip(await ref.evaluate_incoming_tickets(tickets), tickets))
+        assert all(d.action != "REJECT" for d, _ in pairs)
+
+        ref.commit_decisions(pairs)
+        # 同步入口要从事件循环以外的线程调；在事件循环线程里调会卡死自己，直接报错
+        with pytest.raises(RuntimeError): router.commit_decisions(pairs)
+        await asyncio.to_thread(router.commit_decisions, pairs)
+        want, got = (await ref.exposure_frame()).sort_index(), (await router.exposure_frame()).sort_index()
+        assert got.round(6).equals(want.round(6)) and len(got) == 2
+        # 跨分片串关两边都有一份，拼全书时去重
+        assert len((await router._gather_book()).parlays) == len(ref.ledger.parlays)
+
+        # 盯盘名单：路由刷新前从各分片汇总敞口场次，与单进程的同步读法一致
+        await router._fetch_and_swap()
+        assert sorted(router._exposed_matches()) == sorted(ref._exposed_matches()) == sorted([a, b])
+
+        await asyncio.to_thread(router.wipe_all_data)
+        await ref.awipe_all_data()
+        assert ref._exposed_matches() == [] and (await ref.exposure_frame()).empty
+        assert (await router.exposure_frame()).empty
+        assert router.db.get_order_book() == []
+    finally:
+        await router.aclose()
+        await ref.aclose()
+
+def test_sync_commit_and_wipe_route_to_shards(tmp_path):
+    asyncio.run(scenario(tmp_path))